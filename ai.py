@@ -0,0 +1,383 @@
+import time
+from functools import lru_cache
+from board import DIRECTIONS, winning_lines
+
+"""
+    Imports
+    -------
+    time
+    lru_cache
+    DIRECTIONS, winning_lines
+
+    Data
+    ----------
+    WIN_SCORE: int
+        score of a won position, increased by the number of empty tiles so faster wins are preferred
+    TIME_CHECK_INTERVAL: int
+        number of searched positions between two checks of the time budget
+"""
+
+WIN_SCORE = 1000000
+TIME_CHECK_INTERVAL = 64
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    """ raised inside the search when the time budget of the move is used up
+    """
+
+
+@lru_cache(maxsize=None)
+def symmetries(rows, cols):
+    """ lists the permutations of the tiles that map the board onto itself
+        a square board has 8 symmetries (rotations and reflections), other boards have 4
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :return: tuple of permutations, tile i of the transformed board is tile permutation[i] of the board
+    """
+
+    def build(transform):
+        return tuple(transform(i // cols, i % cols) for i in range(rows * cols))
+
+    last_row, last_col = rows - 1, cols - 1
+    permutations = [
+        build(lambda r, c: r * cols + c),
+        build(lambda r, c: (last_row - r) * cols + (last_col - c)),
+        build(lambda r, c: (last_row - r) * cols + c),
+        build(lambda r, c: r * cols + (last_col - c)),
+    ]
+    if rows == cols:
+        permutations += [
+            build(lambda r, c: c * cols + r),
+            build(lambda r, c: (last_col - c) * cols + (last_row - r)),
+            build(lambda r, c: (last_col - c) * cols + r),
+            build(lambda r, c: c * cols + (last_row - r)),
+        ]
+    return tuple(dict.fromkeys(permutations))
+
+
+@lru_cache(maxsize=None)
+def rays(rows, cols, win_length):
+    """ lists, for every tile and direction, the tiles on both sides of it which can complete a line with it
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: tuple with a tuple of (forward tiles, backward tiles) pairs for every tile
+    """
+
+    result = []
+    for tile_id in range(rows * cols):
+        row, col = divmod(tile_id, cols)
+        pairs = []
+        for d_row, d_col in DIRECTIONS:
+            sides = []
+            for sign in (1, -1):
+                side = []
+                r, c = row + sign * d_row, col + sign * d_col
+                while 0 <= r < rows and 0 <= c < cols and len(side) < win_length - 1:
+                    side.append(r * cols + c)
+                    r, c = r + sign * d_row, c + sign * d_col
+                sides.append(tuple(side))
+            pairs.append(tuple(sides))
+        result.append(tuple(pairs))
+    return tuple(result)
+
+
+class AIEngine:
+    """
+    A class used to choose moves for a computer player
+
+    The engine searches with negamax and alpha-beta pruning, deepening the search
+    one ply at a time until it reaches max_depth or runs out of its time budget.
+    Positions are stored in a transposition table under one key for all symmetric
+    positions, with the markers replaced by '1' for the player to move and '2' for
+    the opponent, so the 3x3 game is solved almost instantly. On larger boards only
+    the tiles near the placed markers are searched and the positions at the depth
+    limit are scored by the open lines of both players. Positions found in the
+    opening book are not searched at all.
+
+    Attributes
+    ----------
+    max_depth: int
+        maximum number of plies searched, None to search until the end of the game
+    time_budget: float
+        number of seconds the engine may spend on one move
+    table_size: int
+        maximum number of positions kept in the transposition table
+    table: dict
+        transposition table, maps a canonical position to (depth, score, bound, canonical move)
+    book: OpeningBook
+        perfect-play book of the 3x3 game, None to always search
+
+    Methods:
+    ----------
+    best_move(board, marker)
+        chooses the move for the player using the marker
+    clear()
+        empties the transposition table
+    """
+
+    def __init__(self, max_depth=None, time_budget=1.0, table_size=1000000, book=None):
+        """ sets the engine with an empty transposition table
+
+        :param max_depth: maximum number of plies searched, default None (no limit)
+        :param time_budget: number of seconds the engine may spend on one move, default 1 second
+        :param table_size: maximum number of positions kept in the transposition table
+        :param book: OpeningBook consulted before searching, default None
+        """
+
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.table_size = table_size
+        self.book = book
+        self._table = {}
+        self._deadline = None
+        self._nodes = 0
+
+    def clear(self):
+        """ empties the transposition table
+        """
+
+        self._table.clear()
+
+    def best_move(self, board, marker):
+        """ chooses the move for the player using the marker
+            the result of the deepest finished search is used when the time budget runs out
+
+        :param board: Board or BitBoard with the current position
+        :param marker: marker of the player to move
+        :return: id of the chosen tile, None if there is no empty tile
+        """
+
+        if self.book is not None:
+            entry = self.book.lookup(board, marker)
+            if entry is not None and entry[0] is not None:
+                return entry[0]
+        rows, cols, win_length = board.get_dimensions()
+        state = board.get_state()
+        cells = ['0' if value == '#' else '1' if value == marker else '2' for value in state]
+        empty = cells.count('0')
+        if empty == 0:
+            return None
+        self._geometry = (rows, cols, win_length)
+        self._lines = winning_lines(rows, cols, win_length)
+        self._rays = rays(rows, cols, win_length)
+        self._symmetries = symmetries(rows, cols)
+        self._deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        self._nodes = 0
+        if len(self._table) > self.table_size:
+            self._table.clear()
+
+        max_depth = empty if self.max_depth is None else min(self.max_depth, empty)
+        best = self._ordered_moves(cells, None)[0]
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._search_root(cells, depth)
+            except SearchTimeout:
+                break
+            if move is not None:
+                best = move
+            if abs(score) >= WIN_SCORE:
+                break
+        return best
+
+    def _search_root(self, cells, depth):
+        """ searches all moves of the position to the depth
+
+        :param cells: position with '0' for empty tiles, '1' for the player to move and '2' for the opponent
+        :param depth: number of plies to search
+        :return: tuple (score, best move)
+        """
+
+        alpha, beta = -WIN_SCORE * 2, WIN_SCORE * 2
+        best_score, best_move = -WIN_SCORE * 2, None
+        empty = cells.count('0')
+        for move in self._ordered_moves(cells, self._table_move(cells)):
+            cells[move] = '1'
+            if self._wins_through(cells, move):
+                score = WIN_SCORE + empty - 1
+            elif empty == 1:
+                score = 0
+            else:
+                self._swap(cells)
+                score = -self._negamax(cells, depth - 1, -beta, -alpha, empty - 1)
+                self._swap(cells)
+            cells[move] = '0'
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+        key, permutation = self._canonical(cells)
+        self._table[key] = (depth, best_score, EXACT, permutation.index(best_move))
+        return best_score, best_move
+
+    def _negamax(self, cells, depth, alpha, beta, empty):
+        """ scores the position for the player to move, the previous move did not end the game
+
+        :param cells: position with '1' for the player to move and '2' for the opponent
+        :param depth: number of plies left to search
+        :param alpha: lower bound of the interesting scores
+        :param beta: upper bound of the interesting scores
+        :param empty: number of empty tiles
+        :return: score of the position
+        """
+
+        self._nodes += 1
+        if self._deadline is not None and self._nodes % TIME_CHECK_INTERVAL == 0:
+            if time.perf_counter() > self._deadline:
+                raise SearchTimeout()
+        if depth == 0:
+            return self._evaluate(cells)
+
+        key, permutation = self._canonical(cells)
+        entry = self._table.get(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, entry_score, bound, canonical_move = entry
+            if canonical_move is not None:
+                table_move = permutation[canonical_move]
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return entry_score
+                if bound == LOWER:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        original_alpha = alpha
+        best_score, best_move = -WIN_SCORE * 2, None
+        for move in self._ordered_moves(cells, table_move):
+            cells[move] = '1'
+            if self._wins_through(cells, move):
+                score = WIN_SCORE + empty - 1
+            elif empty == 1:
+                score = 0
+            else:
+                self._swap(cells)
+                score = -self._negamax(cells, depth - 1, -beta, -alpha, empty - 1)
+                self._swap(cells)
+            cells[move] = '0'
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self._table[key] = (depth, best_score, bound, permutation.index(best_move))
+        return best_score
+
+    def _canonical(self, cells):
+        """ finds the key shared by all symmetric positions
+
+        :param cells: position
+        :return: tuple (key, permutation), tile i of the keyed position is tile permutation[i] of the position
+        """
+
+        best_key, best_permutation = None, None
+        for permutation in self._symmetries:
+            key = ''.join([cells[i] for i in permutation])
+            if best_key is None or key < best_key:
+                best_key, best_permutation = key, permutation
+        return best_key, best_permutation
+
+    def _table_move(self, cells):
+        """ returns the best move stored for the position, None if there is none
+
+        :param cells: position
+        :return: tile id or None
+        """
+
+        key, permutation = self._canonical(cells)
+        entry = self._table.get(key)
+        if entry is None or entry[3] is None:
+            return None
+        return permutation[entry[3]]
+
+    def _swap(self, cells):
+        """ swaps the players of the position in place, so the opponent becomes the player to move
+
+        :param cells: position
+        """
+
+        for i, value in enumerate(cells):
+            if value != '0':
+                cells[i] = '2' if value == '1' else '1'
+
+    def _wins_through(self, cells, tile_id):
+        """ checks the lines through the tile for win_length markers in a row
+
+        :param cells: position
+        :param tile_id: the last placed tile
+        :return: True if the marker on the tile completes a line
+        """
+
+        value = cells[tile_id]
+        win_length = self._geometry[2]
+        for forward, backward in self._rays[tile_id]:
+            count = 1
+            for side in (forward, backward):
+                for i in side:
+                    if cells[i] != value:
+                        break
+                    count += 1
+            if count >= win_length:
+                return True
+        return False
+
+    def _ordered_moves(self, cells, first):
+        """ lists the moves worth searching, the move from the table first and then the ones closest to the center
+            on boards larger than 3x3 only the tiles next to the placed markers are listed
+
+        :param cells: position
+        :param first: move to search first or None
+        :return: list of tile ids
+        """
+
+        rows, cols, win_length = self._geometry
+        moves = [i for i, value in enumerate(cells) if value == '0']
+        if rows * cols > 9 and len(moves) < rows * cols:
+            near = set()
+            for i, value in enumerate(cells):
+                if value != '0':
+                    row, col = divmod(i, cols)
+                    for r in range(max(row - 2, 0), min(row + 3, rows)):
+                        for c in range(max(col - 2, 0), min(col + 3, cols)):
+                            near.add(r * cols + c)
+            moves = [i for i in moves if i in near] or moves
+        center_row, center_col = (rows - 1) / 2, (cols - 1) / 2
+        moves.sort(key=lambda i: abs(i // cols - center_row) + abs(i % cols - center_col))
+        if first is not None and first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def _evaluate(self, cells):
+        """ scores a position at the depth limit by the lines still open for each player
+
+        :param cells: position with '1' for the player to move and '2' for the opponent
+        :return: score of the position, smaller than any won position
+        """
+
+        score = 0
+        for line in self._lines:
+            mine = theirs = 0
+            for i in line:
+                if cells[i] == '1':
+                    mine += 1
+                elif cells[i] == '2':
+                    theirs += 1
+            if theirs == 0 and mine:
+                score += 4 ** mine
+            elif mine == 0 and theirs:
+                score -= 4 ** theirs
+        return max(-WIN_SCORE // 2, min(WIN_SCORE // 2, score))
@@ -0,0 +1,437 @@
+import asyncio
+import json
+import random
+import aiohttp
+from client import SERVER_URL, TIMEOUT, RETRIES, BACKOFF
+from rate_limit import PLAYER_HEADER
+
+"""
+    Imports
+    -------
+    asyncio
+    json
+    random
+    aiohttp
+    SERVER_URL, TIMEOUT, RETRIES, BACKOFF
+    PLAYER_HEADER
+
+    Data
+    ----------
+    POOL_SIZE: int
+        default number of connections kept open to the server
+    RETRY_STATUSES: tuple
+        statuses of the GET responses that are retried
+
+    The coroutines of AsyncGameClient mirror the functions of client.py and answer
+    in the same format. All clients made by with_room share one aiohttp session,
+    so thousands of games played in one event loop share one pool of keep-alive
+    connections, and independent requests can be awaited together with
+    asyncio.gather, e.g. get_turn_and_board.
+"""
+
+POOL_SIZE = 1000
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class AsyncGameClient:
+    """
+    A class used to talk to the game server from asyncio code
+
+    Like GameClient, it retries connection errors for every request and 429 and
+    server errors (502/503/504) only for GET requests, waiting at least as long as
+    Retry-After says, and names the connected player in X-Player-Id.
+
+    Attributes
+    ----------
+    base_url: str
+        address of the game server
+    room: str
+        id of the room, None for the default room
+    timeout: float
+        number of seconds to wait for the server
+    retries: int
+        number of retries of a failed request
+    backoff: float
+        backoff factor between the retries, in seconds
+    session: aiohttp.ClientSession
+        session keeping the pooled connections, created on the first request
+    player_id: int
+        id of the player connected by post_connect, None before
+
+    Methods:
+    ----------
+    with_room(room)
+        returns a client for another room sharing the same session
+    close()
+        closes the pooled connections
+    api_url(path)
+        builds the url of the api endpoint
+    post_data(d)
+        sends data to the server
+    post_connect(id, dimensions)
+        sends request to server that contains id
+    post_board(id, board)
+        sends player board to the server
+    post_marker(marker, id)
+        sends information about player marker to the server
+    post_tile(tile_id, id)
+        sends the number of the field occupied by the client
+    post_move(tile_id, id)
+        sends the move of the client, the server places the marker
+    get_board()
+        gets the current board from the server
+    get_second_player_marker()
+        gets the second player marker from the server
+    get_first_player_marker()
+        gets the first player marker from the server
+    get_current_player()
+        gets information about which player has the turn from the server
+    get_turn_and_board()
+        gets the player who has the turn and the board with concurrent requests
+    get_state()
+        gets the turn, the board, the markers and the result at once
+    wait_for_turn(id, timeout)
+        waits on the server until the player has a turn
+    stream_events(id, timeout)
+        yields the changes pushed by the server
+    """
+
+    def __init__(self, base_url=SERVER_URL, room=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF,
+                 pool_size=POOL_SIZE, session=None):
+        """ sets the client, the session is created on the first request inside the running event loop
+
+        :param base_url: address of the game server
+        :param room: id of the room, default None
+        :param timeout: number of seconds to wait for the server
+        :param retries: number of retries of a failed request
+        :param backoff: backoff factor between the retries, in seconds
+        :param pool_size: number of connections kept open
+        :param session: session to share instead of creating a new one
+        """
+
+        self.base_url = base_url.rstrip('/')
+        self.room = room
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = session
+        self.player_id = None
+        self._state_etag = None
+        self._state = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _session(self):
+        """ returns the session, creating it on the first call
+
+        :return: aiohttp.ClientSession
+        """
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self.session
+
+    def with_room(self, room):
+        """ returns a client for another room sharing the same session
+
+        :param room: id of the room
+        :return: AsyncGameClient
+        """
+
+        return AsyncGameClient(self.base_url, room, self.timeout, self.retries, self.backoff, self.pool_size,
+                               self._session())
+
+    async def close(self):
+        """ closes the pooled connections
+        """
+
+        if self.session is not None:
+            await self.session.close()
+
+    def api_url(self, path):
+        """ builds the url of the api endpoint, scoped to the room if it is set
+
+        :param path: path of the endpoint relative to the /api prefix
+        :return: url of the endpoint
+        """
+
+        if self.room is None:
+            return self.base_url + "/api/" + path
+        return self.base_url + "/api/rooms/" + str(self.room) + "/" + path
+
+    async def _request(self, method, path, timeout=None, **kwargs):
+        """ sends the request and decodes the json response, retrying it like GameClient does
+
+        :param method: 'GET' or 'POST'
+        :param path: path of the endpoint relative to the /api prefix
+        :param timeout: number of seconds to wait for the server, default the timeout of the client
+        :param kwargs: arguments passed to aiohttp
+        :return: tuple (status, headers, decoded json response or None for an empty response)
+        """
+
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout if timeout is None else timeout)
+        if method == 'GET' and self.player_id is not None:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{PLAYER_HEADER: str(self.player_id)})
+        attempt = 0
+        while True:
+            delay = 0.0
+            try:
+                async with self._session().request(method, self.api_url(path), timeout=client_timeout,
+                                                   **kwargs) as response:
+                    body = await response.read()
+                    if method != 'GET' or response.status not in RETRY_STATUSES or attempt >= self.retries:
+                        return response.status, response.headers, json.loads(body) if body else None
+                    delay = _retry_after(response.headers.get('Retry-After'))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                retry = isinstance(error, aiohttp.ClientConnectorError) or method == 'GET'
+                if not retry or attempt >= self.retries:
+                    raise
+            attempt += 1
+            await asyncio.sleep(max(delay, self.backoff * 2 ** (attempt - 1)))
+
+    async def _get(self, path, **kwargs):
+        """ sends a GET request to the api endpoint
+
+        :param path: path of the endpoint relative to the /api prefix
+        :param kwargs: arguments passed to aiohttp
+        :return: decoded json response
+        """
+
+        return (await self._request('GET', path, **kwargs))[2]
+
+    async def post_data(self, d):
+        """ sends data to the server
+
+        :param d: data to be transmitted
+        :return: response received from server
+        """
+
+        return (await self._request('POST', "setdata", data=json.dumps(d),
+                                    headers={'content-type': 'application/json'}))[2]
+
+    async def post_connect(self, id, dimensions=None):
+        """ sends request to server that contains id
+
+        :param id: client id number
+        :param dimensions: (rows, cols, win_length) of the board, used by the server when it creates the game
+        :return: response received from server, with the dimensions of the board of the game
+        """
+
+        data = {
+            'i_am_here': True,
+            'id': id,
+        }
+        if dimensions is not None:
+            data['dimensions'] = list(dimensions)
+        self.player_id = id
+        return await self.post_data(data)
+
+    connect = post_connect
+
+    async def post_board(self, id, board):
+        """ sends player board to the server
+
+        :param id: id number of the client sending the information to the server
+        :param board: current game board
+        :return: response received from server
+        """
+
+        return await self.post_data({'current_board': board, 'id': id})
+
+    async def post_marker(self, marker, id):
+        """ sends information about player marker to the server
+
+        :param marker: player marker 'x' or 'o'
+        :param id: id number of the client sending the information to the server
+        :return: response received from server
+        """
+
+        return await self.post_data({'marker': marker, 'id': id})
+
+    async def post_tile(self, tile_id, id):
+        """ sends to the server the number of the field occupied by the client on the board
+
+        :param tile_id: field number on the board
+        :param id: id number of the client sending the information to the server
+        :return: response received from server
+        """
+
+        return await self.post_data({'tile_id': tile_id, 'id': id})
+
+    async def post_move(self, tile_id, id):
+        """ sends the move of the client, the server checks it and places the marker of the player on its board
+
+        :param tile_id: field number on the board
+        :param id: id number of the client making the move
+        :return: response received from server with 'ok', 'prompt', 'board', 'current_player' and 'result'
+        """
+
+        return await self.post_data({'move': tile_id, 'id': id})
+
+    async def get_board(self):
+        """ gets the current board from the server
+
+        :return: board with the current state of the game
+        """
+
+        return await self._get("getdata/board")
+
+    async def get_second_player_marker(self):
+        """ gets the second player marker based on the first player's selection from the server
+
+        :return: second player marker 'x' or 'o'
+        """
+
+        return await self._get("getdata/ndplayer_mark")
+
+    async def get_first_player_marker(self):
+        """ gets the first player marker from the server
+
+        :return: first player marker 'x' or 'o'
+        """
+
+        return await self._get("getdata/stplayer_mark")
+
+    async def get_current_player(self):
+        """ gets information about which player has the turn from the server
+
+        :return: id of the player who has a turn, None while nobody has it
+        """
+
+        return await self._get("getdata/current_player")
+
+    async def get_turn_and_board(self):
+        """ gets the player who has the turn and the board with two requests sent at the same time
+
+        :return: tuple (player who has a turn, board)
+        """
+
+        return tuple(await asyncio.gather(self.get_current_player(), self.get_board()))
+
+    async def get_state(self):
+        """ gets the turn, the board, the markers and the result of the room at once
+            the server is asked with the tag of the last received state, so an unchanged state is not sent again
+
+        :return: dictionary with the state of the room and its 'version'
+        """
+
+        headers = {'If-None-Match': self._state_etag} if self._state_etag is not None else {}
+        status, response_headers, state = await self._request('GET', "getdata/state", headers=headers)
+        if status != 304:
+            self._state = state
+            self._state_etag = response_headers.get('ETag')
+        return self._state
+
+    async def wait_for_turn(self, id, timeout=25):
+        """ waits on the server until the player has a turn or the timeout expires
+
+        :param id: id number of the waiting client
+        :param timeout: maximum number of seconds the server holds the request
+        :return: id of the player who has a turn, None while nobody has it
+        """
+
+        return await self._get("getdata/wait_turn", params={'id': id, 'timeout': timeout},
+                               timeout=timeout + self.timeout)
+
+    async def stream_events(self, id, timeout=30):
+        """ opens the Server-Sent Events stream of the room and yields the pushed changes
+
+        :param id: id number of the listening client
+        :param timeout: maximum number of seconds without any data, keep-alive comments included
+        :return: asynchronous generator of (event, data) tuples
+        """
+
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_read=timeout)
+        async with self._session().get(self.api_url("events"), params={'id': id}, timeout=client_timeout,
+                                       headers={'accept': 'text/event-stream'}) as response:
+            response.raise_for_status()
+            event, data = 'message', []
+            async for line in response.content:
+                line = line.decode().rstrip('\r\n')
+                if not line:
+                    if data:
+                        yield event, json.loads('\n'.join(data))
+                    event, data = 'message', []
+                elif line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].strip())
+
+
+def _retry_after(value):
+    """ reads the number of seconds of the Retry-After header, a date is not sent by the game server
+
+    :param value: value of the header or None
+    :return: number of seconds, 0.0 if there is none
+    """
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+async def play_random_game(game_client, player_id, dimensions=(3, 3, 3), rng=None):
+    """ joins the room of the client and plays random empty tiles with the move protocol until the game is over
+
+    :param game_client: AsyncGameClient bound to the room of the game
+    :param player_id: id of the player
+    :param dimensions: (rows, cols, win_length) of the board
+    :param rng: random.Random choosing the tiles, default a new one
+    :return: result of the game, {'winner': id or None}
+    """
+
+    rng = rng if rng is not None else random.Random()
+    if (await game_client.post_connect(player_id, dimensions))['number'] == 1:
+        await game_client.post_marker('x', player_id)
+    while True:
+        state = await game_client.get_state()
+        if state['result'] is not None:
+            return state['result']
+        if state['current_player'] != player_id:
+            await game_client.wait_for_turn(player_id)
+            continue
+        await game_client.post_move(rng.choice([i for i, value in enumerate(state['board']) if value == '#']),
+                                    player_id)
+
+
+async def play_many(base_url, games, dimensions=(3, 3, 3), seed=0):
+    """ plays the games at the same time, two random players per game, all in one event loop
+
+    :param base_url: address of the game server
+    :param games: number of games
+    :param dimensions: (rows, cols, win_length) of the board
+    :param seed: seed of the random tiles
+    :return: list of the results of the games
+    """
+
+    async with AsyncGameClient(base_url) as shared:
+        prefix = "%08x" % random.getrandbits(32)
+        players = [play_random_game(shared.with_room("async-%s-%d" % (prefix, game)), player_id, dimensions,
+                                    random.Random(seed * 1000003 + game * 2 + player_id))
+                   for game in range(games) for player_id in (1, 2)]
+        return (await asyncio.gather(*players))[::2]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Plays many random games at the same time from one event loop")
+    parser.add_argument("--url", default=SERVER_URL, help="address of the game server")
+    parser.add_argument("--games", type=int, default=1000, help="number of games played at the same time")
+    parser.add_argument("--rows", type=int, default=3, help="number of rows of the board")
+    parser.add_argument("--cols", type=int, default=3, help="number of columns of the board")
+    parser.add_argument("--win-length", type=int, default=3, help="number of markers in a row needed to win")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random tiles")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    results = asyncio.run(play_many(args.url, args.games, (args.rows, args.cols, args.win_length), args.seed))
+    elapsed = time.perf_counter() - start
+    draws = sum(result['winner'] is None for result in results)
+    print("%d games in %.2f s, %.1f games/s, %d draws" % (len(results), elapsed, len(results) / elapsed, draws))
@@ -0,0 +1,711 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from aiohttp import web
+from game_room import GameRegistry, DEFAULT_ROOM, SPECTATOR_BACKLOG, CLOSED_EVENT, check_dimensions
+from game_store import SQLiteStore
+from matchmaking import Matchmaker
+from metrics import Metrics, CONTENT_TYPE
+from rate_limit import (RateLimiter, AdmissionControl, RATE, BURST, ADDRESS_SHARE, PLAYER_HEADER, RETRY_AFTER,
+                        is_polling, player_of, caller, retry_after)
+import wire
+
+"""
+    Imports
+    ----------
+    asyncio
+    json
+    os
+    signal
+    time
+    web
+    GameRegistry, DEFAULT_ROOM, SPECTATOR_BACKLOG, CLOSED_EVENT, check_dimensions
+    SQLiteStore
+    Matchmaker
+    Metrics, CONTENT_TYPE
+    RateLimiter, AdmissionControl, RATE, BURST, ADDRESS_SHARE, PLAYER_HEADER, RETRY_AFTER, is_polling, player_of,
+    caller, retry_after
+    wire
+
+    Data
+    ----------
+    ROOM_IDLE_TIMEOUT: float
+        number of seconds after which an unused room is evicted
+    MAX_ROOMS: int
+        maximum number of rooms hosted at the same time
+    FINISHED_ROOM_TIMEOUT: float
+        number of seconds a room with a finished game is kept
+    LONG_POLL_TIMEOUT: float
+        maximum number of seconds a long-poll request is held by the server
+    STREAM_KEEPALIVE: float
+        number of seconds after which an idle event stream gets a keep-alive comment
+    MAX_IN_FLIGHT: int
+        number of requests handled at the same time, long-polls and streams included, before polling is shed
+
+    The asyncio implementation of the routes of server.py, answering in the same
+    format, so client.py works with both servers, and like there only setdata
+    creates a room, the read routes answer 404 for a room that does not exist. All
+    requests are served by one event loop: a waiting long-poll request or an open
+    event stream costs a pending future instead of a worker thread. To use more
+    cores, --workers starts several processes listening on the same port, sharing
+    the rooms through the SQLite database given by --store. The calls of the store
+    run in worker threads, so a transaction waiting for another process never
+    stalls the event loop. The matchmaking queues are kept by one process, so with
+    --workers /api/match answers 501. The polling routes are limited per player
+    and shed while the server is full like in server.py.
+"""
+
+ROOM_IDLE_TIMEOUT = 600.0
+MAX_ROOMS = 100000
+FINISHED_ROOM_TIMEOUT = 60.0
+LONG_POLL_TIMEOUT = 30.0
+STREAM_KEEPALIVE = 15.0
+MAX_IN_FLIGHT = 10000
+
+routes = web.RouteTableDef()
+
+
+def room_route(method, rule):
+    """ registers the handler under the room-scoped rule and under the default room rule
+
+    :param method: http method
+    :param rule: rule relative to the /api prefix
+    :return: decorator registering the handler
+    """
+
+    def decorator(handler):
+        routes.route(method, "/api/rooms/{room_id}" + rule)(handler)
+        routes.route(method, "/api" + rule)(handler)
+        return handler
+    return decorator
+
+
+async def blocking(request, function, *args):
+    """ calls a method of the registry or the matchmaker, in a worker thread when the rooms are kept in a store,
+        whose transactions wait for the other processes and would stall the event loop
+
+    :param request: aiohttp request
+    :param function: callable to call
+    :param args: arguments of the callable
+    :return: value returned by the callable
+    """
+
+    if request.app['rooms'].store is None:
+        return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def get_room(request):
+    """ returns the existing room named by the request, the default room if it names none,
+        the request is answered 404 if there is no such game
+
+    :param request: aiohttp request
+    :return: GameRoom
+    :raises web.HTTPNotFound: if the room does not exist
+    """
+
+    room = await blocking(request, request.app['rooms'].find, request.match_info.get('room_id', DEFAULT_ROOM))
+    if room is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "There is no such game."}), content_type='application/json')
+    return room
+
+
+def json_response(data, status=200):
+    """ builds a response with the data serialized like flask.json.dumps does
+
+    :param data: json serializable data
+    :param status: http status
+    :return: aiohttp response
+    """
+
+    return web.Response(text=json.dumps(data), status=status, content_type='application/json')
+
+
+async def wait_for_change(room, predicate, timeout):
+    """ waits until the predicate is true or the timeout expires without blocking the event loop
+
+    :param room: GameRoom or Matchmaker to watch
+    :param predicate: callable checked after every change of the room
+    :param timeout: maximum number of seconds to wait
+    :return: value of the predicate
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        changed = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: changed.done() or changed.set_result(None))
+
+        room.listeners.add(wake)
+        try:
+            await asyncio.wait_for(changed, remaining)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            room.listeners.discard(wake)
+    return True
+
+
+class Broadcast:
+    """
+    A class used to wake all spectators of a room at once
+
+    The room calls one listener per broadcast, whatever the number of spectators,
+    and all of them wait for the same future.
+
+    Attributes
+    ----------
+    room: GameRoom
+        the watched room
+    spectators: int
+        number of streams watching the room
+
+    Methods:
+    ----------
+    changed()
+        returns the future resolved by the next change of the room
+    """
+
+    def __init__(self, room):
+        """ sets the broadcast and registers its listener in the room
+
+        :param room: GameRoom to watch
+        """
+
+        self.room = room
+        self.spectators = 0
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+        room.listeners.add(self._wake)
+
+    def _wake(self):
+        """ resolves the future from the thread that changed the room
+        """
+
+        self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        """ resolves the future of the current waiters, the next ones wait for a new future
+        """
+
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def changed(self):
+        """ returns the future resolved by the next change of the room
+
+        :return: asyncio.Future
+        """
+
+        if self._future.done():
+            self._future = self._loop.create_future()
+        return self._future
+
+    def close(self):
+        """ unregisters the listener
+        """
+
+        self.room.listeners.discard(self._wake)
+
+
+@web.middleware
+async def record_request(request, handler):
+    """ records the route, the status and the latency of every request
+
+    :param request: aiohttp request
+    :param handler: handler of the request
+    :return: response of the handler
+    """
+
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as error:
+        status = error.status
+        raise
+    finally:
+        route = request.match_info.route.resource
+        route = route.canonical if route is not None else "unmatched"
+        request.app['metrics'].observe_request(route, request.method, status, time.perf_counter() - started)
+
+
+@web.middleware
+async def throttle(request, handler):
+    """ answers a polling request over the limit of its player with 429 and sheds it with 503 while
+        the server is full, in both cases before any work is done and with Retry-After
+        every request is counted for the whole time of its handler, an awaiting long-poll or stream included
+
+    :param request: aiohttp request
+    :param handler: handler of the request
+    :return: response of the handler or error response
+    """
+
+    resource = request.match_info.route.resource
+    polling = resource is not None and is_polling(request.method, resource.canonical)
+    limiter = request.app['limiter']
+    if polling and limiter is not None:
+        room_id = request.match_info.get('room_id', DEFAULT_ROOM)
+        player_id = player_of(request.headers.get(PLAYER_HEADER) or request.query.get('id'))
+        if not request.app['rooms'].seated(room_id, player_id):
+            player_id = None
+        delay = limiter.acquire(caller(request.remote, room_id, player_id))
+        if delay:
+            response = json_response({"error": "Too many requests."}, 429)
+            response.headers['Retry-After'] = retry_after(delay)
+            return response
+    admission = request.app['admission']
+    if admission is None:
+        return await handler(request)
+    if not admission.enter(polling):
+        response = json_response({"error": "The server is busy."}, 503)
+        response.headers['Retry-After'] = str(RETRY_AFTER)
+        return response
+    try:
+        return await handler(request)
+    finally:
+        admission.leave()
+
+
+@routes.get("/metrics")
+async def get_metrics(request):
+    """ sends the request counters, the latency histograms, the moves and the numbers of games and players
+
+    :return: metrics in the text exposition format
+    """
+
+    body = await blocking(request, request.app['metrics'].render, request.app['rooms'])
+    return web.Response(body=body.encode(), headers={'Content-Type': CONTENT_TYPE})
+
+
+@routes.get("/")
+async def homepage(request):
+    """ displays "Tic-tac-toe" on the server
+
+    :return:
+    """
+
+    return web.Response(text="<html><body>Tic-tac-toe</body></html>", content_type='text/html')
+
+
+@routes.post("/api/match")
+async def join_match(request):
+    """ pairs the player given by the id key with a waiting player or queues the player
+        the optional 'skill' and 'dimensions' keys choose the queue
+
+    :return: 'matched' status with the room id and the opponent or 'waiting' status
+    """
+
+    matchmaker = request.app['matchmaker']
+    if matchmaker is None:
+        return json_response({"error": "Matchmaking needs a single server process, its queues are not shared."}, 501)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or data.get('id') is None:
+        return json_response({"error": "The id of the player is missing."}, 400)
+    try:
+        status = await blocking(request, matchmaker.join, data['id'], data.get('skill'), data.get('dimensions'))
+    except ValueError as error:
+        return json_response({"error": str(error)}, 400)
+    return json_response(status, 201)
+
+
+@routes.get("/api/match")
+async def wait_match(request):
+    """ holds the request until the player given by the id argument is matched or the timeout expires
+        the timeout argument is given in seconds and is limited by LONG_POLL_TIMEOUT
+
+    :return: status of the player
+    """
+
+    matchmaker = request.app['matchmaker']
+    if matchmaker is None:
+        return json_response({"error": "Matchmaking needs a single server process, its queues are not shared."}, 501)
+    try:
+        player_id = int(request.query.get('id'))
+    except (TypeError, ValueError):
+        player_id = None
+    try:
+        timeout = min(float(request.query.get('timeout', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+    except ValueError:
+        timeout = LONG_POLL_TIMEOUT
+    await wait_for_change(matchmaker, lambda: matchmaker.status(player_id)['status'] != 'waiting', max(timeout, 0.0))
+    return json_response(matchmaker.status(player_id))
+
+
+@routes.delete("/api/match")
+async def leave_match(request):
+    """ removes the player given by the id argument from the queue
+
+    :return: empty dict
+    """
+
+    if request.app['matchmaker'] is None:
+        return json_response({"error": "Matchmaking needs a single server process, its queues are not shared."}, 501)
+    try:
+        request.app['matchmaker'].leave(int(request.query.get('id')))
+    except (TypeError, ValueError):
+        pass
+    return json_response({})
+
+
+@room_route('GET', "/getdata/tile_id")
+async def get_tiles(request):
+    """ gets the id of the tile selected by the client
+
+    :return: id of the tile that was last selected by the player
+    """
+
+    return json_response((await get_room(request)).current_tile)
+
+
+@room_route('GET', "/getdata/board")
+async def get_board(request):
+    """ sends the board to the client
+
+    :return: board
+    """
+
+    return json_response((await get_room(request)).board)
+
+
+@room_route('GET', "/getdata/ndplayer_mark")
+async def get_second_player_marker(request):
+    """ sends the second player marker to the client
+
+    :return: marker of second player 'x' or 'o', empty dict if the first player has not chosen yet
+    """
+
+    marker = (await get_room(request)).second_player_marker()
+    return json_response({} if marker is None else marker)
+
+
+@room_route('GET', "/getdata/stplayer_mark")
+async def get_first_player_marker(request):
+    """ sends the first player marker to the client
+
+    :return: marker of first player 'x' or 'o'
+    """
+
+    return json_response((await get_room(request)).first_player_marker())
+
+
+@room_route('GET', "/getdata/current_player")
+async def get_current_player(request):
+    """ sends information about the id of the player who has a turn
+
+    :return: current player id, null while nobody has a turn
+    """
+
+    return json_response((await get_room(request)).current_player)
+
+
+@room_route('GET', "/getdata/wait_turn")
+async def wait_turn(request):
+    """ holds the request until the player given by the id argument has a turn or the timeout expires
+        the timeout argument is given in seconds and is limited by LONG_POLL_TIMEOUT
+
+    :return: current player id, null while nobody has a turn
+    """
+
+    try:
+        player_id = int(request.query.get('id'))
+    except (TypeError, ValueError):
+        player_id = None
+    try:
+        timeout = min(float(request.query.get('timeout', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+    except ValueError:
+        timeout = LONG_POLL_TIMEOUT
+    room = await get_room(request)
+    await wait_for_change(room, lambda: room.current_player == player_id, max(timeout, 0.0))
+    room.touch()
+    return json_response(room.current_player)
+
+
+@room_route('GET', "/getdata/state")
+async def get_state(request):
+    """ sends the turn, the board, the markers and the result of the room at once, tagged with the room version
+        a client sending the tag in If-None-Match gets an empty 304 response while nothing has changed
+
+    :return: state of the room or empty response
+    """
+
+    room = await get_room(request)
+    etag, body = room.state()
+    data = room.wire_state()[1] if wire.accepts(request.headers.get('Accept')) else None
+    if any(tag.value == etag for tag in request.if_none_match or ()):
+        response = web.Response(status=304)
+    elif data is not None:
+        response = web.Response(body=data, content_type=wire.CONTENT_TYPE)
+    else:
+        response = web.Response(text=body, content_type='application/json')
+    response.etag = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+@room_route('GET', "/events")
+async def events(request):
+    """ keeps the connection open and pushes every change of the room as a Server-Sent Event
+        the stream starts with a 'state' event, a client resuming with Last-Event-ID gets only the missed events,
+        it ends with a 'closed' event once the room is cleared or evicted
+
+    :return: event stream response
+    """
+
+    room = await get_room(request)
+    try:
+        version = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        version = -1
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                           'X-Accel-Buffering': 'no'})
+    await response.prepare(request)
+    try:
+        while True:
+            known = version
+            await wait_for_change(room, lambda: room.version != known or room.closed, STREAM_KEEPALIVE)
+            version, frames = room.frames(version)
+            if not frames and not await blocking(request, request.app['rooms'].holds, room):
+                frames = [CLOSED_EVENT]
+            room.touch()
+            await response.write(b"".join(frames) if frames else b": keep-alive\n\n")
+            if frames[-1:] == [CLOSED_EVENT]:
+                return response
+    except ConnectionResetError:
+        return response
+
+
+@room_route('GET', "/watch")
+async def watch(request):
+    """ streams the changes of the game to a read-only spectator as Server-Sent Events until the game is over
+        or the room is cleared or evicted, then the stream ends with a 'closed' event
+        the events are serialized once for all streams and all spectators of the room wait for the same future,
+        a spectator lagging more than SPECTATOR_BACKLOG changes gets only the latest snapshot,
+        so a slow spectator never holds up the players
+
+    :return: event stream response or error if the room is not found
+    """
+
+    room = await get_room(request)
+    try:
+        version = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        version = -1
+    broadcasts = request.app['broadcasts']
+    broadcast = broadcasts.get(room.room_id)
+    if broadcast is None or broadcast.room is not room:
+        broadcast = broadcasts[room.room_id] = Broadcast(room)
+    broadcast.spectators += 1
+    try:
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                               'X-Accel-Buffering': 'no'})
+        await response.prepare(request)
+        while True:
+            changed = broadcast.changed()
+            version, frames = room.frames(version, 0, SPECTATOR_BACKLOG)
+            if frames:
+                await response.write(b"".join(frames))
+                if frames[-1] == CLOSED_EVENT or room.result is not None and room.version == version:
+                    return response
+                continue
+            try:
+                await asyncio.wait_for(asyncio.shield(changed), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if not await blocking(request, request.app['rooms'].holds, room):
+                    await response.write(CLOSED_EVENT)
+                    return response
+                await response.write(b": keep-alive\n\n")
+    except ConnectionResetError:
+        return response
+    finally:
+        broadcast.spectators -= 1
+        if broadcast.spectators == 0:
+            broadcast.close()
+            if broadcasts.get(room.room_id) is broadcast:
+                del broadcasts[room.room_id]
+
+
+@room_route('POST', "/setdata")
+async def setdata(request):
+    """ receives data from the customer
+        recognizes and sets data according to the key
+        a move may be sent and answered in the compact encoding of the wire module, announced in Accept-Post
+
+    :return: response, number that indicates that request has succeeded and a new resource has been created as a result
+    """
+
+    if request.content_type == wire.CONTENT_TYPE:
+        try:
+            data = wire.decode_move(await request.read())
+        except ValueError:
+            return json_response({"error": "The move cannot be decoded."}, 400)
+    else:
+        try:
+            data = await request.json()
+        except ValueError:
+            return json_response({"error": "The body is not valid JSON."}, 400)
+    if data is not None and not isinstance(data, dict):
+        return json_response({"error": "The body must be a JSON object."}, 400)
+    if data is not None and 'reserve' in data:
+        return json_response({"error": "Only the matchmaking reserves rooms."}, 400)
+    if data is not None and 'i_am_here' in data and data.get('dimensions') is not None:
+        try:
+            check_dimensions(data['dimensions'])
+        except ValueError as error:
+            return json_response({"error": str(error)}, 400)
+    response = None
+    body = None
+    if data is not None:
+        room, response = await blocking(request, request.app['rooms'].apply,
+                                        request.match_info.get('room_id', DEFAULT_ROOM), data)
+        if 'tile_id' in data or 'move' in data and response['ok']:
+            request.app['metrics'].count_move()
+        if room.result is not None:
+            request.app['rooms'].finish(room.room_id)
+        if 'move' in data and wire.accepts(request.headers.get('Accept')):
+            try:
+                body = wire.encode_move_response(response, room.snapshot())
+            except ValueError:
+                pass
+    if body is not None:
+        response = web.Response(body=body, status=201, content_type=wire.CONTENT_TYPE)
+    else:
+        response = json_response(response, 201)
+    response.headers['Accept-Post'] = "application/json, " + wire.CONTENT_TYPE
+    return response
+
+
+@room_route('POST', "/clear")
+async def reset_server(request):
+    """ resets the room to default values by removing it from the registry
+
+    :return: empty dict
+    """
+
+    await blocking(request, request.app['rooms'].remove, request.match_info.get('room_id', DEFAULT_ROOM))
+    return json_response({}, 201)
+
+
+def create_app(rooms=None, limiter=None, admission=None):
+    """ creates the aiohttp application
+        app['limiter'] or app['admission'] may be set to None to switch the limit or the shedding off,
+        app['matchmaker'] to None to answer /api/match with 501
+
+    :param rooms: GameRegistry to serve, default a new one
+    :param limiter: RateLimiter of the polling requests, default a new one
+    :param admission: AdmissionControl of the server, default a new one
+    :return: web.Application
+    """
+
+    app = web.Application(middlewares=[record_request, throttle])
+    app['rooms'] = rooms if rooms is not None else GameRegistry(ROOM_IDLE_TIMEOUT, MAX_ROOMS, FINISHED_ROOM_TIMEOUT)
+    app['matchmaker'] = Matchmaker(app['rooms'])
+    app['broadcasts'] = {}
+    app['limiter'] = limiter if limiter is not None else RateLimiter()
+    app['admission'] = admission if admission is not None else AdmissionControl(MAX_IN_FLIGHT)
+    app['metrics'] = Metrics()
+    app.add_routes(routes)
+    return app
+
+
+def start_workers(count):
+    """ forks the worker processes, the parent waits for them and stops them when it is stopped
+
+    :param count: number of workers
+    :return: True in a worker, False in the parent after all workers have exited
+    """
+
+    children = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            return True
+        children.append(pid)
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for child in children:
+        os.waitpid(child, 0)
+    return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tic-tac-toe asyncio server")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="port to listen on")
+    parser.add_argument("--backlog", type=int, default=4096, help="length of the queue of pending connections")
+    parser.add_argument("--log", default=None, help="move log restoring the games after a restart")
+    parser.add_argument("--archive", default=None, help="archive the finished games are recorded in")
+    parser.add_argument("--store", default=None, help="SQLite database sharing the rooms with other workers")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes, more than one needs --store")
+    parser.add_argument("--rate", type=float, default=RATE,
+                        help="polling requests a second allowed to a player in one worker, 0 switches the limit off")
+    parser.add_argument("--burst", type=float, default=BURST,
+                        help="polling requests a player may send at once after being idle")
+    parser.add_argument("--address-share", type=float, default=ADDRESS_SHARE,
+                        help="times the limit of all players of one address is larger than the limit of a player")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="requests handled at the same time before polling is shed, 0 switches it off")
+    args = parser.parse_args()
+    if args.workers > 1 and not args.store:
+        parser.error("every worker would host its own games, --workers needs --store")
+    if args.store and args.log:
+        parser.error("--log restores the rooms of one process, a shared --store keeps them already")
+    if args.workers > 1 and args.archive:
+        parser.error("the archive has a single writer, --archive cannot be used with --workers")
+    if args.workers > 1 and not start_workers(args.workers):
+        raise SystemExit(0)
+    app = create_app()
+    if args.workers > 1:
+        app['matchmaker'] = None
+    app['limiter'] = RateLimiter(args.rate, args.burst, args.address_share) if args.rate > 0 else None
+    app['admission'] = AdmissionControl(args.max_in_flight) if args.max_in_flight > 0 else None
+    if args.store:
+        app['rooms'].attach_store(SQLiteStore(args.store))
+
+        async def close_store(app):
+            app['rooms'].detach_store()
+
+        app.on_cleanup.append(close_store)
+    if args.archive:
+        from game_archive import GameArchive
+
+        archive = app['rooms'].archive = GameArchive(args.archive)
+
+        async def close_archive(app):
+            archive.close()
+
+        app.on_cleanup.append(close_archive)
+    if args.log:
+        from move_log import MoveLog
+
+        journal = MoveLog(args.log)
+        app['rooms'].attach(journal)
+
+        async def close_journal(app):
+            journal.close()
+
+        app.on_cleanup.append(close_journal)
+    web.run_app(app, host=args.host, port=args.port, backlog=args.backlog, reuse_port=args.workers > 1)
@@ -0,0 +1,166 @@
+import numpy as np
+from functools import lru_cache
+from board import DIRECTIONS, winning_lines
+
+"""
+    Imports
+    -------
+    numpy
+    lru_cache
+    DIRECTIONS, winning_lines
+
+    Data
+    ----------
+    ONGOING, FIRST_WINS, SECOND_WINS, DRAW: int
+        status of an evaluated board
+    CHUNK_SIZE: int
+        number of boards evaluated at once, bounds the temporary arrays
+
+    Boards are rows of an integer array with a column per tile: 0 for an empty tile,
+    1 for the marker of the first player and 2 for the marker of the second player.
+"""
+
+ONGOING, FIRST_WINS, SECOND_WINS, DRAW = 0, 1, 2, 3
+CHUNK_SIZE = 1 << 13
+
+
+@lru_cache(maxsize=None)
+def line_indexes(rows=3, cols=3, win_length=3):
+    """ returns the winning lines of the board as an index array
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: array of shape (number of lines, win_length)
+    """
+
+    return np.array(winning_lines(rows, cols, win_length), dtype=np.intp)
+
+
+def _evaluate_lines(boards, lines):
+    """ evaluates the boards by checking all winning lines at once
+
+    :param boards: array of shape (N, tiles)
+    :param lines: array of shape (number of lines, win_length)
+    :return: array of N statuses
+    """
+
+    status = np.full(len(boards), ONGOING, dtype=np.int8)
+    for start in range(0, len(boards), CHUNK_SIZE):
+        chunk = boards[start:start + CHUNK_SIZE]
+        cells = chunk[:, lines]
+        first = (cells == 1).all(axis=2).any(axis=1)
+        second = (cells == 2).all(axis=2).any(axis=1)
+        full = (chunk != 0).all(axis=1)
+        status[start:start + CHUNK_SIZE] = np.select([first, second, full], [FIRST_WINS, SECOND_WINS, DRAW], ONGOING)
+    return status
+
+
+def _has_line(tiles, win_length):
+    """ checks the boards for win_length set tiles in a row
+        every row of tiles is packed into the bits of one integer, so a run along a row is found by
+        ANDing the row with itself shifted, and runs along the columns and diagonals by ANDing
+        the following rows shifted by 0, 1 or -1 bits per row
+
+    :param tiles: boolean array of shape (N, rows, cols), cols < 64
+    :param win_length: number of tiles in a row needed
+    :return: boolean array of N results
+    """
+
+    rows, cols = tiles.shape[1:]
+    packed = tiles @ (np.uint64(1) << np.arange(cols, dtype=np.uint64))
+    found = np.zeros(len(tiles), dtype=bool)
+    if cols >= win_length:
+        run = packed.copy()
+        for i in range(1, win_length):
+            run &= packed >> np.uint64(i)
+        found |= run.any(axis=1)
+    height = rows - win_length + 1
+    if height > 0:
+        for step in (0, 1, -1):
+            run = packed[:, :height].copy()
+            for i in range(1, win_length):
+                following = packed[:, i:i + height]
+                run &= following >> np.uint64(i) if step == 1 else following << np.uint64(i) if step == -1 else following
+            found |= run.any(axis=1)
+    return found
+
+
+def _evaluate_shifts(boards, rows, cols, win_length):
+    """ evaluates the boards by finding runs of markers in the packed rows
+
+    :param boards: array of shape (N, rows * cols)
+    :param rows: number of rows of the boards
+    :param cols: number of columns of the boards
+    :param win_length: number of markers in a row needed to win
+    :return: array of N statuses
+    """
+
+    status = np.full(len(boards), ONGOING, dtype=np.int8)
+    for start in range(0, len(boards), CHUNK_SIZE):
+        chunk = boards[start:start + CHUNK_SIZE]
+        grid = chunk.reshape(len(chunk), rows, cols)
+        first = _has_line(grid == 1, win_length)
+        second = _has_line(grid == 2, win_length)
+        full = (chunk != 0).all(axis=1)
+        status[start:start + CHUNK_SIZE] = np.select([first, second, full], [FIRST_WINS, SECOND_WINS, DRAW], ONGOING)
+    return status
+
+
+@lru_cache(maxsize=None)
+def _status_table():
+    """ evaluates every 3x3 board once, indexed by the base-3 number of the board
+
+    :return: array of 3 ** 9 statuses
+    """
+
+    numbers = np.arange(3 ** 9)
+    boards = (numbers[:, None] // 3 ** np.arange(9)) % 3
+    table = _evaluate_lines(boards.astype(np.int8), line_indexes(3, 3, 3))
+    table.flags.writeable = False
+    return table
+
+
+def evaluate_batch(boards, rows=3, cols=3, win_length=3):
+    """ evaluates many boards in one vectorized pass
+        a 3x3 board is turned into its base-3 number and looked up in a table of all boards,
+        on larger boards every row is packed into an integer and runs are found with bit shifts
+
+    :param boards: array-like of shape (N, rows * cols) with 0, 1 and 2
+    :param rows: number of rows of the boards
+    :param cols: number of columns of the boards
+    :param win_length: number of markers in a row needed to win
+    :return: array of N statuses: ONGOING, FIRST_WINS, SECOND_WINS or DRAW
+    """
+
+    boards = np.asarray(boards, dtype=np.int8)
+    if boards.ndim != 2 or boards.shape[1] != rows * cols:
+        raise ValueError("Expected an array of shape (N, " + str(rows * cols) + ")")
+    if (rows, cols, win_length) == (3, 3, 3):
+        return _status_table()[boards @ 3 ** np.arange(9, dtype=np.int32)]
+    if cols >= 64:
+        return _evaluate_lines(boards, line_indexes(rows, cols, win_length))
+    return _evaluate_shifts(boards, rows, cols, win_length)
+
+
+def evaluate_numbers(numbers):
+    """ evaluates 3x3 boards given as base-3 numbers made by board.encode_state
+
+    :param numbers: array-like of N position numbers
+    :return: array of N statuses
+    """
+
+    return _status_table()[np.asarray(numbers, dtype=np.intp)]
+
+
+def encode_boards(boards, markers=('x', 'o')):
+    """ builds the array of boards from Board or BitBoard objects or from their states
+
+    :param boards: iterable of boards or lists of values of board's tiles
+    :param markers: markers of the first and the second player
+    :return: array of shape (N, tiles)
+    """
+
+    codes = {'#': 0, markers[0]: 1, markers[1]: 2}
+    states = [board if isinstance(board, (list, tuple)) else board.get_state() for board in boards]
+    return np.array([[codes[value] for value in state] for state in states], dtype=np.int8)
@@ -0,0 +1,458 @@
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import redirect_stdout
+import requests
+from bitboard import BOARDS
+from client import GameClient
+
+"""
+    Imports
+    -------
+    argparse
+    io
+    json
+    os
+    random
+    socket
+    subprocess
+    sys
+    threading
+    time
+    uuid
+    defaultdict
+    redirect_stdout
+    requests
+    BOARDS
+    GameClient
+
+    Data
+    ----------
+    SERVERS: dict
+        scripts of the servers the benchmark can start, by name
+    PERCENTILES: tuple
+        latency percentiles reported for every endpoint
+    LONG_POLL: float
+        number of seconds a waiting client holds a long-poll request
+    MARKER_POLL: float
+        first pause of the second player polling for the marker, doubled after every poll
+    MAX_MARKER_POLL: float
+        longest pause of the second player polling for the marker
+    MICRO_SIZES: tuple
+        (rows, cols, win_length) of the boards of the microbenchmarks
+
+    The load benchmark starts the server, or uses the one given by --url, and
+    plays games between pairs of client threads, every game in its own room. The
+    clients choose random empty tiles and talk to the server only with client.py,
+    either with the move protocol or with the legacy one that uploads the board.
+    Every request is timed, and the latencies are reported per endpoint. The
+    results are saved as JSON, so a later run can be compared with --compare.
+"""
+
+SERVERS = {'flask': "server.py", 'async': "async_server.py"}
+PERCENTILES = (50, 95, 99)
+LONG_POLL = 5.0
+MARKER_POLL = 0.01
+MAX_MARKER_POLL = 0.5
+MICRO_SIZES = ((3, 3, 3), (15, 15, 5))
+
+
+class LatencyRecorder:
+    """
+    A class used to collect the latencies of the requests of all client threads
+
+    Attributes
+    ----------
+    samples: defaultdict
+        lists of latencies in seconds by endpoint
+
+    Methods:
+    ----------
+    add(endpoint, seconds)
+        records the latency of one request
+    summary()
+        returns the count and the percentiles of the latencies by endpoint
+    """
+
+    def __init__(self):
+        """ sets an empty recorder
+        """
+
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds):
+        """ records the latency of one request
+
+        :param endpoint: name of the endpoint
+        :param seconds: latency of the request
+        """
+
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+
+    def summary(self):
+        """ returns the count and the percentiles of the latencies by endpoint, in milliseconds
+
+        :return: dictionary by endpoint
+        """
+
+        result = {}
+        with self._lock:
+            for endpoint, values in sorted(self.samples.items()):
+                values = sorted(values)
+                result[endpoint] = {'count': len(values)}
+                for percentile in PERCENTILES:
+                    index = max(0, -(-len(values) * percentile // 100) - 1)
+                    result[endpoint]['p%d_ms' % percentile] = values[index] * 1000
+        return result
+
+
+class TimedClient(GameClient):
+    """
+    A class used to time every request sent by GameClient
+
+    Attributes
+    ----------
+    recorder: LatencyRecorder
+        recorder of the latencies
+    """
+
+    def __init__(self, base_url, recorder, room=None, session=None, wire=False):
+        """ sets the client with a pool of one connection, one client thread uses it at a time
+
+        :param base_url: address of the game server
+        :param recorder: LatencyRecorder of the benchmark
+        :param room: id of the room
+        :param session: session to share instead of creating a new one
+        :param wire: use the compact encoding when the server supports it
+        """
+
+        super().__init__(base_url, room, timeout=LONG_POLL + 10, pool_size=1, session=session, wire=wire)
+        self.recorder = recorder
+
+    def with_room(self, room):
+        """ returns a timed client for another room sharing the same session
+
+        :param room: id of the room
+        :return: TimedClient
+        """
+
+        return TimedClient(self.base_url, self.recorder, room, self.session, self.wire)
+
+    def _get(self, path, **kwargs):
+        """ sends a timed GET request, recorded under the path of the endpoint
+        """
+
+        start = time.perf_counter()
+        try:
+            return super()._get(path, **kwargs)
+        finally:
+            self.recorder.add(path, time.perf_counter() - start)
+
+    def post_data(self, d):
+        """ sends timed data, recorded under 'setdata:' and the first key of the data
+        """
+
+        start = time.perf_counter()
+        try:
+            return super().post_data(d)
+        finally:
+            self.recorder.add("setdata:" + next(iter(d)), time.perf_counter() - start)
+
+    def get_state(self):
+        """ sends a timed conditional request for the state
+        """
+
+        start = time.perf_counter()
+        try:
+            return super().get_state()
+        finally:
+            self.recorder.add("getdata/state", time.perf_counter() - start)
+
+
+def play_seat(game_client, player_id, dimensions, rng, legacy=False):
+    """ plays one game in the room of the client, choosing random empty tiles
+
+    :param game_client: client bound to the room of the game
+    :param player_id: id of the player
+    :param dimensions: (rows, cols, win_length) of the board
+    :param rng: random.Random of the client thread
+    :param legacy: upload the board after every move instead of sending the move only
+    :return: number of moves made by the player
+    """
+
+    response = game_client.post_connect(player_id, dimensions)
+    if response['number'] == 1:
+        marker = 'x'
+        game_client.post_marker(marker, player_id)
+    else:
+        pause = MARKER_POLL
+        marker = game_client.get_second_player_marker()
+        while marker not in ('x', 'o'):
+            time.sleep(pause)
+            pause = min(2 * pause, MAX_MARKER_POLL)
+            marker = game_client.get_second_player_marker()
+    if legacy:
+        return _play_legacy(game_client, player_id, marker, dimensions, rng)
+    moves = 0
+    while True:
+        state = game_client.get_state()
+        if state['result'] is not None:
+            return moves
+        if state['current_player'] != player_id:
+            game_client.wait_for_turn(player_id, LONG_POLL)
+            continue
+        tile_id = rng.choice([i for i, value in enumerate(state['board']) if value == '#'])
+        if game_client.post_move(tile_id, player_id)['ok']:
+            moves += 1
+
+
+def _play_legacy(game_client, player_id, marker, dimensions, rng):
+    """ plays one game with the legacy protocol, the result is checked on the board of the client
+
+    :param game_client: client bound to the room of the game
+    :param player_id: id of the player
+    :param marker: marker of the player
+    :param dimensions: (rows, cols, win_length) of the board
+    :param rng: random.Random of the client thread
+    :return: number of moves made by the player
+    """
+
+    board = BOARDS['list'](*dimensions)
+    moves = 0
+    while True:
+        if game_client.get_current_player() != player_id:
+            game_client.wait_for_turn(player_id, LONG_POLL)
+            continue
+        state = game_client.get_board()
+        if state:
+            board.set_state(state)
+        if board.check_win() or board.check_full():
+            return moves
+        tile_id = rng.choice([i for i, value in enumerate(board.get_state()) if value == '#'])
+        board.place(marker, tile_id)
+        game_client.post_board(player_id, board.get_state())
+        game_client.post_tile(tile_id, player_id)
+        moves += 1
+        if board.check_win() or board.check_full():
+            return moves
+
+
+def run_load(url, games, concurrency, dimensions=(3, 3, 3), legacy=False, seed=0, wire=False):
+    """ plays the games between pairs of client threads, concurrency games at a time
+
+    :param url: address of the game server
+    :param games: number of games to play
+    :param concurrency: number of games played at the same time
+    :param dimensions: (rows, cols, win_length) of the board
+    :param legacy: use the legacy protocol
+    :param seed: seed of the random moves
+    :param wire: exchange the state and the moves in the compact encoding
+    :return: dictionary with the throughput and the latencies by endpoint
+    """
+
+    recorder = LatencyRecorder()
+    prefix = uuid.uuid4().hex[:8]
+    totals = {'moves': 0, 'games': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def seat(pair, player_id):
+        rng = random.Random(seed * 1000003 + pair * 2 + player_id)
+        base = TimedClient(url, recorder, wire=wire)
+        moves = finished = errors = 0
+        for game in range(pair, games, concurrency):
+            try:
+                moves += play_seat(base.with_room("bench-%s-%d" % (prefix, game)), player_id, dimensions, rng, legacy)
+                finished += 1
+            except (requests.RequestException, ValueError, KeyError):
+                errors += 1
+        base.close()
+        with lock:
+            totals['moves'] += moves
+            totals['games'] += finished if player_id == 1 else 0
+            totals['errors'] += errors
+
+    threads = [threading.Thread(target=seat, args=(pair, player_id))
+               for pair in range(concurrency) for player_id in (1, 2)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'games': totals['games'],
+        'moves': totals['moves'],
+        'errors': totals['errors'],
+        'seconds': elapsed,
+        'games_per_s': totals['games'] / elapsed,
+        'moves_per_s': totals['moves'] / elapsed,
+        'endpoints': recorder.summary(),
+    }
+
+
+def _time_per_call(function, calls):
+    """ runs the function the number of times and returns the mean time of one call
+
+    :param function: callable without arguments
+    :param calls: number of calls
+    :return: nanoseconds per call
+    """
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def run_micro(calls=20000, seed=0):
+    """ times place, check_win, check_full and draw_from_state of every board representation
+
+    :param calls: number of timed calls of every method
+    :param seed: seed of the position the checks are timed on
+    :return: dictionary of nanoseconds per call by board, size and method
+    """
+
+    result = {}
+    for kind, board_class in sorted(BOARDS.items()):
+        for rows, cols, win_length in MICRO_SIZES:
+            size = rows * cols
+            rng = random.Random(seed)
+            board = board_class(rows, cols, win_length)
+            tiles = list(range(size))
+            rng.shuffle(tiles)
+            for i, tile_id in enumerate(tiles[:size // 2]):
+                board.place('xo'[i % 2], tile_id)
+                if board.check_win():
+                    board.set_state(['#'] * size)
+            fill_calls = max(1, calls // size)
+            start = time.perf_counter()
+            for _ in range(fill_calls):
+                empty = board_class(rows, cols, win_length)
+                for i, tile_id in enumerate(tiles):
+                    empty.place('xo'[i % 2], tile_id)
+            place = (time.perf_counter() - start) / (fill_calls * size) * 1e9
+            with redirect_stdout(io.StringIO()) as output:
+                draw = _time_per_call(lambda: (board.draw_from_state(), output.seek(0), output.truncate()), calls)
+            result["%s %dx%d/%d" % (kind, rows, cols, win_length)] = {
+                'place_ns': place,
+                'check_win_ns': _time_per_call(board.check_win, calls),
+                'check_full_ns': _time_per_call(board.check_full, calls),
+                'draw_from_state_ns': draw,
+            }
+    return result
+
+
+def _free_port():
+    """ returns a port nobody listens on right now
+
+    :return: port number
+    """
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(name, port, timeout=15.0):
+    """ starts the server in a child process and waits until it answers
+
+    :param name: 'flask' or 'async'
+    :param port: port to listen on
+    :param timeout: maximum number of seconds to wait for the server
+    :return: subprocess.Popen of the server
+    """
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), SERVERS[name])
+    process = subprocess.Popen([sys.executable, script, "--port", str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get("http://127.0.0.1:%d/" % port, timeout=1)
+            return process
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The " + name + " server did not start")
+
+
+def compare(old, new):
+    """ prints the change of every latency and microbenchmark of the new results against the old ones
+
+    :param old: results of the earlier run
+    :param new: results of this run
+    """
+
+    for section in ('load', 'micro'):
+        old_rows = old.get(section) or {}
+        new_rows = new.get(section) or {}
+        if section == 'load':
+            old_rows, new_rows = old_rows.get('endpoints', {}), new_rows.get('endpoints', {})
+        for name in sorted(set(old_rows) & set(new_rows)):
+            for metric, value in new_rows[name].items():
+                before = old_rows[name].get(metric)
+                if metric != 'count' and before:
+                    print("%-40s %-20s %12.3f -> %12.3f  %+7.1f%%"
+                          % (name, metric, before, value, (value / before - 1) * 100))
+    if old.get('load') and new.get('load'):
+        for metric in ('games_per_s', 'moves_per_s'):
+            before, value = old['load'][metric], new['load'][metric]
+            print("%-61s %12.1f -> %12.1f  %+7.1f%%" % (metric, before, value, (value / before - 1) * 100))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tic-tac-toe server load and board microbenchmarks")
+    parser.add_argument("--server", choices=sorted(SERVERS), default='flask', help="server started for the benchmark")
+    parser.add_argument("--url", default=None, help="benchmark a running server instead of starting one")
+    parser.add_argument("--games", type=int, default=200, help="number of games to play")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of games played at the same time")
+    parser.add_argument("--rows", type=int, default=3, help="number of rows of the board")
+    parser.add_argument("--cols", type=int, default=3, help="number of columns of the board")
+    parser.add_argument("--win-length", type=int, default=3, help="number of markers in a row needed to win")
+    parser.add_argument("--legacy-protocol", action="store_true", help="upload the board after every move")
+    parser.add_argument("--wire", action="store_true", help="exchange the state and the moves in a compact encoding")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random moves")
+    parser.add_argument("--no-load", action="store_true", help="run only the microbenchmarks")
+    parser.add_argument("--no-micro", action="store_true", help="run only the load benchmark")
+    parser.add_argument("--calls", type=int, default=20000, help="number of calls of every microbenchmark")
+    parser.add_argument("--output", default=None, help="file the results are saved to as JSON")
+    parser.add_argument("--compare", default=None, help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = {'meta': {'time': time.time(), 'python': sys.version.split()[0], 'args': vars(args)}}
+    if not args.no_load:
+        server = None
+        url = args.url
+        if url is None:
+            port = _free_port()
+            server = start_server(args.server, port)
+            url = "http://127.0.0.1:%d" % port
+        try:
+            results['load'] = run_load(url, args.games, args.concurrency, (args.rows, args.cols, args.win_length),
+                                       args.legacy_protocol, args.seed, args.wire)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    if not args.no_micro:
+        results['micro'] = run_micro(args.calls, args.seed)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    print(json.dumps({key: value for key, value in results.items() if key != 'meta'}, indent=2))
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
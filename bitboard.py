@@ -0,0 +1,256 @@
+from functools import lru_cache
+from board import Board, winning_lines
+from renderer import renderer
+
+"""
+    Imports
+    -------
+    lru_cache
+    Board, winning_lines
+    renderer
+
+    Data
+    ----------
+    FULL_MASK: int
+        mask with a bit set for every tile of the 3x3 board
+    WIN_MASKS: tuple
+        masks of the 8 winning lines of the 3x3 board
+    WINNING: tuple
+        table telling for every 9-bit set of tiles whether it contains a winning line of the 3x3 board
+    BOARDS: dict
+        board classes available to make_board, by name
+"""
+
+FULL_MASK = 0b111111111
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # horizontal
+    0b001001001, 0b010010010, 0b100100100,  # vertical
+    0b100010001, 0b001010100,               # diagonal
+)
+WINNING = tuple(any(tiles & mask == mask for mask in WIN_MASKS) for tiles in range(FULL_MASK + 1))
+
+
+@lru_cache(maxsize=None)
+def line_masks(rows, cols, win_length):
+    """ builds the masks of the winning lines and, for every tile, of the winning lines through it
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: tuple (masks of all lines, tuple of masks of the lines through every tile)
+    """
+
+    masks = tuple(sum(1 << tile_id for tile_id in line) for line in winning_lines(rows, cols, win_length))
+    through = tuple(tuple(mask for mask in masks if mask >> tile_id & 1) for tile_id in range(rows * cols))
+    return masks, through
+
+
+class BitBoard:
+    """
+    A class used to represent a Tic-tac-toe board as two integers with a bit per tile
+
+    It has the same public methods as Board. Tile n of the board is bit n of the
+    integers, so placing a marker, checking a tile and checking a full board are
+    single bit operations. On the 3x3 board checking a win is one lookup in the
+    WINNING table, on other boards place() checks the masks of the lines through
+    the placed tile only.
+
+    Attributes
+    ----------
+    rows: int
+        number of rows of the board
+    cols: int
+        number of columns of the board
+    win_length: int
+        number of markers in a row needed to win
+    markers: list[str]
+        markers of the first and the second player, filled when they place a marker
+    first: int
+        tiles occupied by the first player
+    second: int
+        tiles occupied by the second player
+    won: bool
+        stores whether there is a winning configuration, None if the board has to be scanned
+
+    Methods:
+    ----------
+    reset()
+        clears the board
+    draw()
+        displays board
+    place(marker, tile_id)
+        places a marker on the field selected by the user
+    check_can_place(tile_id)
+        checks if the selected field is allowed
+    check_full()
+        checks if there are still allowed fields in the board
+    check_win()
+        checks if there is a winning configuration on the board
+    get_state()
+        returns the state of the board
+    set_state(state)
+        sets the state of the board according to the given parameter
+    draw_from_state()
+        displays current board
+    get_dimensions()
+        returns the size of the board and the number of markers in a row needed to win
+    """
+
+    __slots__ = ('_rows', '_cols', '_win_length', '_full', '_masks', '_markers', '_first', '_second', '_won')
+
+    def __init__(self, rows=3, cols=3, win_length=3):
+        """ sets an empty board
+
+        :param rows: number of rows of the board, default 3
+        :param cols: number of columns of the board, default 3
+        :param win_length: number of markers in a row needed to win, default 3
+        """
+
+        self._rows = rows
+        self._cols = cols
+        self._win_length = win_length
+        self._full = (1 << rows * cols) - 1
+        self._masks = None if (rows, cols, win_length) == (3, 3, 3) else line_masks(rows, cols, win_length)
+        self._markers = []
+        self._first = 0
+        self._second = 0
+        self._won = False
+
+    def _set_bit(self, marker, tile_id):
+        """ sets the bit of the tile in the integer of the marker, registering a new marker
+
+        :param marker: 'x' or 'o'
+        :param tile_id: field number
+        """
+
+        if marker not in self._markers:
+            self._markers.append(marker)
+        if marker == self._markers[0]:
+            self._first |= 1 << tile_id
+            tiles = self._first
+        else:
+            self._second |= 1 << tile_id
+            tiles = self._second
+        if self._masks is not None and self._won is False:
+            self._won = any(tiles & mask == mask for mask in self._masks[1][tile_id])
+
+    def reset(self):
+        """ clears the board
+        """
+
+        self._markers = []
+        self._first = 0
+        self._second = 0
+        self._won = False
+
+    def draw(self):
+        """ prints what the board looks like
+        """
+
+        print(self._drawn_board())
+
+    def _drawn_board(self):
+        """ builds the appearance of the board from its state
+
+        :return: the appearance of the board
+        """
+
+        return renderer(self._rows, self._cols).frame(self.get_state())
+
+    def place(self, marker, tile_id):
+        """ sets the state of the field according to the user's choice
+
+        :param marker: 'x' or 'o'
+        :param tile_id: field number selected by the user
+        :return: True if the marker has been correctly placed or False if not
+        """
+
+        if self.check_can_place(tile_id):
+            self._set_bit(marker, tile_id)
+            return True, "Marker is placed."
+        else:
+            return False, "Cannot place marker."
+
+    def check_can_place(self, tile_id):
+        """ checks if the selected field is allowed
+
+        :param tile_id: the number of the field to be checked
+        :return: True if the selected field is empty
+        """
+
+        return not (self._first | self._second) >> tile_id & 1
+
+    def check_full(self):
+        """ checks if all fields on the board are occupied
+
+        :return: True if there is no empty field
+        """
+
+        return self._first | self._second == self._full
+
+    def check_win(self):
+        """ checks if one of the players occupies a whole line
+
+        :return: True if there is a winning configuration on the board or False if not
+        """
+
+        if self._masks is None:
+            return WINNING[self._first] or WINNING[self._second]
+        if self._won is None:
+            self._won = any(tiles & mask == mask for mask in self._masks[0] for tiles in (self._first, self._second))
+        return self._won
+
+    def get_state(self):
+        """ gets the state in the format used by Board
+
+        :return: a list of strings representing the markers on board
+        """
+
+        state = ['#'] * (self._rows * self._cols)
+        for marker, bits in zip(self._markers, (self._first, self._second)):
+            for tile_id in range(len(state)):
+                if bits >> tile_id & 1:
+                    state[tile_id] = marker
+        return state
+
+    def set_state(self, state):
+        """ sets the state of the board according to the given parameter
+
+        :param state: list of values of board's tiles
+        """
+
+        self.reset()
+        self._won = None
+        for tile_id, marker in enumerate(state):
+            if marker != '#':
+                self._set_bit(marker, tile_id)
+
+    def draw_from_state(self):
+        """ displays current board
+        """
+
+        self.draw()
+
+    def get_dimensions(self):
+        """ gets the size of the board and the number of markers in a row needed to win
+
+        :return: tuple (rows, cols, win_length)
+        """
+
+        return self._rows, self._cols, self._win_length
+
+
+BOARDS = {'list': Board, 'bitboard': BitBoard}
+
+
+def make_board(kind='list', rows=3, cols=3, win_length=3):
+    """ creates an empty board of the selected representation
+
+    :param kind: 'list' for Board or 'bitboard' for BitBoard
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: the board
+    """
+
+    return BOARDS[kind](rows, cols, win_length)
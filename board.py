@@ -1,22 +1,97 @@
+from functools import lru_cache
+from renderer import renderer
+
+"""
+    Imports
+    -------
+    lru_cache
+    renderer
+
+    Data
+    ----------
+    DIRECTIONS: tuple
+        row and column steps of the horizontal, vertical and both diagonal lines
+"""
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+@lru_cache(maxsize=None)
+def winning_lines(rows=3, cols=3, win_length=3):
+    """ lists every line of win_length tiles on the board
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: tuple of lines, every line is a tuple of tile ids
+    """
+
+    lines = []
+    for row in range(rows):
+        for col in range(cols):
+            for d_row, d_col in DIRECTIONS:
+                end_row = row + d_row * (win_length - 1)
+                end_col = col + d_col * (win_length - 1)
+                if 0 <= end_row < rows and 0 <= end_col < cols:
+                    lines.append(tuple((row + d_row * i) * cols + col + d_col * i for i in range(win_length)))
+    return tuple(lines)
+
+
+def encode_state(state, markers=('x', 'o')):
+    """ encodes the state as a base-3 number, tile n is digit n: 0 for an empty tile, 1 and 2 for the markers
+
+    :param state: list of values of board's tiles
+    :param markers: markers encoded as 1 and 2
+    :return: the number of the position
+    """
+
+    digits = {'#': 0, markers[0]: 1, markers[1]: 2}
+    number = 0
+    for value in reversed(state):
+        number = number * 3 + digits[value]
+    return number
+
+
+def decode_state(number, size=9, markers=('x', 'o')):
+    """ decodes the state from the base-3 number made by encode_state
+
+    :param number: the number of the position
+    :param size: number of tiles of the board
+    :param markers: markers encoded as 1 and 2
+    :return: list of values of board's tiles
+    """
+
+    values = ('#', markers[0], markers[1])
+    state = []
+    for _ in range(size):
+        number, digit = divmod(number, 3)
+        state.append(values[digit])
+    return state
+
+
 class Board:
     """
-    A class used to represent a Tic-tac-toe board
+    A class used to represent a Tic-tac-toe board of any size, with any number of markers in a row needed to win
 
     Attributes
     ----------
+    rows: int
+        number of rows of the board
+    cols: int
+        number of columns of the board
+    win_length: int
+        number of markers in a row needed to win
     state: list[str]
         stores the status of all fields in the array
-    drawn_board: str
-        stores the current appearance of the board
+    won: bool
+        stores whether there is a winning configuration, None if the board has to be scanned
 
     Methods:
     ----------
     _init_state()
         sets the default state value
-    _init_drawn_board()
-        sets the default drawn_board value
     reset()
-        sets the state and drawn_board to the default value
+        sets the state to the default value
     draw()
         displays board
     place(marker, tile_id)
@@ -33,58 +108,54 @@ class Board:
         sets the state of the board according to the given parameter
     draw_from_state()
         displays current board
+    get_dimensions()
+        returns the size of the board and the number of markers in a row needed to win
     """
 
-    def __init__(self):
-        """ sets the default state and drawn_board values by calling _init_state and _init_drawn_board
+    def __init__(self, rows=3, cols=3, win_length=3):
+        """ sets the default state by calling _init_state
+
+        :param rows: number of rows of the board, default 3
+        :param cols: number of columns of the board, default 3
+        :param win_length: number of markers in a row needed to win, default 3
         """
 
+        self._rows = rows
+        self._cols = cols
+        self._win_length = win_length
         self._state = self._init_state()
-        self._drawn_board = self._init_drawn_board()
+        self._won = False
 
     def _init_state(self):
-        """ initializes the 9-item list filled with '#'
+        """ initializes the list of rows * cols items filled with '#'
 
         :return:
             a list of strings representing the markers on board
         """
 
-        return ['#'] * 9
+        return ['#'] * (self._rows * self._cols)
 
-    def _init_drawn_board(self):
-        """ initializes the default appearance of the board
+    def _render(self, state):
+        """ returns the appearance of the board, every tile shows its marker or its number if it is empty
 
+        :param state: list of values of board's tiles
         :return: the appearance of the board
         """
 
-        return """
-    ___________________
-    |     |     |     |
-    |  1  |  2  |  3  |
-    |     |     |     |
-    |-----------------|
-    |     |     |     |
-    |  4  |  5  |  6  |
-    |     |     |     |
-    |-----------------|
-    |     |     |     |
-    |  7  |  8  |  9  |
-    |     |     |     |
-    |-----------------|
-    """
+        return renderer(self._rows, self._cols).frame(state)
 
     def reset(self):
-        """ resets state and board values by calling _init_state() and _init_drawn_board()
+        """ resets the state by calling _init_state()
         """
 
         self._state = self._init_state()
-        self._drawn_board = self._init_drawn_board()
+        self._won = False
 
     def draw(self):
-        """ prints what the board looks like
+        """ prints what the board looks like, the drawing is built only when it is shown
         """
 
-        print(self._drawn_board)
+        print(self._render(self._state))
 
     def place(self, marker, tile_id):
         """ sets the state of the field according to the user's choice
@@ -96,7 +167,8 @@ class Board:
 
         if self.check_can_place(tile_id):
             self._state[tile_id] = marker
-            self._drawn_board = self._drawn_board.replace(str(tile_id+1), marker)
+            if self._won is False:
+                self._won = self._wins_through(tile_id)
             return True, "Marker is placed."
         else:
             return False, "Cannot place marker."
@@ -115,27 +187,40 @@ class Board:
         :return: False if in state is min. 1 field filled '#'
         """
 
-        return not any([tile == '#' for tile in self._state])
+        return '#' not in self._state
 
     def check_win(self):
-        """ Checks all lines on the board for a winning configuration
+        """ Checks for a winning configuration
+            after place() only the lines through the placed tile are checked, in O(win_length),
+            after set_state() all lines on the board are checked once
 
         :return: True if the fields in the line are filled with the same marker or False if not
         """
 
-        # horizontal check
-        for i in range(0, 7, 3):
-            if self._state[i] == self._state[i+1] == self._state[i+2] and self._state[i] != '#':
-                return True
-        # vertical check
-        for i in range(0, 3, 1):
-            if self._state[i] == self._state[i+3] == self._state[i+6] and self._state[i] != '#':
+        if self._won is None:
+            state = self._state
+            self._won = any(state[line[0]] != '#' and all(state[i] == state[line[0]] for i in line[1:])
+                            for line in winning_lines(self._rows, self._cols, self._win_length))
+        return self._won
+
+    def _wins_through(self, tile_id):
+        """ checks the lines through the tile for win_length markers in a row
+
+        :param tile_id: the number of the field to be checked
+        :return: True if the marker on the tile is a part of a winning line
+        """
+
+        marker = self._state[tile_id]
+        row, col = divmod(tile_id, self._cols)
+        for d_row, d_col in DIRECTIONS:
+            count = 1
+            for sign in (1, -1):
+                r, c = row + sign * d_row, col + sign * d_col
+                while 0 <= r < self._rows and 0 <= c < self._cols and self._state[r * self._cols + c] == marker:
+                    count += 1
+                    r, c = r + sign * d_row, c + sign * d_col
+            if count >= self._win_length:
                 return True
-        # diagonal check
-        if self._state[0] == self._state[4] == self._state[8] and self._state[0] != '#':
-            return True
-        if self._state[2] == self._state[4] == self._state[6] and self._state[2] != '#':
-            return True
         return False
 
     def get_state(self):
@@ -153,11 +238,18 @@ class Board:
         """
 
         self._state = state
+        self._won = None
 
     def draw_from_state(self):
         """ changes the player's selected fields from # to marker and displays board
         """
-        for index, val in enumerate(self._state):
-            if val != '#':
-                self._drawn_board = self._drawn_board.replace(str(index + 1), val)
+
         self.draw()
+
+    def get_dimensions(self):
+        """ gets the size of the board and the number of markers in a row needed to win
+
+        :return: tuple (rows, cols, win_length)
+        """
+
+        return self._rows, self._cols, self._win_length
@@ -1,123 +1,642 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+from rate_limit import PLAYER_HEADER
+import wire
 
 """
     Imports
     -------
     requests
+    HTTPAdapter
+    Retry
     json
-
+    PLAYER_HEADER
+    wire
+
+    Data
+    ----------
+    SERVER_URL: str
+        address of the game server
+    TIMEOUT: float
+        default number of seconds to wait for the server
+    RETRIES: int
+        default number of retries of a failed request
+    BACKOFF: float
+        default backoff factor between the retries, in seconds
+
+    The module functions use one shared GameClient, so they reuse pooled keep-alive
+    connections as well. Every function takes an optional room id. Without it the
+    default room of the server is used.
 """
 
+SERVER_URL = "http://127.0.0.1:5000"
+TIMEOUT = 10.0
+RETRIES = 3
+BACKOFF = 0.2
+
+
+class GameClient:
+    """
+    A class used to talk to the game server over a pooled keep-alive session
+
+    Connection errors are retried for every request, because such a request never
+    reached the server. Read errors and 429/502/503/504 responses are retried only
+    for GET requests, which are safe to repeat, after the backoff or after the time
+    the server asks for in Retry-After. Once connected, the client names its player
+    in the X-Player-Id header of the polling requests, so the server limits every
+    player on its own.
+
+    Attributes
+    ----------
+    base_url: str
+        address of the game server
+    room: str
+        id of the room, None for the default room
+    timeout: float
+        number of seconds to wait for the server
+    session: requests.Session
+        session keeping the pooled connections
+    wire: bool
+        True if the state and the moves are exchanged in the compact encoding of the wire module
+        once the server announces it, otherwise JSON is used
+    player_id: int
+        id of the player connected by post_connect, None before
+
+    Methods:
+    ----------
+    with_room(room)
+        returns a client for another room sharing the same session
+    close()
+        closes the pooled connections
+    api_url(path)
+        builds the url of the api endpoint
+    post_data(d)
+        sends data to the server
+    post_connect(id, dimensions)
+        sends request to server that contains id
+    post_board(id, board)
+        sends player board to the server
+    post_marker(marker, id)
+        sends information about player marker to the server
+    post_tile(tile_id, id)
+        sends the number of the field occupied by the client
+    post_move(tile_id, id)
+        sends the move of the client, the server places the marker
+    get_board()
+        gets the current board from the server
+    get_second_player_marker()
+        gets the second player marker from the server
+    get_first_player_marker()
+        gets the first player marker from the server
+    get_current_player()
+        gets information about which player has the turn from the server
+    get_state()
+        gets the turn, the board, the markers and the result at once
+    wait_for_turn(id, timeout)
+        waits on the server until the player has a turn
+    stream_events(id, timeout)
+        yields the changes pushed by the server
+    watch(timeout)
+        yields the changes of the game to a spectator
+    find_match(id, skill, dimensions, timeout)
+        waits in the matchmaking queue until the player is paired and returns the room id
+    leave_match(id)
+        leaves the matchmaking queue
+    """
+
+    def __init__(self, base_url=SERVER_URL, room=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF,
+                 pool_size=10, session=None, wire=False):
+        """ sets the client and mounts a pooled adapter with bounded retries on a new session
+
+        :param base_url: address of the game server
+        :param room: id of the room, default None
+        :param timeout: number of seconds to wait for the server
+        :param retries: number of retries of a failed request
+        :param backoff: backoff factor between the retries, in seconds
+        :param pool_size: number of connections kept alive
+        :param session: session to share instead of creating a new one
+        :param wire: use the compact encoding when the server supports it, default False
+        """
+
+        self.base_url = base_url.rstrip('/')
+        self.room = room
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                          backoff_factor=backoff, status_forcelist=(429, 502, 503, 504),
+                          allowed_methods=frozenset({'GET'}), respect_retry_after_header=True,
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.wire = wire
+        self._wire_moves = False
+        self.player_id = None
+        self._state_etag = None
+        self._state = None
+
+    def with_room(self, room):
+        """ returns a client for another room sharing the same session
+
+        :param room: id of the room
+        :return: GameClient
+        """
+
+        return GameClient(self.base_url, room, self.timeout, session=self.session, wire=self.wire)
+
+    def close(self):
+        """ closes the pooled connections
+        """
+
+        self.session.close()
+
+    def api_url(self, path):
+        """ builds the url of the api endpoint, scoped to the room if it is set
+
+        :param path: path of the endpoint relative to the /api prefix
+        :return: url of the endpoint
+        """
+
+        if self.room is None:
+            return self.base_url + "/api/" + path
+        return self.base_url + "/api/rooms/" + str(self.room) + "/" + path
+
+    def _get(self, path, **kwargs):
+        """ sends a GET request to the api endpoint
+
+        :param path: path of the endpoint relative to the /api prefix
+        :param kwargs: arguments passed to requests
+        :return: decoded json response
+        """
+
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs['headers'] = self._headers(kwargs.get('headers'))
+        response = self.session.get(self.api_url(path), **kwargs)
+        return response.json()
+
+    def _headers(self, headers=None):
+        """ adds the id of the connected player to the headers of a request
+
+        :param headers: dict of headers or None
+        :return: dict of headers
+        """
+
+        headers = dict(headers) if headers else {}
+        if self.player_id is not None:
+            headers[PLAYER_HEADER] = str(self.player_id)
+        return headers
+
+    def post_data(self, d):
+        """ sends data to the server
+
+        :param d: data to be transmitted
+        :return: response received from server
+        """
+
+        if self.wire and self._wire_moves and 'move' in d:
+            try:
+                body = wire.encode_move(d['move'], d['id'])
+            except ValueError:
+                body = None
+            if body is not None:
+                response = self.session.post(self.api_url("setdata"), data=body, timeout=self.timeout,
+                                             headers={'content-type': wire.CONTENT_TYPE, 'accept': wire.CONTENT_TYPE})
+                return self._decode(response, wire.decode_move_response)
+        d = json.dumps(d)
+        response = self.session.post(self.api_url("setdata"), data=d,
+                                     headers={'content-type': 'application/json'}, timeout=self.timeout)
+        self._wire_moves = wire.CONTENT_TYPE in response.headers.get('Accept-Post', '')
+
+        return response.json()
+
+    def _decode(self, response, decode):
+        """ decodes the response according to its content type
+
+        :param response: requests.Response
+        :param decode: function decoding a body in the compact encoding
+        :return: decoded response
+        """
+
+        if response.headers.get('Content-Type', '').split(';')[0].strip() == wire.CONTENT_TYPE:
+            return decode(response.content)
+        return response.json()
+
+    def post_connect(self, id, dimensions=None):
+        """ sends request to server that contains id
+
+        :param id: client id number
+        :param dimensions: (rows, cols, win_length) of the board, used by the server when it creates the game
+        :return: response received from server, with the dimensions of the board of the game
+        """
+
+        data = {
+            'i_am_here': True,
+            'id': id,
+        }
+        if dimensions is not None:
+            data['dimensions'] = list(dimensions)
+        self.player_id = id
+        return self.post_data(data)
+
+    def post_board(self, id, board):
+        """ sends player board to the server
+
+        :param id: id number of the client sending the information to the server
+        :param board: current game board
+        :return: response received from server
+        """
+
+        data = {
+            'current_board': board,
+            'id': id,
+        }
+        return self.post_data(data)
+
+    def post_marker(self, marker, id):
+        """ sends information about player marker to the server
+
+        :param marker: player marker 'x' or 'o'
+        :param id: id number of the client sending the information to the server
+        :return: response received from server
+        """
+
+        data = {
+            'marker': marker,
+            'id': id,
+        }
+        return self.post_data(data)
+
+    def post_tile(self, tile_id, id):
+        """Sends to the server the number of the field occupied by the client on the board
+
+        :param tile_id: field number on the board
+        :param id: id number of the client sending the information to the server
+        :return: response received from server
+        """
+
+        data = {
+            'tile_id': tile_id,
+            'id': id,
+        }
+        return self.post_data(data)
+
+    def post_move(self, tile_id, id):
+        """ sends the move of the client, the server checks it and places the marker of the player on its board
+
+        :param tile_id: field number on the board
+        :param id: id number of the client making the move
+        :return: response received from server with 'ok', 'prompt', 'board', 'current_player' and 'result'
+        """
+
+        data = {
+            'move': tile_id,
+            'id': id,
+        }
+        return self.post_data(data)
+
+    def get_board(self):
+        """ gets the current board from the server
+
+        :return: board with the current state of the game
+        """
+
+        return self._get("getdata/board")
+
+    def get_second_player_marker(self):
+        """gets the second player marker based on the first player's selection from the server
+
+        :return: second player marker 'x' or 'o'
+        """
+
+        return self._get("getdata/ndplayer_mark")
+
+    def get_first_player_marker(self):
+        """gets the first player marker from the server
+
+        :return: first player marker 'x' or 'o'
+        """
+
+        return self._get("getdata/stplayer_mark")
+
+    def get_current_player(self):
+        """ gets information about which player has the turn from the server
+
+        :return: id of the player who has a turn, None while nobody has it
+        """
+
+        return self._get("getdata/current_player")
+
+    def get_state(self):
+        """ gets the turn, the board, the markers and the result of the room at once
+            the server is asked with the tag of the last received state, so an unchanged state is not sent again
+
+        :return: dictionary with the state of the room and its 'version'
+        """
+
+        headers = self._headers({'If-None-Match': self._state_etag} if self._state_etag is not None else None)
+        if self.wire:
+            headers['Accept'] = wire.CONTENT_TYPE + ", application/json;q=0.5"
+        response = self.session.get(self.api_url("getdata/state"), headers=headers, timeout=self.timeout)
+        if response.status_code != 304:
+            self._state = self._decode(response, lambda data: wire.decode_state_record(data)[0])
+            self._state_etag = response.headers.get('ETag')
+        return self._state
+
+    def wait_for_turn(self, id, timeout=25):
+        """ waits on the server until the player has a turn or the timeout expires
+
+        :param id: id number of the waiting client
+        :param timeout: maximum number of seconds the server holds the request
+        :return: id of the player who has a turn, None while nobody has it
+        """
+
+        return self._get("getdata/wait_turn", params={'id': id, 'timeout': timeout}, timeout=timeout + self.timeout)
+
+    def stream_events(self, id, timeout=30):
+        """ opens the Server-Sent Events stream of the room and yields the pushed changes
+
+        :param id: id number of the listening client
+        :param timeout: maximum number of seconds without any data, keep-alive comments included
+        :return: generator of (event, data) tuples
+        """
+
+        return self._stream("events", {'id': id}, timeout)
+
+    def watch(self, timeout=30):
+        """ opens the read-only stream of a spectator and yields the changes of the game until it is over
+            a spectator that lags behind gets a single 'state' event with the latest snapshot
+
+        :param timeout: maximum number of seconds without any data, keep-alive comments included
+        :return: generator of (event, data) tuples
+        """
+
+        return self._stream("watch", {}, timeout)
+
+    def _stream(self, path, params, timeout):
+        """ opens a Server-Sent Events stream and yields its events
+
+        :param path: path of the endpoint relative to the /api prefix
+        :param params: arguments of the request
+        :param timeout: maximum number of seconds without any data, keep-alive comments included
+        :return: generator of (event, data) tuples
+        """
 
-def post_data(d):
+        response = self.session.get(self.api_url(path), params=params, stream=True,
+                                    headers={'accept': 'text/event-stream'}, timeout=timeout)
+        response.raise_for_status()
+        with response:
+            event, data = 'message', []
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line:
+                    if data:
+                        yield event, json.loads('\n'.join(data))
+                    event, data = 'message', []
+                elif line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].strip())
+
+    def find_match(self, id, skill=None, dimensions=None, timeout=25):
+        """ joins the matchmaking queue and waits on the server until the player is paired with another one
+            the player joins again if it has been dropped from the queue, e.g. after a lost connection
+
+        :param id: id number of the client
+        :param skill: rating of the player, players are paired within the same range, default None
+        :param dimensions: (rows, cols, win_length) of the board, players are paired for the same board
+        :param timeout: maximum number of seconds the server holds one request
+        :return: id of the room reserved for the pair
+        :raises requests.HTTPError: if the server refuses the request, e.g. it has no matchmaking
+        """
+
+        data = {'id': id, 'skill': skill, 'dimensions': list(dimensions) if dimensions is not None else None}
+        status = {'status': 'unknown'}
+        while status['status'] != 'matched':
+            if status['status'] == 'unknown':
+                response = self.session.post(self.base_url + "/api/match", json=data, timeout=self.timeout)
+            else:
+                response = self.session.get(self.base_url + "/api/match", params={'id': id, 'timeout': timeout},
+                                            timeout=timeout + self.timeout)
+            response.raise_for_status()
+            status = response.json()
+        return status['room_id']
+
+    def leave_match(self, id):
+        """ leaves the matchmaking queue
+
+        :param id: id number of the client
+        :return: response received from server
+        """
+
+        return self.session.delete(self.base_url + "/api/match", params={'id': id}, timeout=self.timeout).json()
+
+
+_default_client = None
+
+
+def default_client(room=None):
+    """ returns the shared client of the module functions, bound to the room
+
+    :param room: id of the room
+    :return: GameClient
+    """
+
+    global _default_client
+    if _default_client is None:
+        _default_client = GameClient(SERVER_URL)
+    if room is None:
+        return _default_client
+    return _default_client.with_room(room)
+
+
+def api_url(path, room=None):
+    """ builds the url of the api endpoint, scoped to the room if it is given
+
+    :param path: path of the endpoint relative to the /api prefix
+    :param room: id of the room or None for the default room
+    :return: url of the endpoint
+    """
+
+    return default_client(room).api_url(path)
+
+
+def post_data(d, room=None):
     """ sends data to the server
 
     :param d: data to be transmitted
+    :param room: id of the room
     :return: response received from server
     """
 
-    d = json.dumps(d)
-    response = requests.post("http://127.0.0.1:5000/api/setdata", data=d,
-                             headers={'content-type': 'application/json'})
-
-    return response.json()
+    return default_client(room).post_data(d)
 
 
-def post_connect(id):
+def post_connect(id, room=None, dimensions=None):
     """ sends request to server that contains id
 
     :param id: client id number
-    :return: response received from server
+    :param room: id of the room
+    :param dimensions: (rows, cols, win_length) of the board, used by the server when it creates the game
+    :return: response received from server, with the dimensions of the board of the game
     """
 
-    data = {
-        'i_am_here': True,
-        'id': id,
-    }
-    return post_data(data)
+    return default_client(room).post_connect(id, dimensions)
 
 
-def post_board(id, board):
+def post_board(id, board, room=None):
     """ sends player board to the server
 
     :param id: id number of the client sending the information to the server
     :param board: current game board
+    :param room: id of the room
     :return: response received from server
     """
 
-    data = {
-        'current_board': board,
-        'id': id,
-    }
-    return post_data(data)
+    return default_client(room).post_board(id, board)
 
 
-def post_marker(marker, id):
+def post_marker(marker, id, room=None):
     """ sends information about player marker to the server
 
     :param marker: player marker 'x' or 'o'
     :param id: id number of the client sending the information to the server
+    :param room: id of the room
     :return: response received from server
     """
 
-    data = {
-        'marker': marker,
-        'id': id,
-    }
-    return post_data(data)
+    return default_client(room).post_marker(marker, id)
 
 
-def post_tile(tile_id, id):
+def post_tile(tile_id, id, room=None):
     """Sends to the server the number of the field occupied by the client on the board
 
     :param tile_id: field number on the board
     :param id: id number of the client sending the information to the server
+    :param room: id of the room
     :return: response received from server
     """
 
-    data = {
-        'tile_id': tile_id,
-        'id': id,
-    }
-    return post_data(data)
+    return default_client(room).post_tile(tile_id, id)
+
 
+def post_move(tile_id, id, room=None):
+    """ sends the move of the client, the server checks it and places the marker of the player on its board
 
-def get_board():
+    :param tile_id: field number on the board
+    :param id: id number of the client making the move
+    :param room: id of the room
+    :return: response received from server with 'ok', 'prompt', 'board', 'current_player' and 'result'
+    """
+
+    return default_client(room).post_move(tile_id, id)
+
+
+def get_board(room=None):
     """ gets the current board from the server
 
+    :param room: id of the room
     :return: board with the current state of the game
     """
 
-    response = requests.get("http://127.0.0.1:5000/api/getdata/board")
-    return response.json()
+    return default_client(room).get_board()
 
 
-def get_second_player_marker():
+def get_second_player_marker(room=None):
     """gets the second player marker based on the first player's selection from the server
 
+    :param room: id of the room
     :return: second player marker 'x' or 'o'
     """
 
-    response = requests.get("http://127.0.0.1:5000/api/getdata/ndplayer_mark")
-    return response.json()
+    return default_client(room).get_second_player_marker()
 
 
-def get_first_player_marker():
+def get_first_player_marker(room=None):
     """gets the first player marker from the server
 
+    :param room: id of the room
     :return: first player marker 'x' or 'o'
     """
 
-    response = requests.get("http://127.0.0.1:5000/api/getdata/stplayer_mark")
-    return response.json()
+    return default_client(room).get_first_player_marker()
 
 
-def get_current_player():
+def get_current_player(room=None):
     """ gets information about which player has the turn from the server
 
-    :return: player who has a turn
+    :param room: id of the room
+    :return: id of the player who has a turn, None while nobody has it
+    """
+
+    return default_client(room).get_current_player()
+
+
+def get_state(room=None):
+    """ gets the turn, the board, the markers and the result of the room at once
+
+    :param room: id of the room
+    :return: dictionary with the state of the room and its 'version'
+    """
+
+    return default_client(room).get_state()
+
+
+def wait_for_turn(id, timeout=25, room=None):
+    """ waits on the server until the player has a turn or the timeout expires
+
+    :param id: id number of the waiting client
+    :param timeout: maximum number of seconds the server holds the request
+    :param room: id of the room
+    :return: id of the player who has a turn, None while nobody has it
+    """
+
+    return default_client(room).wait_for_turn(id, timeout)
+
+
+def stream_events(id, room=None, timeout=30):
+    """ opens the Server-Sent Events stream of the room and yields the pushed changes
+
+    :param id: id number of the listening client
+    :param room: id of the room
+    :param timeout: maximum number of seconds without any data, keep-alive comments included
+    :return: generator of (event, data) tuples
+    """
+
+    return default_client(room).stream_events(id, timeout)
+
+
+def watch(room=None, timeout=30):
+    """ opens the read-only stream of a spectator and yields the changes of the game until it is over
+
+    :param room: id of the room
+    :param timeout: maximum number of seconds without any data, keep-alive comments included
+    :return: generator of (event, data) tuples
+    """
+
+    return default_client(room).watch(timeout)
+
+
+def find_match(id, skill=None, dimensions=None, timeout=25):
+    """ waits in the matchmaking queue until the player is paired with another one
+
+    :param id: id number of the client
+    :param skill: rating of the player, default None
+    :param dimensions: (rows, cols, win_length) of the board, default None
+    :param timeout: maximum number of seconds the server holds one request
+    :return: id of the room reserved for the pair
+    """
+
+    return default_client().find_match(id, skill, dimensions, timeout)
+
+
+def leave_match(id):
+    """ leaves the matchmaking queue
+
+    :param id: id number of the client
+    :return: response received from server
     """
 
-    response = requests.get("http://127.0.0.1:5000/api/getdata/current_player")
-    return response.json()
+    return default_client().leave_match(id)
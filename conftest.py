@@ -0,0 +1,5 @@
+"""
+    The modules of the game sit in the root of the repository, next to this file,
+    so pytest puts the root on the import path and the tests in tests/ import
+    them by name, the same way the servers and the scripts do.
+"""
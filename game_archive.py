@@ -0,0 +1,439 @@
+import json
+import logging
+import sqlite3
+import struct
+import threading
+import time
+
+"""
+    Imports
+    -------
+    json
+    logging
+    sqlite3
+    struct
+    threading
+    time
+
+    Data
+    ----------
+    RECORD: struct.Struct
+        header of a game record: record size, ids of the players, unix times of the start and the end,
+        rows, cols, win_length, flags and the number of moves
+    NO_PLAYER: int
+        id stored for a missing player
+    MAX_PLAYER: int
+        largest player id the archive can keep, the ids are signed 64 bit integers
+    FIRST_WINS, SECOND_WINS, DRAW: int
+        result of an archived game
+    RESULTS: dict
+        results by name, as accepted by the command line
+    QUERY_PAGE: int
+        number of offsets read from the index at once by a query
+    logger: logging.Logger
+        logger of the games that cannot be archived
+
+    The archive is a file of records appended one after another. The moves of a
+    game are packed with as few bits per move as the board needs, 4 bits on the
+    3x3 board, so a finished 3x3 game takes about 40 bytes. The first bit of the
+    flags is set when the first player plays 'o', the next two bits are the result.
+    An SQLite index next to the archive maps the players, the result and the end
+    of every game to the offset of its record, so queries read only the matching
+    records and exports stream the file without loading it.
+
+    The sides of the board are kept in 16 bits and the size of the record in 32
+    bits, so every board the servers accept fits, but only integer player ids
+    can be archived. The servers hand the finished rooms to add_room, which
+    encodes the record at once and leaves the writes of the file and the index
+    to a writer thread, so no request waits for the disk. A game that cannot be
+    encoded is logged and skipped, it never fails the request that ended it.
+"""
+
+RECORD = struct.Struct('<IqqIIHHHBH')
+NO_PLAYER = -2 ** 63
+MAX_PLAYER = 2 ** 63 - 1
+FIRST_WINS, SECOND_WINS, DRAW = 1, 2, 3
+RESULTS = {'first': FIRST_WINS, 'second': SECOND_WINS, 'draw': DRAW}
+QUERY_PAGE = 1000
+logger = logging.getLogger(__name__)
+
+
+def tile_bits(rows, cols):
+    """ returns the number of bits needed to store the id of a tile
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :return: number of bits per move
+    """
+
+    return max(1, (rows * cols - 1).bit_length())
+
+
+def encode_game(players, first_marker, dimensions, moves, winner, started, finished):
+    """ builds the record of a finished game
+
+    :param players: ids of the first and the second player
+    :param first_marker: marker of the first player 'x' or 'o'
+    :param dimensions: (rows, cols, win_length) of the board
+    :param moves: ids of the taken tiles in the order of the moves
+    :param winner: id of the winner, None for a draw
+    :param started: unix time of the start of the game
+    :param finished: unix time of the end of the game
+    :return: bytes of the record
+    :raises ValueError: if a player id is not an integer of 64 bits or the game does not fit the record
+    """
+
+    for player in players:
+        if player is not None and (not isinstance(player, int) or isinstance(player, bool)
+                                   or not NO_PLAYER < player <= MAX_PLAYER):
+            raise ValueError("The archive keeps only integer player ids, not %r." % (player,))
+    rows, cols, win_length = dimensions
+    bits = tile_bits(rows, cols)
+    packed = 0
+    for i, tile_id in enumerate(moves):
+        packed |= tile_id << (i * bits)
+    payload = packed.to_bytes((len(moves) * bits + 7) // 8, 'little')
+    if winner is None:
+        result = DRAW
+    else:
+        result = FIRST_WINS if winner == players[0] else SECOND_WINS
+    flags = (first_marker == 'o') | result << 1
+    player1, player2 = (NO_PLAYER if player is None else player for player in players)
+    try:
+        return RECORD.pack(RECORD.size + len(payload), player1, player2, int(started or 0), int(finished or 0),
+                           rows, cols, win_length, flags, len(moves)) + payload
+    except struct.error as error:
+        raise ValueError("The game does not fit the record: %s." % error)
+
+
+def decode_game(record, offset=None):
+    """ reads the game from its record
+
+    :param record: bytes of the record
+    :param offset: offset of the record in the archive, added to the game if it is given
+    :return: dictionary with 'players', 'markers', 'dimensions', 'moves', 'result', 'winner', 'started', 'finished'
+    """
+
+    size, player1, player2, started, finished, rows, cols, win_length, flags, count = RECORD.unpack_from(record)
+    bits = tile_bits(rows, cols)
+    packed = int.from_bytes(record[RECORD.size:size], 'little')
+    mask = (1 << bits) - 1
+    players = [None if player == NO_PLAYER else player for player in (player1, player2)]
+    result = flags >> 1
+    game = {
+        'players': players,
+        'markers': ['o', 'x'] if flags & 1 else ['x', 'o'],
+        'dimensions': [rows, cols, win_length],
+        'moves': [(packed >> (i * bits)) & mask for i in range(count)],
+        'result': result,
+        'winner': None if result == DRAW else players[result - 1],
+        'started': started,
+        'finished': finished,
+    }
+    if offset is not None:
+        game['offset'] = offset
+    return game
+
+
+class GameArchive:
+    """
+    A class used to keep the finished games in a compact file with an index
+
+    Attributes
+    ----------
+    path: str
+        path of the archive, the index is kept in path + '.idx'
+
+    Methods:
+    ----------
+    add(players, first_marker, dimensions, moves, winner, started, finished)
+        appends the game to the archive
+    add_room(room)
+        hands the finished game of the room to the writer thread
+    flush()
+        waits until the games handed to add_room are written
+    read(offset)
+        reads the game stored at the offset
+    query(player, result, since, until, limit)
+        yields the games matching the filters, found with the index
+    iter_games()
+        yields all games in the order they were archived
+    export(file, **filters)
+        writes the games as JSON lines
+    close()
+        writes the games still waiting, stops the writer thread and closes the archive and its index
+    """
+
+    def __init__(self, path):
+        """ opens the archive, creating it if needed, and indexes the records missing from the index
+
+        :param path: path of the archive
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        self._index = sqlite3.connect(path + ".idx", check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.execute("CREATE TABLE IF NOT EXISTS games (offset INTEGER PRIMARY KEY, player1 INTEGER, "
+                            "player2 INTEGER, result INTEGER, finished INTEGER)")
+        self._index.execute("CREATE INDEX IF NOT EXISTS games_player1 ON games (player1, finished)")
+        self._index.execute("CREATE INDEX IF NOT EXISTS games_player2 ON games (player2, finished)")
+        self._index.execute("CREATE INDEX IF NOT EXISTS games_result ON games (result, finished)")
+        self._index.execute("CREATE INDEX IF NOT EXISTS games_finished ON games (finished)")
+        self._index.commit()
+        self._reindex()
+        self._pending = []
+        self._writing = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="game-archive", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ writes the games still waiting, stops the writer thread and closes the archive and its index
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        with self._lock:
+            self._file.close()
+            self._index.close()
+
+    def _run(self):
+        """ writes the records handed to add_room in batches, one commit of the index per batch
+            a batch that cannot be written is logged and dropped, the archive only records the finished games
+        """
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+                self._writing = True
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                logger.exception("%d games cannot be written to the archive.", len(batch))
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+            if closed:
+                return
+
+    def flush(self):
+        """ waits until the games handed to add_room are written, so read and query find them
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._writing or self._closed)
+
+    def _reindex(self):
+        """ indexes the records appended after the last indexed one, left by a crash between the two writes
+            a record cut short by a crash is removed from the end of the archive
+        """
+
+        last = self._index.execute("SELECT MAX(offset) FROM games").fetchone()[0]
+        offset = 0
+        if last is not None:
+            self._file.seek(last)
+            offset = last + RECORD.unpack(self._file.read(RECORD.size))[0]
+        end = self._file.seek(0, 2)
+        while offset < end:
+            self._file.seek(offset)
+            header = self._file.read(RECORD.size)
+            if len(header) < RECORD.size or offset + RECORD.unpack(header)[0] > end:
+                self._file.truncate(offset)
+                break
+            game = decode_game(header + self._file.read(RECORD.unpack(header)[0] - RECORD.size))
+            self._insert(offset, game['players'], game['result'], game['finished'])
+            offset += RECORD.unpack(header)[0]
+        self._index.commit()
+
+    def _insert(self, offset, players, result, finished):
+        """ adds the record to the index
+
+        :param offset: offset of the record in the archive
+        :param players: ids of the players
+        :param result: FIRST_WINS, SECOND_WINS or DRAW
+        :param finished: unix time of the end of the game
+        """
+
+        self._index.execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?)",
+                            (offset, players[0], players[1], result, int(finished or 0)))
+
+    def add(self, players, first_marker, dimensions, moves, winner, started=None, finished=None):
+        """ appends the game to the archive and to the index
+
+        :param players: ids of the first and the second player
+        :param first_marker: marker of the first player 'x' or 'o'
+        :param dimensions: (rows, cols, win_length) of the board
+        :param moves: ids of the taken tiles in the order of the moves
+        :param winner: id of the winner, None for a draw
+        :param started: unix time of the start of the game, default the end of the game
+        :param finished: unix time of the end of the game, default now
+        :return: offset of the record
+        """
+
+        finished = time.time() if finished is None else finished
+        started = finished if started is None else started
+        return self._write([encode_game(players, first_marker, dimensions, moves, winner, started, finished)])[0]
+
+    def _write(self, records):
+        """ appends the records to the archive and to the index, with one commit of the index
+
+        :param records: list of records returned by encode_game
+        :return: list of the offsets of the records
+        """
+
+        offsets = []
+        with self._lock:
+            offset = self._file.seek(0, 2)
+            for record in records:
+                game = decode_game(record)
+                self._file.write(record)
+                self._insert(offset, game['players'], game['result'], game['finished'])
+                offsets.append(offset)
+                offset += len(record)
+            self._file.flush()
+            self._index.commit()
+        return offsets
+
+    def add_room(self, room):
+        """ encodes the finished game of the room and hands it to the writer thread, so the caller never waits
+            for the disk, a game that cannot be archived, e.g. one with a player id that is not an integer,
+            is logged and skipped
+
+        :param room: GameRoom with a result
+        :return: True if the game is handed to the writer, False if it is skipped
+        """
+
+        with room.lock:
+            players = (room.players['player1'], room.players['player2'])
+            finished = time.time() if room.finished is None else room.finished
+            started = finished if room.started is None else room.started
+            game = (players, room.markers.get(players[0], 'x'), room.dimensions, list(room.moves),
+                    room.result['winner'], started, finished)
+        try:
+            record = encode_game(*game)
+        except ValueError as error:
+            logger.warning("The game of the room %s is not archived: %s", room.room_id, error)
+            return False
+        with self._condition:
+            if self._closed:
+                logger.warning("The game of the room %s is not archived: the archive is closed.", room.room_id)
+                return False
+            self._pending.append(record)
+            self._condition.notify_all()
+        return True
+
+    def read(self, offset):
+        """ reads the game stored at the offset
+
+        :param offset: offset of the record
+        :return: dictionary returned by decode_game
+        """
+
+        with self._lock:
+            self._file.seek(offset)
+            header = self._file.read(RECORD.size)
+            return decode_game(header + self._file.read(RECORD.unpack(header)[0] - RECORD.size), offset)
+
+    def query(self, player=None, result=None, since=None, until=None, limit=None):
+        """ yields the games matching all given filters in the order they were archived
+            the offsets are read from the index a page at a time, so games can be added during the query
+
+        :param player: id of a player of the game
+        :param result: FIRST_WINS, SECOND_WINS or DRAW
+        :param since: unix time, the game ended at or after it
+        :param until: unix time, the game ended before it
+        :param limit: maximum number of games
+        :return: generator of games
+        """
+
+        conditions, arguments = ["offset > ?"], []
+        if player is not None:
+            conditions.append("(player1 = ? OR player2 = ?)")
+            arguments += [player, player]
+        if result is not None:
+            conditions.append("result = ?")
+            arguments.append(result)
+        if since is not None:
+            conditions.append("finished >= ?")
+            arguments.append(int(since))
+        if until is not None:
+            conditions.append("finished < ?")
+            arguments.append(int(until))
+        sql = "SELECT offset FROM games WHERE " + " AND ".join(conditions) + " ORDER BY offset LIMIT ?"
+        last, remaining = -1, limit
+        while remaining is None or remaining > 0:
+            page = QUERY_PAGE if remaining is None else min(QUERY_PAGE, remaining)
+            with self._lock:
+                offsets = [row[0] for row in self._index.execute(sql, [last] + arguments + [page])]
+            for offset in offsets:
+                yield self.read(offset)
+            if len(offsets) < page:
+                return
+            last = offsets[-1]
+            if remaining is not None:
+                remaining -= len(offsets)
+
+    def iter_games(self):
+        """ yields all games in the order they were archived, reading the archive sequentially
+
+        :return: generator of games
+        """
+
+        with open(self.path, 'rb', buffering=1 << 20) as file:
+            offset = 0
+            while True:
+                header = file.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                yield decode_game(header + file.read(RECORD.unpack(header)[0] - RECORD.size), offset)
+                offset += RECORD.unpack(header)[0]
+
+    def export(self, file, **filters):
+        """ writes the games as JSON lines, all games or the ones matching the filters of query
+
+        :param file: text file to write to
+        :param filters: arguments of query
+        :return: number of written games
+        """
+
+        games = self.query(**filters) if any(value is not None for value in filters.values()) else self.iter_games()
+        count = 0
+        for game in games:
+            file.write(json.dumps(game) + "\n")
+            count += 1
+        return count
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="Exports the games of the archive as JSON lines")
+    parser.add_argument("archive", help="path of the archive")
+    parser.add_argument("--player", type=int, default=None, help="id of a player of the game")
+    parser.add_argument("--result", choices=sorted(RESULTS), default=None, help="result of the game")
+    parser.add_argument("--since", default=None, help="ISO date, the game ended at or after it")
+    parser.add_argument("--until", default=None, help="ISO date, the game ended before it")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of games")
+    args = parser.parse_args()
+    with GameArchive(args.archive) as archive:
+        archive.export(sys.stdout, player=args.player, result=RESULTS.get(args.result),
+                       since=datetime.fromisoformat(args.since).timestamp() if args.since else None,
+                       until=datetime.fromisoformat(args.until).timestamp() if args.until else None,
+                       limit=args.limit)
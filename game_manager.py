@@ -1,8 +1,12 @@
-import sys
-import re
+import time
+import requests
 from board import Board
+from players import AIPlayer, ConsolePlayer, ConsoleOutput
 import client
 
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 1.0
+
 
 class GameManager:
     """
@@ -10,15 +14,23 @@ class GameManager:
 
     Imports
     ----------
-        sys
-        re
+        time
+        requests
         Board
+        AIPlayer, ConsolePlayer, ConsoleOutput
         client
 
+    Data
+    ----------
+        POLL_INTERVAL: float
+            first pause of a client polling for the marker without the event stream, doubled after every poll
+        MAX_POLL_INTERVAL: float
+            longest pause of a client polling for the marker
+
     Attributes
     ----------
     board: Board
-        represents a board for a game tic-tac-toe
+        represents a board for a game tic-tac-toe, Board or BitBoard
     current_player: int
         stores information about which player has a turn
     id: int
@@ -27,6 +39,25 @@ class GameManager:
         number describing order in which player joined the server
     my_marker: str
         player marker x or o
+    client: GameClient
+        connection to the server, bound to the room in which the game is played
+    events: generator
+        stream of changes pushed by the server, None when the client polls instead
+    player: ConsolePlayer
+        makes the decisions of the player: the id, the marker, the tiles and the replay
+    output: ConsoleOutput
+        shows the messages and the boards
+    move_protocol: bool
+        True if only the moves are sent and the server keeps the board and decides the result,
+        False if the whole board is sent and the result is checked locally
+    result: dict
+        result of the game reported by the server, None until the game is over
+    outcome: str
+        'won', 'lost' or 'draw' once the game is over, None before
+    match: bool
+        True if the room is chosen by the matchmaking of the server instead of being given
+    skill: float
+        rating of the player used by the matchmaking, None to be paired with anybody
 
     Methods:
     ----------
@@ -41,79 +72,78 @@ class GameManager:
     place_marker()
         places the appropriate marker on the board
     has_ended()
-        checks if the game has finished
+        checks if the game has finished and reports the outcome
     generate_id()
         sets the player id
+    wait_for_marker()
+        waits until the first player has chosen the marker and returns the other one
+    wait_for_turn()
+        waits until the player has a turn
     play_game()
-        controls the game
+        controls the game and returns its outcome
     """
 
-    def __init__(self):
+    def __init__(self, room=None, game_client=None, board=None, ai=None, player_id=None, move_protocol=True,
+                 player=None, output=None, match=False, skill=None):
         """ sets default values
 
-            :param board
+            :param room: id of the server room, default None
+            :param game_client: GameClient used to talk to the server, default client of the client module
+            :param board: empty board to play on, default Board
+            :param ai: AIEngine seated in place of the user, default None
+            :param player_id: id of the player, default None (chosen by the player)
+            :param move_protocol: send only the moves to the server, default True
+            :param player: player making the decisions, default AIPlayer with the ai or ConsolePlayer
+            :param output: output showing the messages and the boards, default ConsoleOutput
+            :param match: let the server pair the player with a waiting one in a new room, default False
+            :param skill: rating of the player used by the matchmaking, default None
             :param current_player: default None
             :param id: default 0000
             :param player_number: default 0
             :param my_marker:
         """
 
-        self._board = Board()
+        self._board = board if board is not None else Board()
         self._current_player = None
-        self._id = 0000
+        self._id = 0000 if player_id is None else player_id
+        self._id_given = player_id is not None
         self._player_number = 0
         self._my_marker = ' '
+        self._client = game_client if game_client is not None else client.default_client(room)
+        self._events = None
+        if player is None:
+            player = AIPlayer(ai) if ai is not None else ConsolePlayer()
+        self._player = player
+        self._output = output if output is not None else ConsoleOutput()
+        self._move_protocol = move_protocol
+        self._result = None
+        self._outcome = None
+        self._match = match
+        self._skill = skill
 
     def marker_choice(self):
-        """ asks for selection and sets the player marker
-            if the selected marker is inappropriate, repeats the question
+        """ lets the player choose the marker
 
         :return: selected marker 'x' or 'o' in str format
         """
 
-        while True:
-            marker = input("Please choose your marker (x or o): ")
-            if str(marker).isalpha() and len(marker) == 1:
-                if marker.lower() == 'x' or marker.lower() == 'o':
-                    return marker.lower()
-            print("It's not a valid symbol.")
+        return self._player.choose_marker()
 
     def replay_choice(self):
-        """asks for a replay of the game
-           if the selected answer is inappropriate, repeats the question
-
+        """ lets the player answer if they want to play again
 
         :return: True if player want to play again or False if not
         """
-        while True:
-            answer_play = input("Do you want to play again? (y or n): ")
-            if str(answer_play).isalpha() and len(answer_play) == 1:
-                if answer_play.lower() == 'y':
-                    return True
-                elif answer_play.lower() == 'n':
-                    return False
-                else:
-                    print("It's not a valid symbol.")
+
+        return self._player.choose_replay()
 
     def tile_choice(self):
-        """ asks for the field in which the user wants to put a marker
-            if the selected field is not available or elected answer is inappropriate, repeats the question
+        """ lets the player choose an empty tile
 
-        :return: number of the selected field in string format
+        :return: id of the selected tile
         """
 
-        while True:
-            print("Current player: " + str(self._my_marker))
-            tile_id = input("Please choose an unoccupied tile - from 1 to 9. ")
-            num_format = re.compile(r'^[1-9]$')
-            if re.match(num_format, tile_id):
-                tile_id = int(tile_id) - 1
-                if self._board.check_can_place(tile_id):
-                    return tile_id
-                else:
-                    print("This tile is occupied.")
-            else:
-                print("It's not a valid symbol.")
+        return self._player.choose_tile(self._board, self._my_marker)
 
     def set_player(self):
         """ assigns the selected marker to the player
@@ -121,89 +151,228 @@ class GameManager:
         """
 
         self._my_marker = self.marker_choice()
-        client.post_marker(self._my_marker, self._id)
+        self._client.post_marker(self._my_marker, self._id)
 
     def place_marker(self):
         """ sets the user marker in the selected place
-            sends this information to the server by calling post_tile(my_marker) from class client
+            with the move protocol sends only the tile and takes the board and the result from the response,
+            otherwise sends the new board and then the tile, so the board is already there when the turn passes
         """
 
         tile_id = self.tile_choice()
+        if self._move_protocol:
+            while True:
+                response = self._client.post_move(tile_id, self._id)
+                self._board.set_state(response['board'])
+                self._current_player = response['current_player']
+                self._result = response['result']
+                if response['ok'] or self._result is not None or self._current_player != self._id:
+                    return
+                self._output.message(response['prompt'])
+                tile_id = self.tile_choice()
         marker = self._my_marker
         self._board.place(marker, tile_id)
-        client.post_tile(tile_id, self._id)
+        self._client.post_board(self._id, self._board.get_state())
+        self._client.post_tile(tile_id, self._id)
 
     def has_ended(self):
         """ checks if the game has finished
-            informs the user about the result of the game: win, lose, draw
+            informs the player about the result of the game: win, lose, draw
+            the result reported by the server is used when it is known
 
-        :return: False if the game is not over
+        :return: True if the game is over, False if it is not
         """
 
-        if self._board.check_win():
-            if self._id != client.get_current_player():
-                print("Congratulations! You won!")
+        if self._outcome is not None:
+            return True
+        if self._result is not None:
+            if self._result['winner'] is None:
+                self._outcome = 'draw'
+            elif self._result['winner'] == self._id:
+                self._outcome = 'won'
             else:
-                print("You lost!")
-            sys.exit(0)
+                self._outcome = 'lost'
+        elif self._move_protocol:
+            return False
+        elif self._board.check_win():
+            self._outcome = 'won' if self._id != self._client.get_current_player() else 'lost'
         elif self._board.check_full():
-            print("It's a draw!")
-            sys.exit(0)
-        return False
+            self._outcome = 'draw'
+        else:
+            return False
+        self._output.message({'won': "Congratulations! You won!", 'lost': "You lost!",
+                              'draw': "It's a draw!"}[self._outcome])
+        return True
 
     def generate_id(self):
-        """ allows the user to set an id
+        """ lets the player set an id, unless it has been given to the constructor
+        """
+
+        if not self._id_given:
+            self._id = self._player.choose_id()
+            self._id_given = True
+
+    def wait_for_marker(self):
+        """ waits until the first player has chosen the marker and returns the other one
+            listens to the server event stream and falls back to polling with a doubling pause
+            when the stream is not available
+
+        :return: marker of the second player 'x' or 'o'
+        """
+
+        if self._events is not None:
+            try:
+                for event, data in self._events:
+                    if event == 'marker':
+                        break
+                    if event == 'state' and str(data['players']['player1']) in data['markers']:
+                        self._events = _resume((event, data), self._events)
+                        break
+                else:
+                    self._events = None
+            except (requests.RequestException, ValueError):
+                self._events = None
+        pause = POLL_INTERVAL
+        marker = self._client.get_second_player_marker()
+        while marker != 'x' and marker != 'o':
+            time.sleep(pause)
+            pause = min(2 * pause, MAX_POLL_INTERVAL)
+            marker = self._client.get_second_player_marker()
+        return marker
+
+    def wait_for_turn(self):
+        """ waits until the player has a turn
+            listens to the server event stream and falls back to long-polling when the stream is not available,
+            then gets the board and the turn together with a conditional request
+
+        :return: True if the current board has been pushed by the server, False if it has to be fetched
         """
 
-        print("Please enter your id (must be an integer): ")
-        while True:
+        if self._events is not None:
             try:
-                id = int(input())
-                self._id = id
-                break
-            except ValueError:
-                print("Id must be an integer, please enter a correct number: ")
+                for event, data in self._events:
+                    if event == 'state':
+                        self._current_player = data['current_player']
+                        self._result = data.get('result')
+                        if data['board']:
+                            self._board.set_state(data['board'])
+                        if self._current_player == self._id or self._result is not None:
+                            return bool(data['board'])
+                    elif event == 'board':
+                        self._board.set_state(data)
+                    elif event == 'turn':
+                        self._current_player = data
+                        if self._current_player == self._id or self._result is not None:
+                            return True
+                    elif event == 'game_over':
+                        self._result = data
+            except (requests.RequestException, ValueError):
+                pass
+            self._events = None
+        state = self._client.get_state()
+        while state['current_player'] != self._id and state['result'] is None:
+            self._client.wait_for_turn(self._id)
+            state = self._client.get_state()
+        self._current_player = state['current_player']
+        self._result = state['result']
+        if state['board']:
+            self._board.set_state(state['board'])
+        return bool(state['board'])
 
     def play_game(self):
-        """controls the game by calling methods form class Board, file client.py and self methods
+        """ controls the game by calling methods form class Board, file client.py and self methods
+
+        :return: 'won', 'lost' or 'draw', None if the room is full
         """
 
-        print("Welcome to Tick-Tack-Toe!")
+        self._output.message("Welcome to Tick-Tack-Toe!")
         self.generate_id()
-        connection_response = client.post_connect(self._id)
-        print(connection_response['prompt'])
+        if self._match:
+            self._output.message("Looking for an opponent...")
+            room_id = self._client.find_match(self._id, self._skill, self._board.get_dimensions())
+            self._client = self._client.with_room(room_id)
+        connection_response = self._client.post_connect(self._id, self._board.get_dimensions())
+        self._output.message(connection_response['prompt'])
         if connection_response['number'] == -1:
-            sys.exit(0)
+            return None
+        dimensions = tuple(connection_response.get('dimensions', self._board.get_dimensions()))
+        if dimensions != self._board.get_dimensions():
+            self._board = type(self._board)(*dimensions)
         self._player_number = connection_response['number']
-        while True:
+        self._events = self._client.stream_events(self._id)
+        try:
             if self._player_number == 1:
                 self.set_player()
-                client.post_board(self._id, self._board._state)
+                if not self._move_protocol:
+                    self._client.post_board(self._id, self._board.get_state())
             elif self._player_number == 2:
                 self._current_player = 1
-                while True:
-                    marker = client.get_second_player_marker()
-                    if marker == 'x' or marker == 'o':
-                        self._my_marker = marker
-                        break
+                self._my_marker = self.wait_for_marker()
             elif self._player_number == 3:
-                self._my_marker = client.get_first_player_marker()
-                self._board._state = client.get_board()
-                self._current_player = client.get_current_player()
-                self._player_number == 1
+                self._my_marker = self._client.get_first_player_marker()
+                self._board.set_state(self._client.get_board())
+                self._current_player = self._client.get_current_player()
             elif self._player_number == 4:
-                self._my_marker = client.get_second_player_marker()
-                self._board._state = client.get_board()
-                self._current_player = client.get_current_player()
-                self._player_number == 2
+                self._my_marker = self._client.get_second_player_marker()
+                self._board.set_state(self._client.get_board())
+                self._current_player = self._client.get_current_player()
             while not self.has_ended():
-                self._current_player = int(client.get_current_player())
-                while self._current_player != self._id:
-                    self._current_player = int(client.get_current_player())
-                self._board.set_state(client.get_board())
-                self._board.draw_from_state()
+                if not self.wait_for_turn():
+                    self._board.set_state(self._client.get_board())
+                self._output.show_board(self._board)
                 if self.has_ended():
                     break
                 self.place_marker()
-                self._board.draw_from_state()
-                client.post_board(self._id, self._board._state)
+                self._output.show_board(self._board)
+        finally:
+            if self._events is not None:
+                self._events.close()
+        return self._outcome
+
+
+def _resume(first, events):
+    """ puts the event taken from the stream back in front of it, the snapshot may already give the turn
+
+    :param first: (event, data) tuple
+    :param events: generator of the rest of the stream
+    :return: generator of (event, data) tuples
+    """
+
+    try:
+        yield first
+        yield from events
+    finally:
+        events.close()
+
+
+def watch_game(game_client, board=None, output=None):
+    """ shows the game played in the room of the client to a read-only spectator until it is over
+
+    :param game_client: GameClient bound to the room of the game
+    :param board: empty board the game is shown on, default Board
+    :param output: output showing the messages and the boards, default ConsoleOutput
+    :return: result of the game, None if the stream ended before the game
+    """
+
+    board = board if board is not None else Board()
+    output = output if output is not None else ConsoleOutput()
+    result = None
+    for event, data in game_client.watch():
+        if event == 'state':
+            dimensions = tuple(data['dimensions'])
+            if dimensions != board.get_dimensions():
+                board = type(board)(*dimensions)
+            if data['board']:
+                board.set_state(list(data['board']))
+                output.show_board(board)
+            result = data['result']
+        elif event == 'board':
+            if len(data) != len(board.get_state()):
+                board = type(board)(*game_client.get_state()['dimensions'])
+            board.set_state(list(data))
+            output.show_board(board)
+        elif event == 'game_over':
+            result = data
+    if result is not None:
+        output.message("It's a draw!" if result['winner'] is None else "Player " + str(result['winner']) + " won!")
+    return result
@@ -0,0 +1,1040 @@
+import json
+import time
+import threading
+import uuid
+from collections import OrderedDict, deque
+from board import Board
+import wire
+
+"""
+    Imports
+    -------
+    json
+    time
+    threading
+    uuid
+    OrderedDict, deque
+    Board
+    wire
+
+    Data
+    ----------
+    DEFAULT_ROOM: str
+        id of the room used by the routes that do not name a room
+    EVENT_HISTORY: int
+        number of the latest events kept by every room for the clients that lag behind
+    SPECTATOR_BACKLOG: int
+        number of changes a spectator may lag behind before it gets only the latest snapshot
+    MAX_TILES: int
+        largest number of tiles of a board a client may ask for
+    CLOSED_EVENT: bytes
+        last Server-Sent Event of the streams of a room removed from the registry
+"""
+
+DEFAULT_ROOM = "default"
+EVENT_HISTORY = 64
+SPECTATOR_BACKLOG = 16
+MAX_TILES = 10000
+CLOSED_EVENT = b"event: closed\ndata: null\n\n"
+
+
+def check_dimensions(dimensions):
+    """ checks the dimensions of the board proposed by a client
+
+    :param dimensions: (rows, cols, win_length) of the board
+    :return: tuple of three ints
+    :raises ValueError: if the dimensions are not three positive ints with win_length at most the longer side,
+                        or the board has more than MAX_TILES tiles
+    """
+
+    if not isinstance(dimensions, (list, tuple)) or len(dimensions) != 3:
+        raise ValueError("The dimensions must be rows, columns and the winning length.")
+    if not all(isinstance(value, int) and not isinstance(value, bool) and value > 0 for value in dimensions):
+        raise ValueError("The dimensions must be positive integers.")
+    rows, cols, win_length = dimensions
+    if win_length > max(rows, cols):
+        raise ValueError("The winning length cannot be longer than the board.")
+    if rows * cols > MAX_TILES:
+        raise ValueError("The board cannot have more than %d tiles." % MAX_TILES)
+    return rows, cols, win_length
+
+
+class GameRoom:
+    """
+    A class used to represent a single game hosted by the server
+
+    Attributes
+    ----------
+    room_id: str
+        identifies the room in the registry
+    players: dict
+        a dictionary that stores id players
+    markers: dict
+        a dictionary that stores players markers
+    board: list
+        a list that stores players' moves
+    game: Board
+        the board kept by the server, the one the moves of the move protocol are played on
+    current_player: int
+        stores the id of the player who currently has a turn
+    current_tile: int
+        stores the id of the tile that was last selected by the player
+    dimensions: tuple
+        (rows, cols, win_length) of the board, chosen by the first player
+    result: dict
+        stores the result of a finished game, None while the game is played
+    reserved: tuple
+        ids of the only players allowed to take the seats, None if anybody can join
+    moves: list
+        ids of the tiles taken by the players, in the order of the moves
+    started: float
+        unix time of the connection of the first player, None before it
+    finished: float
+        unix time of the end of the game, None while the game is played
+    version: int
+        number of the latest change of the room, increased by every change
+    epoch: str
+        random tag of this room, so a version of a removed room never matches a version of a new one
+    events: deque
+        the latest changes of the room as (version, event, data) tuples
+    last_active: float
+        monotonic time of the last request that used the room
+    lock: threading.Condition
+        serializes the requests that modify the room and wakes up the waiting ones
+    listeners: set
+        callables called after every change of the room, used by the servers that cannot block on the lock
+    journal: MoveLog
+        log the requests that changed the room are appended to, None if the room is kept only in memory
+    closed: bool
+        True once the room is removed from the registry, its streams end with a 'closed' event
+
+    Methods:
+    ----------
+    touch()
+        marks the room as used right now
+    close()
+        ends the streams of the room removed from the registry
+    snapshot()
+        returns the whole state of the room
+    to_dict()
+        returns the state needed to restore the room
+    sync(data)
+        replaces the state of the room with the state changed by another process
+    from_dict(data)
+        creates the room from the state returned by to_dict
+    state()
+        returns the serialized snapshot and its entity tag
+    wire_state()
+        returns the snapshot in the compact encoding and its entity tag
+    apply(data)
+        recognizes the request of a client by its keys and applies it
+    wait_for_turn(player_id, timeout)
+        blocks until the player has a turn or the timeout expires
+    wait_for_events(version, timeout)
+        blocks until there are changes newer than the version and returns them
+    frames(version, timeout, backlog)
+        blocks until there are changes newer than the version and returns them as Server-Sent Events
+    reserve(player_ids)
+        keeps the seats for the given players
+    connect(player_id, dimensions)
+        seats the player in the room
+    set_marker(player_id, marker)
+        sets the marker chosen by the first player
+    set_tile(player_id, tile_id)
+        sets the last selected tile and passes the turn
+    set_board(player_id, board)
+        sets the current board
+    move(player_id, tile_id)
+        validates and plays the move of the player
+    marker_of(player_id)
+        returns the marker of the player
+    switch_player()
+        changes the player who has a turn
+    first_player_marker()
+        returns the marker of the first player
+    second_player_marker()
+        returns the marker of the second player
+    """
+
+    def __init__(self, room_id):
+        """ sets the default values of an empty room
+
+        :param room_id: id of the room
+        """
+
+        self.room_id = room_id
+        self.players = {"player1": None, "player2": None}
+        self.markers = {}
+        self.board = []
+        self.current_player = None
+        self.current_tile = 0
+        self.dimensions = (3, 3, 3)
+        self.game = Board()
+        self.result = None
+        self.reserved = None
+        self.moves = []
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self._state = None
+        self._wire = None
+        self._frames = {}
+        self._snapshot_frame = None
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.last_active = time.monotonic()
+        self.lock = threading.Condition(threading.RLock())
+        self.listeners = set()
+        self.journal = None
+        self.closed = False
+
+    def touch(self):
+        """ marks the room as used right now
+        """
+
+        self.last_active = time.monotonic()
+
+    def close(self):
+        """ marks the room removed from the registry, e.g. cleared or evicted, and wakes up its streams,
+            so they send a 'closed' event and end instead of waiting for changes that never come
+        """
+
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.lock.notify_all()
+            for listener in list(self.listeners):
+                listener()
+
+    def _notify(self, event, data):
+        """ records the change of the room and wakes up the requests waiting for it
+
+        :param event: name of the change: 'reserved', 'player', 'marker', 'turn', 'board' or 'game_over'
+        :param data: json serializable description of the change
+        """
+
+        with self.lock:
+            self.version += 1
+            self.events.append((self.version, event, data))
+            self.lock.notify_all()
+            for listener in list(self.listeners):
+                listener()
+
+    def snapshot(self):
+        """ returns the whole state of the room
+
+        :return: json serializable dictionary
+        """
+
+        with self.lock:
+            return {
+                'players': dict(self.players),
+                'markers': {str(player): marker for player, marker in self.markers.items()},
+                'board': self.board,
+                'current_player': self.current_player,
+                'current_tile': self.current_tile,
+                'dimensions': list(self.dimensions),
+                'result': self.result,
+                'version': self.version,
+            }
+
+    def state(self):
+        """ returns the snapshot serialized once per version, with an entity tag made of the epoch and the version
+
+        :return: tuple (etag, json encoded snapshot)
+        """
+
+        with self.lock:
+            if self._state is None or self._state[0] != self.version:
+                self._state = (self.version, self.epoch + "-" + str(self.version), json.dumps(self.snapshot()))
+            return self._state[1], self._state[2]
+
+    def wire_state(self):
+        """ returns the snapshot in the compact encoding of the wire module, encoded once per version,
+            with the same entity tag as state()
+
+        :return: tuple (etag, bytes), the bytes are None if the room cannot be encoded
+        """
+
+        with self.lock:
+            if self._wire is None or self._wire[0] != self.version:
+                try:
+                    data = wire.encode_state_record(self.snapshot())
+                except ValueError:
+                    data = None
+                self._wire = (self.version, data)
+            return self.epoch + "-" + str(self.version), self._wire[1]
+
+    def to_dict(self):
+        """ returns the state needed to restore the room, the events and the waiting requests are not kept
+
+        :return: json serializable dictionary
+        """
+
+        with self.lock:
+            state = self.snapshot()
+            state['room_id'] = self.room_id
+            state['epoch'] = self.epoch
+            state['reserved'] = list(self.reserved) if self.reserved is not None else None
+            state['moves'] = list(self.moves)
+            state['started'] = self.started
+            state['finished'] = self.finished
+            return state
+
+    @classmethod
+    def from_dict(cls, data):
+        """ creates the room from the state returned by to_dict
+
+        :param data: dictionary returned by to_dict
+        :return: GameRoom
+        """
+
+        room = cls(data['room_id'])
+        room._load(data)
+        return room
+
+    def _load(self, data):
+        """ sets the state of the room from the dictionary returned by to_dict
+            the keys of the markers are the player ids turned into strings by json, they are matched
+            with the seated players, so an id of any json type gets its marker back
+
+        :param data: dictionary returned by to_dict
+        """
+
+        self.players = dict(data['players'])
+        seated = {str(player): player for player in self.players.values() if player is not None}
+        self.markers = {seated.get(key, key): marker for key, marker in data['markers'].items()}
+        self.board = list(data['board'])
+        self.current_player = data['current_player']
+        self.current_tile = data['current_tile']
+        self.dimensions = tuple(data['dimensions'])
+        self.game = Board(*self.dimensions)
+        if len(self.board) == len(self.game.get_state()):
+            self.game.set_state(list(self.board))
+        self.result = data['result']
+        self.reserved = tuple(data['reserved']) if data.get('reserved') is not None else None
+        self.moves = list(data.get('moves', ()))
+        self.started = data.get('started')
+        self.finished = data.get('finished')
+        self.version = data['version']
+        self.epoch = data['epoch']
+
+    def sync(self, data):
+        """ replaces the state of the room with a newer state changed by another process
+            the waiting requests get a single 'state' event with the snapshot, an older state of the same epoch,
+            e.g. the state returned by a transaction that lost the race with a later one, is ignored
+
+        :param data: dictionary returned by to_dict
+        """
+
+        with self.lock:
+            if data['epoch'] == self.epoch and data['version'] <= self.version:
+                return
+            if data['epoch'] != self.epoch:
+                self.events.clear()
+                self._frames = {}
+            self._load(data)
+            self._state = None
+            self._wire = None
+            self._snapshot_frame = None
+            self.events.append((self.version, 'state', self.snapshot()))
+            self.lock.notify_all()
+            for listener in list(self.listeners):
+                listener()
+
+    def apply(self, data):
+        """ recognizes the request of a client by its keys and applies it
+            a request that changed the room is appended to the journal with the version it produced
+
+        :param data: decoded json body of the request
+        :return: response to the client
+        """
+
+        with self.lock:
+            version = self.version
+            if 'i_am_here' in data:
+                response = self.connect(data['id'], data.get('dimensions'))
+            elif 'marker' in data:
+                response = self.set_marker(data['id'], data['marker'])
+            elif 'current_board' in data:
+                response = self.set_board(data['id'], data['current_board'])
+            elif 'tile_id' in data:
+                response = self.set_tile(data['id'], data['tile_id'])
+            elif 'move' in data:
+                response = self.move(data['id'], data['move'])
+            elif 'reserve' in data:
+                response = self.reserve(data['reserve'])
+            else:
+                return None
+            if self.journal is not None and self.version != version:
+                self.journal.append(self.room_id, self.epoch, self.version, data)
+            return response
+
+    def wait_for_turn(self, player_id, timeout):
+        """ blocks until the player has a turn or the timeout expires
+
+        :param player_id: id of the waiting player
+        :param timeout: maximum number of seconds to wait
+        :return: id of the player who has a turn
+        """
+
+        with self.lock:
+            self.lock.wait_for(lambda: self.current_player == player_id, timeout)
+            return self.current_player
+
+    def wait_for_events(self, version, timeout):
+        """ blocks until there are changes newer than the version or the timeout expires
+            a client that lags behind the kept history gets a single 'state' event with the snapshot
+
+        :param version: version of the room already known to the client
+        :param timeout: maximum number of seconds to wait
+        :return: list of (version, event, data) tuples, empty if nothing has changed
+        """
+
+        with self.lock:
+            self.lock.wait_for(lambda: self.version != version, timeout)
+            if self.version == version:
+                return []
+            if version < 0 or not self.events or self.events[0][0] > version + 1:
+                return [(self.version, 'state', self.snapshot())]
+            return [event for event in self.events if event[0] > version]
+
+    def frames(self, version, timeout=0, backlog=None):
+        """ blocks until there are changes newer than the version or the timeout expires
+            and returns them as Server-Sent Events, every event is serialized once and shared by all streams
+            a stream that lags behind the kept history or more than backlog changes gets a single 'state' event,
+            so a slow stream never makes the room keep more than its history,
+            the events of a closed room end with CLOSED_EVENT, after which the stream has to end
+
+        :param version: version of the room already sent to the stream
+        :param timeout: maximum number of seconds to wait, default 0
+        :param backlog: maximum number of changes sent one by one, default None (the whole history)
+        :return: tuple (version sent after the returned events, list of encoded events)
+        """
+
+        with self.lock:
+            if timeout:
+                self.lock.wait_for(lambda: self.version != version or self.closed, timeout)
+            version, frames = self._encode(version, backlog)
+            if self.closed:
+                frames.append(CLOSED_EVENT)
+            return version, frames
+
+    def _encode(self, version, backlog):
+        """ returns the changes newer than the version as Server-Sent Events, the caller holds the lock
+
+        :param version: version of the room already sent to the stream
+        :param backlog: maximum number of changes sent one by one, None for the whole history
+        :return: tuple (version sent after the returned events, list of encoded events)
+        """
+
+        if self.version == version:
+            return version, []
+        if (version < 0 or not self.events or self.events[0][0] > version + 1
+                or backlog is not None and self.version - version > backlog):
+            if self._snapshot_frame is None or self._snapshot_frame[0] != self.version:
+                body = self.state()[1]
+                frame = ("id: %d\nevent: state\ndata: %s\n\n" % (self.version, body)).encode()
+                self._snapshot_frame = (self.version, frame)
+            return self.version, [self._snapshot_frame[1]]
+        frames = []
+        for event_version, event, data in self.events:
+            if event_version > version:
+                frame = self._frames.get(event_version)
+                if frame is None:
+                    frame = ("id: %d\nevent: %s\ndata: %s\n\n" % (event_version, event, json.dumps(data))).encode()
+                    self._frames[event_version] = frame
+                frames.append(frame)
+        if len(self._frames) > 2 * EVENT_HISTORY:
+            oldest = self.events[0][0]
+            self._frames = {key: frame for key, frame in self._frames.items() if key >= oldest}
+        return self.version, frames
+
+    def reserve(self, player_ids):
+        """ keeps the seats of the room for the given players, e.g. a pair matched by the matchmaker
+            only a room nobody has joined or reserved yet can be reserved, the servers never take this request
+            from a client, the matchmaker sends it through apply, so it is journaled like the other requests
+
+        :param player_ids: ids of the players allowed to join
+        :return: dictionary with 'ok'
+        """
+
+        with self.lock:
+            if self.reserved is not None or any(player is not None for player in self.players.values()):
+                return {'ok': False}
+            self.reserved = tuple(player_ids)
+            self._notify('reserved', list(self.reserved))
+            return {'ok': True}
+
+    def connect(self, player_id, dimensions=None):
+        """ connects the client to the room by id number
+            the first player chooses the dimensions of the board, the other players get them in the response
+
+        :param player_id: client id
+        :param dimensions: (rows, cols, win_length) of the board proposed by the client, default 3x3
+        :return: dictionary with communicate to client, number describing order in which player joined the room
+                 and dimensions of the board
+        """
+
+        if dimensions is not None and self.players['player1'] is None:
+            try:
+                dimensions = check_dimensions(dimensions)
+            except ValueError as error:
+                return {"prompt": str(error), "number": -1, "dimensions": list(self.dimensions)}
+        if self.reserved is not None and player_id not in self.reserved:
+            response = {"prompt": "This room is reserved for other players.", "number": -1}
+        elif self.players['player1'] is None:
+            self.players['player1'] = player_id
+            if dimensions is not None:
+                self.dimensions = dimensions
+                self.game = Board(*self.dimensions)
+            self.board = list(self.game.get_state())
+            self.started = time.time()
+            self.current_player = player_id
+            self._notify('player', {'number': 1, 'id': player_id})
+            self._notify('turn', player_id)
+            response = {"prompt": "You're player 1!", "number": 1}
+        elif self.players['player2'] is None:
+            self.players['player2'] = player_id
+            self._notify('player', {'number': 2, 'id': player_id})
+            if self.current_player is None:
+                self.current_player = player_id
+                self._notify('turn', player_id)
+            response = {"prompt": "You're player 2!", "number": 2}
+        elif self.players['player1'] == player_id:
+            response = {"prompt": "Player 1, welcome back!", "number": 3}
+        elif self.players['player2'] == player_id:
+            response = {"prompt": "Player 2, welcome back!", "number": 4}
+        else:
+            response = {"prompt": "There already is a maximum number of players.", "number": -1}
+        response['dimensions'] = list(self.dimensions)
+        return response
+
+    def set_marker(self, player_id, marker):
+        """ sets the marker chosen by the first player
+
+        :param player_id: id of the player sending the marker
+        :param marker: player marker 'x' or 'o'
+        :return: empty dict
+        """
+
+        if self.players['player1'] == player_id:
+            self.markers[player_id] = marker
+            self._notify('marker', {'id': player_id, 'marker': marker})
+        return {}
+
+    def set_tile(self, player_id, tile_id):
+        """ sets current tile id and passes the turn to the other player
+
+        :param player_id: id of the player sending the tile
+        :param tile_id: chosen tile id
+        :return: empty dict
+        """
+
+        self.current_tile = tile_id
+        self.switch_player()
+        self._notify('turn', self.current_player)
+        return {}
+
+    def set_board(self, player_id, board):
+        """ sets current board
+            if the board is a finished game the player sending it is recorded as the winner
+
+        :param player_id: id of the player sending the board
+        :param board: the board to be set
+        :return: empty dict
+        """
+
+        rows, cols, win_length = self.dimensions
+        if len(board) == rows * cols and len(self.board) == rows * cols:
+            self.moves.extend(i for i, (old, new) in enumerate(zip(self.board, board)) if old == '#' and new != '#')
+        self.board = list(board)
+        self._notify('board', self.board)
+        if len(board) == rows * cols:
+            self.game.set_state(list(board))
+            self._check_result(player_id)
+        return {}
+
+    def move(self, player_id, tile_id):
+        """ validates the move of the player, plays it on the board kept by the server and passes the turn
+
+        :param player_id: id of the player making the move
+        :param tile_id: chosen tile id
+        :return: dictionary with 'ok', communicate to client, the board, the player who has a turn and the result
+        """
+
+        rows, cols, win_length = self.dimensions
+        if self.result is not None:
+            prompt = "The game is over."
+        elif player_id not in self.players.values():
+            prompt = "You are not a player of this game."
+        elif player_id != self.current_player:
+            prompt = "It's not your turn."
+        elif (not isinstance(tile_id, int) or isinstance(tile_id, bool) or not 0 <= tile_id < rows * cols
+              or not self.game.check_can_place(tile_id)):
+            prompt = "Cannot place marker."
+        else:
+            prompt = None
+        if prompt is not None:
+            return {'ok': False, 'prompt': prompt, 'board': self.board, 'current_player': self.current_player,
+                    'result': self.result}
+
+        ok, prompt = self.game.place(self.marker_of(player_id), tile_id)
+        self.moves.append(tile_id)
+        self.board = list(self.game.get_state())
+        self.current_tile = tile_id
+        self._notify('board', self.board)
+        self._check_result(player_id)
+        self.switch_player()
+        self._notify('turn', self.current_player)
+        return {'ok': ok, 'prompt': prompt, 'board': self.board, 'current_player': self.current_player,
+                'result': self.result}
+
+    def _check_result(self, player_id):
+        """ records the result if the board kept by the server is a finished game
+
+        :param player_id: id of the player who made the last move, the winner if there is a winning line
+        """
+
+        if self.result is None:
+            if self.game.check_win():
+                self.result = {'winner': player_id}
+            elif self.game.check_full():
+                self.result = {'winner': None}
+            if self.result is not None:
+                self.finished = time.time()
+                self._notify('game_over', self.result)
+
+    def switch_player(self):
+        """ changes the player who has a turn
+        """
+
+        if self.current_player == self.players['player1']:
+            self.current_player = self.players['player2']
+        else:
+            self.current_player = self.players['player1']
+
+    def marker_of(self, player_id):
+        """ returns the marker of the player, the first player gets 'x' if they have not chosen yet
+
+        :param player_id: id of the player
+        :return: marker 'x' or 'o'
+        """
+
+        if player_id == self.players['player1']:
+            return self.first_player_marker()
+        if self.players['player1'] not in self.markers:
+            self.first_player_marker()
+        return self.second_player_marker()
+
+    def first_player_marker(self):
+        """ returns the marker of the first player, derived from the second one if needed
+
+        :return: marker of first player 'x' or 'o'
+        """
+
+        player1, player2 = self.players['player1'], self.players['player2']
+        if player1 not in self.markers:
+            self.markers[player1] = 'o' if self.markers.get(player2) == 'x' else 'x'
+        return self.markers[player1]
+
+    def second_player_marker(self):
+        """ returns the marker of the second player, derived from the first one
+
+        :return: marker of second player 'x' or 'o', None if the first player has not chosen yet
+        """
+
+        player1, player2 = self.players['player1'], self.players['player2']
+        if player1 not in self.markers:
+            return None
+        self.markers[player2] = 'o' if self.markers[player1] == 'x' else 'x'
+        return self.markers[player2]
+
+
+class GameRegistry:
+    """
+    A class used to keep all rooms hosted by one server process
+
+    Rooms are kept in access order, so the least recently used room is always
+    the first one and eviction only ever looks at the front of the registry.
+
+    Attributes
+    ----------
+    idle_timeout: float
+        number of seconds after which an unused room is evicted
+    max_rooms: int
+        maximum number of rooms kept at the same time
+    finished_timeout: float
+        number of seconds a room with a finished game is kept
+    journal: MoveLog
+        log the changes of the rooms are appended to, None if the rooms are kept only in memory
+    archive: GameArchive
+        archive the finished games are recorded in, None if they are not kept
+    store: SQLiteStore
+        store the rooms are shared through with other server processes, None if they are kept only here
+    poll_interval: float
+        number of seconds between the checks of the store for rooms changed by other processes
+
+    Methods:
+    ----------
+    get(room_id)
+        returns the room with the given id, creating it if needed
+    find(room_id)
+        returns the room with the given id or None
+    seated(room_id, player_id)
+        tells if the player is seated in the room kept here
+    holds(room)
+        tells if the room is still kept under its id
+    update(room_id, change)
+        applies the change to the room
+    apply(room_id, data)
+        applies the request of a client to the room
+    remove(room_id)
+        removes the room from the registry
+    finish(room_id)
+        schedules the eviction of the room with a finished game
+    evict()
+        removes idle rooms and rooms above the limit
+    attach(journal)
+        restores the rooms from the journal and logs all later changes to it
+    attach_store(store)
+        shares the rooms with the other processes using the store
+    detach_store()
+        stops sharing the rooms
+    dump()
+        returns the states of all rooms
+    stats()
+        counts the rooms, the games being played and their players
+    """
+
+    def __init__(self, idle_timeout=600.0, max_rooms=100000, finished_timeout=60.0):
+        """ sets an empty registry
+
+        :param idle_timeout: number of seconds after which an unused room is evicted
+        :param max_rooms: maximum number of rooms kept at the same time
+        :param finished_timeout: number of seconds a room with a finished game is kept
+        """
+
+        self.idle_timeout = idle_timeout
+        self.max_rooms = max_rooms
+        self.finished_timeout = finished_timeout
+        self._rooms = OrderedDict()
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+        self.journal = None
+        self.archive = None
+        self.store = None
+        self.poll_interval = 0.05
+        self._poller = None
+        self._stopped = threading.Event()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def get(self, room_id):
+        """ returns the room with the given id, creating it if needed
+
+        :param room_id: id of the room
+        :return: GameRoom
+        """
+
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                room = GameRoom(room_id)
+                room.journal = self.journal
+                self._rooms[room_id] = room
+            else:
+                self._rooms.move_to_end(room_id)
+            room.touch()
+            self._evict()
+        if self.store is not None:
+            room = self._refresh(room)
+        return room
+
+    def _refresh(self, room):
+        """ brings the local copy of the room up to date with the store
+            a copy of a room removed from the store by another process is replaced with a new room
+
+        :param room: local GameRoom
+        :return: GameRoom
+        """
+
+        if self.store.refresh(room) or room.version == 0:
+            return room
+        self._drop(room)
+        return self.get(room.room_id)
+
+    def _drop(self, room):
+        """ removes the local copy of a room removed from the store by another process and ends its streams
+
+        :param room: local GameRoom
+        """
+
+        with self._lock:
+            if self._rooms.get(room.room_id) is room:
+                del self._rooms[room.room_id]
+                self._finished.pop(room.room_id, None)
+        room.close()
+
+    def holds(self, room):
+        """ tells if the room is still kept under its id, checked by the streams while the room is quiet
+            with a store the stored room is read, so a room removed by another process is closed here as well
+
+        :param room: GameRoom
+        :return: False if the room has been cleared or evicted
+        """
+
+        if self.store is not None and not room.closed and room.version > 0 and not self.store.refresh(room):
+            self._drop(room)
+        return not room.closed
+
+    def find(self, room_id):
+        """ returns the room with the given id without creating it
+            with a store the room is looked up in the store as well, a room unknown here is kept only
+            if the store has it, so looking up unknown ids never evicts the rooms being played
+
+        :param room_id: id of the room
+        :return: GameRoom or None
+        """
+
+        if self.store is not None:
+            with self._lock:
+                known = room_id in self._rooms
+            if not known and not self.store.refresh(GameRoom(room_id)):
+                return None
+            room = self.get(room_id)
+            return room if room.version > 0 else None
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None:
+                self._rooms.move_to_end(room_id)
+                room.touch()
+            return room
+
+    def seated(self, room_id, player_id):
+        """ tells if the player is seated in the local copy of the room, the store is never read,
+            so the check is cheap enough to be made before every request
+
+        :param room_id: id of the room
+        :param player_id: id of the player or None
+        :return: True if the player takes one of the seats of the room
+        """
+
+        if player_id is None:
+            return False
+        with self._lock:
+            room = self._rooms.get(room_id)
+        return room is not None and player_id in room.players.values()
+
+    def update(self, room_id, change):
+        """ applies the change to the room
+            with a store the change is applied to the stored room in one transaction and the local copy is refreshed,
+            so a change made by another process at the same time is never lost, the local room is not locked
+            while the transaction waits for the other processes
+
+        :param room_id: id of the room
+        :param change: callable taking the GameRoom and returning the response to the client
+        :return: tuple (GameRoom, response)
+        """
+
+        room = self.get(room_id)
+        if self.store is None:
+            return room, change(room)
+        response, state = self.store.update(room_id, change)
+        room.sync(state)
+        return room, response
+
+    def apply(self, room_id, data):
+        """ applies the request of a client to the room
+
+        :param room_id: id of the room
+        :param data: decoded json body of the request
+        :return: tuple (GameRoom, response)
+        """
+
+        return self.update(room_id, lambda room: room.apply(data))
+
+    def remove(self, room_id):
+        """ removes the room from the registry
+
+        :param room_id: id of the room
+        :return: removed GameRoom or None
+        """
+
+        with self._lock:
+            self._finished.pop(room_id, None)
+            room = self._rooms.pop(room_id, None)
+            self._removed(room)
+        if self.store is not None:
+            self.store.delete(room_id)
+        return room
+
+    def attach(self, journal):
+        """ restores the rooms recovered from the journal and logs all later changes of the rooms to it
+
+        :param journal: MoveLog
+        """
+
+        with self._lock:
+            for room in journal.recover():
+                room.journal = journal
+                self._rooms[room.room_id] = room
+                if room.result is not None:
+                    self._finished[room.room_id] = (room, time.monotonic())
+            self.journal = journal
+        journal.start(self.dump)
+
+    def attach_store(self, store):
+        """ shares the rooms with the other server processes using the same store
+            a thread checks the store for rooms changed by other processes, so the requests waiting here wake up,
+            and removes the idle and finished rooms from the store
+
+        :param store: SQLiteStore
+        """
+
+        self.store = store
+        self._stopped.clear()
+        self._poller = threading.Thread(target=self._poll, name="room-store-poller", daemon=True)
+        self._poller.start()
+
+    def detach_store(self):
+        """ stops sharing the rooms and closes the store
+        """
+
+        if self._poller is not None:
+            self._stopped.set()
+            self._poller.join()
+            self._poller = None
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def _poll(self):
+        """ refreshes the local copies of the rooms changed in the store since the previous check
+            the check looks a quarter of a second back, so a transaction committed after its time was taken is not missed
+            once a second the rooms used here since the previous round are marked as accessed in the store,
+            so a room that is only being read is not evicted by any process
+        """
+
+        store = self.store
+        since = time.time()
+        evicted = time.monotonic()
+        try:
+            while not self._stopped.wait(self.poll_interval):
+                now = time.time()
+                for room_id, epoch, version in store.changed(since - 0.25):
+                    with self._lock:
+                        room = self._rooms.get(room_id)
+                    if room is not None and (room.epoch, room.version) != (epoch, version):
+                        store.refresh(room)
+                since = now
+                if time.monotonic() - evicted >= 1.0:
+                    store.touch(self._accessed(evicted))
+                    store.evict(self.idle_timeout, self.finished_timeout)
+                    evicted = time.monotonic()
+        finally:
+            store.close()
+
+    def _accessed(self, since):
+        """ returns the ids of the rooms used since the given time, read from the back of the access order
+
+        :param since: monotonic time
+        :return: list of room ids
+        """
+
+        with self._lock:
+            room_ids = []
+            for room in reversed(self._rooms.values()):
+                if room.last_active < since:
+                    break
+                room_ids.append(room.room_id)
+            return room_ids
+
+    def dump(self):
+        """ returns the states of all rooms, every room is read under its own lock
+
+        :return: list of dictionaries returned by GameRoom.to_dict
+        """
+
+        with self._lock:
+            rooms = list(self._rooms.values())
+        return [room.to_dict() for room in rooms]
+
+    def stats(self):
+        """ counts the rooms, the games being played and their players
+            the rooms are read without their locks, so the numbers may be a request behind
+
+        :return: dictionary with 'rooms', 'active_games' and 'players'
+        """
+
+        if self.store is not None:
+            return self.store.stats()
+        with self._lock:
+            rooms = list(self._rooms.values())
+        active = players = 0
+        for room in rooms:
+            if room.result is None:
+                seated = sum(player is not None for player in room.players.values())
+                players += seated
+                active += seated == 2
+        return {'rooms': len(rooms), 'active_games': active, 'players': players}
+
+    def _removed(self, room):
+        """ logs the removal of the room, so it is not restored from the journal, and ends its streams
+
+        :param room: removed GameRoom or None
+        """
+
+        if room is None:
+            return
+        if self.journal is not None:
+            self.journal.remove(room.room_id, room.epoch)
+        room.close()
+
+    def finish(self, room_id):
+        """ schedules the eviction of the room with a finished game after finished_timeout
+            and hands the game to the archive, which writes it on its own thread and skips a game it cannot keep,
+            so the request that ended the game neither waits for the disk nor fails
+
+        :param room_id: id of the room
+        """
+
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None or room_id in self._finished:
+                return
+            self._finished[room_id] = (room, time.monotonic())
+        if self.archive is not None:
+            self.archive.add_room(room)
+
+    def evict(self):
+        """ removes idle rooms, finished rooms and rooms above the limit
+        """
+
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        """ pops rooms from the front of the registry while they are idle or the registry is too big
+            and finished rooms from the front of the finished queue while they are kept long enough
+        """
+
+        now = time.monotonic()
+        while self._finished:
+            room_id, (room, finished_at) = next(iter(self._finished.items()))
+            if finished_at > now - self.finished_timeout:
+                break
+            self._finished.popitem(last=False)
+            if self._rooms.get(room_id) is room:
+                del self._rooms[room_id]
+                self._removed(room)
+        deadline = now - self.idle_timeout
+        while self._rooms:
+            room = next(iter(self._rooms.values()))
+            if room.last_active >= deadline and len(self._rooms) <= self.max_rooms:
+                break
+            self._rooms.popitem(last=False)
+            self._finished.pop(room.room_id, None)
+            self._removed(room)
@@ -0,0 +1,221 @@
+import json
+import sqlite3
+import threading
+import time
+from game_room import GameRoom
+
+"""
+    Imports
+    -------
+    json
+    sqlite3
+    threading
+    time
+    GameRoom
+
+    Data
+    ----------
+    SCHEMA: str
+        tables of the store
+
+    By default every server process keeps its rooms only in the memory of its
+    GameRegistry, so two worker processes would host two different games under the
+    same room id. A SQLiteStore attached to the registries of all workers keeps the
+    rooms in one SQLite database in WAL mode instead: every change of a room is a
+    transaction that reads the room, applies the request and writes the room back,
+    so concurrent requests of different processes are applied one after another.
+    Readers never wait for the writers, and every process keeps a local copy of
+    the rooms it serves, refreshed when the stored version of the room changes.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room_id TEXT PRIMARY KEY,
+    epoch TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    players INTEGER NOT NULL,
+    finished REAL,
+    updated REAL NOT NULL,
+    state TEXT NOT NULL,
+    accessed REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS rooms_updated ON rooms (updated);
+"""
+
+
+class SQLiteStore:
+    """
+    A class used to share the rooms between the server processes of one machine
+
+    Attributes
+    ----------
+    path: str
+        path of the database
+    timeout: float
+        number of seconds a transaction waits for the transaction of another process
+
+    Methods:
+    ----------
+    update(room_id, change)
+        applies the change to the stored room in one transaction
+    refresh(room)
+        loads the stored room into the local copy if its version has changed
+    changed(since)
+        returns the rooms changed since the given time
+    touch(room_ids)
+        marks the rooms as used right now
+    delete(room_id)
+        removes the room
+    evict(idle_timeout, finished_timeout)
+        removes idle rooms and rooms with games finished long enough ago
+    stats()
+        counts the rooms, the games being played and their players
+    close()
+        closes the connection of the calling thread
+    """
+
+    def __init__(self, path, timeout=5.0):
+        """ opens the database and creates its tables
+
+        :param path: path of the database
+        :param timeout: number of seconds a transaction waits for the transaction of another process
+        """
+
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(rooms)")]
+        if 'accessed' not in columns:
+            connection.execute("ALTER TABLE rooms ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+
+    def _connection(self):
+        """ returns the connection of the calling thread, sqlite connections cannot be shared by threads
+
+        :return: sqlite3.Connection
+        """
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def update(self, room_id, change):
+        """ reads the room, applies the change and writes the room back in one transaction
+            BEGIN IMMEDIATE takes the write lock at once, so two processes never apply changes to the same version
+
+        :param room_id: id of the room
+        :param change: callable taking the GameRoom and returning the response to the client
+        :return: tuple (response, state of the room returned by GameRoom.to_dict)
+        """
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT state FROM rooms WHERE room_id = ?", (room_id,)).fetchone()
+            room = GameRoom.from_dict(json.loads(row[0])) if row is not None else GameRoom(room_id)
+            version = room.version
+            response = change(room)
+            state = room.to_dict()
+            if room.version != version:
+                players = sum(player is not None for player in room.players.values())
+                now = time.time()
+                connection.execute("INSERT OR REPLACE INTO rooms VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (room_id, room.epoch, room.version, players, room.finished, now,
+                                    json.dumps(state), now))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return response, state
+
+    def refresh(self, room):
+        """ loads the stored room into the local copy, the state is read only if its version has changed
+
+        :param room: local GameRoom
+        :return: False if the room is not stored
+        """
+
+        row = self._connection().execute(
+            "SELECT CASE WHEN epoch = ? AND version = ? THEN NULL ELSE state END FROM rooms WHERE room_id = ?",
+            (room.epoch, room.version, room.room_id)).fetchone()
+        if row is None:
+            return False
+        if row[0] is not None:
+            room.sync(json.loads(row[0]))
+        return True
+
+    def changed(self, since):
+        """ returns the rooms changed since the given time
+
+        :param since: unix time
+        :return: list of (room_id, epoch, version) tuples
+        """
+
+        return self._connection().execute("SELECT room_id, epoch, version FROM rooms WHERE updated >= ?",
+                                          (since,)).fetchall()
+
+    def touch(self, room_ids):
+        """ marks the rooms as used right now, so they are not evicted while they are only being read
+
+        :param room_ids: ids of the rooms
+        """
+
+        if not room_ids:
+            return
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("UPDATE rooms SET accessed = ? WHERE room_id = ?",
+                                   [(now, room_id) for room_id in room_ids])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, room_id):
+        """ removes the room
+
+        :param room_id: id of the room
+        """
+
+        self._connection().execute("DELETE FROM rooms WHERE room_id = ?", (room_id,))
+
+    def evict(self, idle_timeout, finished_timeout):
+        """ removes the rooms neither changed nor read for idle_timeout and the rooms with games finished
+            finished_timeout ago
+
+        :param idle_timeout: number of seconds after which an unused room is removed
+        :param finished_timeout: number of seconds a room with a finished game is kept
+        :return: number of removed rooms
+        """
+
+        now = time.time()
+        return self._connection().execute("DELETE FROM rooms WHERE MAX(updated, accessed) < ? OR finished < ?",
+                                          (now - idle_timeout, now - finished_timeout)).rowcount
+
+    def stats(self):
+        """ counts the rooms, the games being played and their players
+
+        :return: dictionary with 'rooms', 'active_games' and 'players'
+        """
+
+        rooms, active, players = self._connection().execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(finished IS NULL AND players = 2), 0), "
+            "COALESCE(SUM(CASE WHEN finished IS NULL THEN players ELSE 0 END), 0) FROM rooms").fetchone()
+        return {'rooms': rooms, 'active_games': active, 'players': players}
+
+    def close(self):
+        """ closes the connection of the calling thread
+        """
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,243 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from game_room import check_dimensions
+
+"""
+    Imports
+    -------
+    itertools
+    threading
+    time
+    uuid
+    OrderedDict, deque
+    check_dimensions
+
+    Data
+    ----------
+    WAIT_TIMEOUT: float
+        number of seconds after which a player who stopped asking for a match leaves the queue
+    SKILL_BUCKET: float
+        width of the skill ranges of the queues, players from different ranges are never paired
+
+    Every bucket, a skill range and a board size, has its own FIFO queue of waiting
+    players. A player joining a bucket with somebody waiting is paired with the
+    longest waiting player at once, so pairing takes O(1) no matter how many
+    players wait. The pair gets a new room reserved for the two of them, and both
+    then connect to it like to any other room.
+
+    Leaving players and waiters that stopped asking are not searched for in the
+    queues: they are removed from the waiting dict and their queue entries are
+    skipped when they reach the head of the queue.
+"""
+
+WAIT_TIMEOUT = 30.0
+SKILL_BUCKET = 100.0
+
+
+class Matchmaker:
+    """
+    A class used to pair the waiting players into new rooms
+
+    Attributes
+    ----------
+    rooms: GameRegistry
+        registry the rooms of the pairs are created in
+    wait_timeout: float
+        number of seconds after which a waiter or an uncollected match is dropped
+    skill_bucket: float
+        width of the skill ranges of the queues
+    lock: threading.Condition
+        serializes the changes of the queues and wakes up the waiting requests
+    listeners: set
+        callables called after every match, used by the servers that cannot block on the lock
+
+    Methods:
+    ----------
+    join(player_id, skill, dimensions)
+        pairs the player with a waiting one or queues the player
+    wait(player_id, timeout)
+        blocks until the player is matched or the timeout expires
+    status(player_id)
+        returns the match of the player or tells that the player waits
+    leave(player_id)
+        removes the player from the queue
+    stats()
+        counts the waiting players
+    """
+
+    def __init__(self, rooms, wait_timeout=WAIT_TIMEOUT, skill_bucket=SKILL_BUCKET):
+        """ sets empty queues
+
+        :param rooms: GameRegistry the rooms of the pairs are created in
+        :param wait_timeout: number of seconds after which a waiter or an uncollected match is dropped
+        :param skill_bucket: width of the skill ranges of the queues
+        """
+
+        self.rooms = rooms
+        self.wait_timeout = wait_timeout
+        self.skill_bucket = skill_bucket
+        self.lock = threading.Condition()
+        self.listeners = set()
+        self._queues = {}
+        self._waiting = OrderedDict()
+        self._matches = OrderedDict()
+        self._tickets = itertools.count()
+
+    def bucket(self, skill=None, dimensions=None):
+        """ returns the key of the queue of the player
+
+        :param skill: rating of the player, None to be paired with anybody
+        :param dimensions: (rows, cols, win_length) of the board, None for the default board
+        :return: hashable key of the queue
+        :raises ValueError: if the skill is not a number or the dimensions are not valid
+        """
+
+        try:
+            skill = None if skill is None else int(float(skill) // self.skill_bucket)
+        except (TypeError, OverflowError):
+            raise ValueError("The skill must be a number.")
+        return skill, None if dimensions is None else check_dimensions(dimensions)
+
+    def join(self, player_id, skill=None, dimensions=None):
+        """ pairs the player with the longest waiting player of the same bucket or queues the player
+            joining again refreshes the place in the queue, a player that is already matched gets the match
+            until its game is over
+
+        :param player_id: id of the player
+        :param skill: rating of the player, None to be paired with anybody
+        :param dimensions: (rows, cols, win_length) of the board, None for the default board
+        :return: dictionary with 'status' 'matched', 'room_id' and 'opponent' or with 'status' 'waiting'
+        """
+
+        bucket = self.bucket(skill, dimensions)
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            match = self._matches.get(player_id)
+            if match is not None:
+                room = self.rooms.find(match[0])
+                if room is not None and room.result is None:
+                    return self.status(player_id)
+                del self._matches[player_id]
+            waiter = self._waiting.get(player_id)
+            if waiter is not None and waiter[0] == bucket:
+                waiter[2] = now
+                self._waiting.move_to_end(player_id)
+                return self.status(player_id)
+            self._waiting.pop(player_id, None)
+            opponent = self._pop_waiter(bucket)
+            if opponent is None:
+                ticket = next(self._tickets)
+                self._queues.setdefault(bucket, deque()).append((player_id, ticket))
+                self._waiting[player_id] = [bucket, ticket, now]
+                return self.status(player_id)
+            room_id = "match-" + uuid.uuid4().hex[:12]
+            self.rooms.apply(room_id, {'reserve': [opponent, player_id]})
+            self._matches[opponent] = (room_id, player_id, now)
+            self._matches[player_id] = (room_id, opponent, now)
+            self.lock.notify_all()
+            for listener in list(self.listeners):
+                listener()
+            return {'status': 'matched', 'room_id': room_id, 'opponent': opponent}
+
+    def _pop_waiter(self, bucket):
+        """ takes the longest waiting player out of the queue, skipping the players who left it
+
+        :param bucket: key of the queue
+        :return: id of the player or None if nobody waits
+        """
+
+        queue = self._queues.get(bucket)
+        while queue:
+            player_id, ticket = queue.popleft()
+            waiter = self._waiting.get(player_id)
+            if waiter is not None and waiter[1] == ticket:
+                del self._waiting[player_id]
+                if not queue:
+                    del self._queues[bucket]
+                return player_id
+        self._queues.pop(bucket, None)
+        return None
+
+    def _expire(self, now):
+        """ drops the waiters that stopped asking and the matches nobody collected
+            both dicts are ordered by time, so only their oldest entries are checked
+
+        :param now: monotonic time
+        """
+
+        deadline = now - self.wait_timeout
+        while self._waiting:
+            player_id, waiter = next(iter(self._waiting.items()))
+            if waiter[2] > deadline:
+                break
+            del self._waiting[player_id]
+        while self._matches:
+            player_id, match = next(iter(self._matches.items()))
+            if match[2] > deadline:
+                break
+            del self._matches[player_id]
+
+    def wait(self, player_id, timeout):
+        """ blocks until the player is matched or the timeout expires, asking counts as being active
+
+        :param player_id: id of the player
+        :param timeout: maximum number of seconds to wait
+        :return: the status of the player
+        """
+
+        with self.lock:
+            self._touch(player_id)
+            self.lock.wait_for(lambda: player_id not in self._waiting, timeout)
+            self._touch(player_id)
+            return self.status(player_id)
+
+    def _touch(self, player_id):
+        """ marks the waiter as active right now
+
+        :param player_id: id of the player
+        """
+
+        waiter = self._waiting.get(player_id)
+        if waiter is not None:
+            waiter[2] = time.monotonic()
+            self._waiting.move_to_end(player_id)
+
+    def status(self, player_id):
+        """ returns the match of the player or tells that the player waits
+
+        :param player_id: id of the player
+        :return: dictionary with 'status' 'matched', 'waiting' or 'unknown' for a player who is not queued
+        """
+
+        with self.lock:
+            match = self._matches.get(player_id)
+            if match is not None:
+                return {'status': 'matched', 'room_id': match[0], 'opponent': match[1]}
+            if player_id in self._waiting:
+                self._touch(player_id)
+                return {'status': 'waiting'}
+            return {'status': 'unknown'}
+
+    def leave(self, player_id):
+        """ removes the player from the queue, the entry in the queue is skipped when it is reached
+
+        :param player_id: id of the player
+        :return: True if the player was waiting
+        """
+
+        with self.lock:
+            return self._waiting.pop(player_id, None) is not None
+
+    def stats(self):
+        """ counts the waiting players and the matches not collected yet
+
+        :return: dictionary with 'waiting', 'buckets' and 'matches'
+        """
+
+        with self.lock:
+            self._expire(time.monotonic())
+            return {'waiting': len(self._waiting), 'buckets': len(self._queues), 'matches': len(self._matches)}
@@ -0,0 +1,258 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import deque
+
+"""
+    Imports
+    -------
+    threading
+    time
+    weakref
+    bisect_left
+    deque
+
+    Data
+    ----------
+    BUCKETS: tuple
+        upper bounds in seconds of the buckets of the latency histograms
+    RATE_WINDOW: float
+        number of seconds over which the moves per second are measured
+    CONTENT_TYPE: str
+        content type of the text exposition format
+
+    Every thread records into its own shard, created the first time the thread
+    records anything, so recording a request takes no lock at all and threads never
+    contend for a cache line. A scrape adds up the shards of all threads. When a
+    thread ends, e.g. the thread of a finished connection of the threaded server,
+    its counts are added to one shard of the ended threads and its shard is dropped.
+"""
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_WINDOW = 60.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shard:
+    """
+    A class used to keep the numbers recorded by one thread
+
+    Attributes
+    ----------
+    requests: dict
+        number of requests by (route, method, status)
+    latencies: dict
+        list of bucket counts followed by the sum of the latencies, by route
+    moves: int
+        number of played moves
+    """
+
+    __slots__ = ('requests', 'latencies', 'moves')
+
+    def __init__(self):
+        self.requests = {}
+        self.latencies = {}
+        self.moves = 0
+
+    def add(self, other):
+        """ adds the numbers of another shard to this one
+
+        :param other: _Shard
+        """
+
+        for key, count in list(other.requests.items()):
+            self.requests[key] = self.requests.get(key, 0) + count
+        for route, histogram in list(other.latencies.items()):
+            total = self.latencies.setdefault(route, [0] * len(histogram))
+            for i, value in enumerate(histogram):
+                total[i] += value
+        self.moves += other.moves
+
+
+class _Owner:
+    """
+    A class used to notice the end of a thread: it is kept only by the thread-local storage of the thread
+    """
+
+    __slots__ = ('__weakref__',)
+
+
+class Metrics:
+    """
+    A class used to count the requests, their latencies and the moves of a server
+
+    Attributes
+    ----------
+    buckets: tuple
+        upper bounds in seconds of the buckets of the latency histograms
+
+    Methods:
+    ----------
+    observe_request(route, method, status, seconds)
+        records a handled request
+    count_move()
+        records a played move
+    render(rooms)
+        returns all metrics in the text exposition format
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        """ sets the metrics without any recorded request
+
+        :param buckets: upper bounds in seconds of the buckets of the latency histograms
+        """
+
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+        self._samples = deque()
+
+    def _shard(self):
+        """ returns the shard of the calling thread, creating it on the first call
+
+        :return: _Shard
+        """
+
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            owner = self._local.owner = _Owner()
+            with self._lock:
+                self._shards.append(shard)
+            weakref.finalize(owner, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        """ adds the numbers of the shard of an ended thread to the retired shard and drops it
+
+        :param shard: _Shard of the ended thread
+        """
+
+        with self._lock:
+            self._retired.add(shard)
+            self._shards.remove(shard)
+
+    def observe_request(self, route, method, status, seconds):
+        """ records a handled request
+
+        :param route: rule of the route, not the requested path, so the number of series stays bounded
+        :param method: http method
+        :param status: http status of the response
+        :param seconds: time spent on the request
+        """
+
+        shard = self._shard()
+        key = (route, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        histogram = shard.latencies.get(route)
+        if histogram is None:
+            histogram = shard.latencies[route] = [0] * (len(self.buckets) + 2)
+        histogram[bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def count_move(self):
+        """ records a played move
+        """
+
+        self._shard().moves += 1
+
+    def _merge(self):
+        """ adds up the shards of all threads
+
+        :return: tuple (requests, latencies, moves)
+        """
+
+        total = _Shard()
+        with self._lock:
+            total.add(self._retired)
+            for shard in self._shards:
+                total.add(shard)
+        return total.requests, total.latencies, total.moves
+
+    def _moves_per_second(self, moves):
+        """ measures the moves per second since the oldest scrape within RATE_WINDOW
+
+        :param moves: number of moves played so far
+        :return: moves per second, 0 before the second scrape
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, moves))
+            while len(self._samples) > 2 and self._samples[1][0] <= now - RATE_WINDOW:
+                self._samples.popleft()
+            start, start_moves = self._samples[0]
+        return (moves - start_moves) / (now - start) if now > start else 0.0
+
+    def render(self, rooms=None):
+        """ returns all metrics in the text exposition format
+
+        :param rooms: GameRegistry whose rooms are counted, default None
+        :return: str
+        """
+
+        requests, latencies, moves = self._merge()
+        lines = [
+            "# HELP tictactoe_http_requests_total Handled requests.",
+            "# TYPE tictactoe_http_requests_total counter",
+        ]
+        errors = {}
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append('tictactoe_http_requests_total{route="%s",method="%s",status="%d"} %d'
+                         % (_escape(route), method, status, count))
+            if status >= 400:
+                errors[route] = errors.get(route, 0) + count
+        lines += [
+            "# HELP tictactoe_http_request_errors_total Requests answered with a 4xx or 5xx status.",
+            "# TYPE tictactoe_http_request_errors_total counter",
+        ]
+        for route, count in sorted(errors.items()):
+            lines.append('tictactoe_http_request_errors_total{route="%s"} %d' % (_escape(route), count))
+        lines += [
+            "# HELP tictactoe_http_request_duration_seconds Time spent on a request.",
+            "# TYPE tictactoe_http_request_duration_seconds histogram",
+        ]
+        for route, histogram in sorted(latencies.items()):
+            label = _escape(route)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                lines.append('tictactoe_http_request_duration_seconds_bucket{route="%s",le="%s"} %d'
+                             % (label, bound, cumulative))
+            lines.append('tictactoe_http_request_duration_seconds_sum{route="%s"} %.6f' % (label, histogram[-1]))
+            lines.append('tictactoe_http_request_duration_seconds_count{route="%s"} %d' % (label, cumulative))
+        lines += [
+            "# HELP tictactoe_moves_total Played moves.",
+            "# TYPE tictactoe_moves_total counter",
+            "tictactoe_moves_total %d" % moves,
+            "# HELP tictactoe_moves_per_second Moves per second over the last minute of scrapes.",
+            "# TYPE tictactoe_moves_per_second gauge",
+            "tictactoe_moves_per_second %.3f" % self._moves_per_second(moves),
+        ]
+        if rooms is not None:
+            stats = rooms.stats()
+            lines += [
+                "# HELP tictactoe_rooms Rooms kept by the server.",
+                "# TYPE tictactoe_rooms gauge",
+                "tictactoe_rooms %d" % stats['rooms'],
+                "# HELP tictactoe_active_games Games with two players and no result.",
+                "# TYPE tictactoe_active_games gauge",
+                "tictactoe_active_games %d" % stats['active_games'],
+                "# HELP tictactoe_connected_players Players seated in the rooms of games without a result.",
+                "# TYPE tictactoe_connected_players gauge",
+                "tictactoe_connected_players %d" % stats['players'],
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    """ escapes a label value of the text exposition format
+
+    :param value: label value
+    :return: escaped value
+    """
+
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
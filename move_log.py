@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import threading
+import time
+from game_room import GameRoom
+
+"""
+    Imports
+    -------
+    json
+    logging
+    os
+    threading
+    time
+    GameRoom
+
+    Data
+    ----------
+    FLUSH_INTERVAL: float
+        number of seconds the writer waits for more records before it commits a batch
+    SNAPSHOT_EVERY: int
+        number of records after which the log is compacted into a snapshot
+    RETRY_INTERVAL: float
+        number of seconds the writer waits before it writes a batch again after an error
+    logger: logging.Logger
+        logger of the errors of the writer
+
+    The log is a file of JSON lines, one per request that changed a room, tagged
+    with the room epoch and the version the request produced, and one per removed
+    room. Requests only append their record to a buffer in memory; a writer thread
+    writes everything buffered so far and syncs it to the disk once for the whole
+    batch. Every SNAPSHOT_EVERY records the log is moved aside, the states of all
+    rooms are written to the snapshot file and the old log is deleted. A record
+    that is already part of the snapshot has a version not newer than the room in
+    the snapshot, so replaying it is skipped.
+
+    When a write, a sync or a compaction fails, e.g. on a full disk, the writer
+    logs the error, cuts the log back to the end of the last synced batch, keeps
+    the batch at the front of the buffer and tries again every RETRY_INTERVAL.
+    The error stays in the error attribute until a batch is written again, so the
+    records are never dropped while the disk is failing.
+"""
+
+FLUSH_INTERVAL = 0.005
+SNAPSHOT_EVERY = 10000
+RETRY_INTERVAL = 1.0
+logger = logging.getLogger(__name__)
+
+
+class MoveLog:
+    """
+    A class used to keep the rooms of the server on the disk
+
+    Attributes
+    ----------
+    path: str
+        path of the log, the snapshot is kept in path + '.snapshot'
+    flush_interval: float
+        number of seconds the writer waits for more records before it commits a batch
+    snapshot_every: int
+        number of records after which the log is compacted into a snapshot
+    error: Exception
+        error of the last write that failed, None once a batch has been written after it
+
+    Methods:
+    ----------
+    recover()
+        restores the rooms from the snapshot and the log
+    start(dump)
+        compacts the recovered state and starts the writer thread
+    append(room_id, epoch, version, data)
+        logs the request that changed the room
+    remove(room_id, epoch)
+        logs the removal of the room
+    close()
+        commits the buffered records and stops the writer thread
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, snapshot_every=SNAPSHOT_EVERY):
+        """ sets the log, nothing is read or written before recover and start
+
+        :param path: path of the log
+        :param flush_interval: number of seconds the writer waits for more records before it commits a batch
+        :param snapshot_every: number of records after which the log is compacted into a snapshot
+        """
+
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self._snapshot_path = path + ".snapshot"
+        self._old_path = path + ".old"
+        self._pending = []
+        self._written = 0
+        self._synced = 0
+        self.error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._file = None
+        self._dump = None
+        self._thread = None
+
+    def recover(self):
+        """ restores the rooms from the snapshot, the log moved aside by an unfinished compaction and the log
+            a damaged last line, left by a crash in the middle of a write, is ignored
+
+        :return: list of restored GameRoom objects
+        """
+
+        rooms = {}
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, encoding='utf-8') as file:
+                for state in json.load(file):
+                    rooms[state['room_id']] = GameRoom.from_dict(state)
+        for path in (self._old_path, self.path):
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break
+                        self._replay(rooms, record)
+        return list(rooms.values())
+
+    def _replay(self, rooms, record):
+        """ applies the logged record to the restored rooms
+            a record of another epoch than the restored room belongs to a room removed before it was created
+
+        :param rooms: dictionary of restored rooms by room id
+        :param record: decoded line of the log
+        """
+
+        room = rooms.get(record['room'])
+        if room is not None and room.epoch != record['epoch']:
+            return
+        if record.get('removed'):
+            rooms.pop(record['room'], None)
+            return
+        if room is None:
+            room = GameRoom(record['room'])
+            room.epoch = record['epoch']
+            rooms[room.room_id] = room
+        if record['version'] > room.version:
+            room.apply(record['data'])
+
+    def start(self, dump):
+        """ writes the recovered state as the new snapshot and starts the writer thread
+
+        :param dump: callable returning the states of all rooms, used for the snapshots
+        """
+
+        self._dump = dump
+        self._write_snapshot()
+        if os.path.exists(self._old_path):
+            os.remove(self._old_path)
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._synced = 0
+        self._thread = threading.Thread(target=self._run, name="move-log", daemon=True)
+        self._thread.start()
+
+    def append(self, room_id, epoch, version, data):
+        """ logs the request that changed the room, without waiting for the disk
+
+        :param room_id: id of the room
+        :param epoch: epoch of the room
+        :param version: version of the room produced by the request
+        :param data: decoded json body of the request
+        """
+
+        self._put({'room': room_id, 'epoch': epoch, 'version': version, 'data': data})
+
+    def remove(self, room_id, epoch):
+        """ logs the removal of the room, without waiting for the disk
+
+        :param room_id: id of the room
+        :param epoch: epoch of the room
+        """
+
+        self._put({'room': room_id, 'epoch': epoch, 'removed': True})
+
+    def _put(self, record):
+        """ buffers the encoded record and wakes up the writer
+
+        :param record: json serializable record
+        """
+
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self._condition:
+            self._pending.append(line)
+            self._condition.notify()
+
+    def close(self):
+        """ commits the buffered records and stops the writer thread
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        """ writes the buffered records in batches, one sync of the disk per batch
+            a batch that cannot be written goes back to the front of the buffer and is written again later,
+            on close a failing batch is tried once more and then given up
+        """
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+            with self._condition:
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            try:
+                if batch:
+                    self._commit(batch)
+                    batch = []
+                if not closed and self._written >= self.snapshot_every:
+                    self._compact()
+                self.error = None
+            except Exception as error:
+                self.error = error
+                logger.exception("The move log cannot be written, %d records wait for the disk.",
+                                 len(batch) + len(self._pending))
+                with self._condition:
+                    self._pending[:0] = batch
+                    if not closed:
+                        self._condition.wait_for(lambda: self._closed, RETRY_INTERVAL)
+                        continue
+                if self._pending:
+                    try:
+                        self._commit(self._pending)
+                    except Exception:
+                        logger.exception("The move log is closed with %d records not written.", len(self._pending))
+            if closed:
+                return
+
+    def _commit(self, batch):
+        """ writes the batch and syncs it to the disk
+            if it fails the log is cut back to the end of the last synced batch, so a half written batch
+            never stops the recovery before the batches written after it
+
+        :param batch: list of encoded records
+        """
+
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        try:
+            self._file.write(''.join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except BaseException:
+            self._rewind()
+            raise
+        self._synced = self._file.tell()
+        self._written += len(batch)
+
+    def _rewind(self):
+        """ drops the file of the log and cuts the log back to the end of the last synced batch
+            the next batch opens the log again
+        """
+
+        file, self._file = self._file, None
+        try:
+            file.close()
+        except OSError:
+            pass
+        try:
+            os.truncate(self.path, self._synced)
+        except OSError:
+            logger.exception("The move log cannot be cut back to its last synced batch.")
+
+    def _compact(self):
+        """ moves the log aside, writes the states of all rooms as the snapshot and deletes the old log
+            records written after the log was moved aside go to the new log
+            an old log left by a failed compaction is not yet in any snapshot, so it is kept and only
+            the snapshot is written again
+        """
+
+        if not os.path.exists(self._old_path):
+            file, self._file = self._file, None
+            if file is not None:
+                file.close()
+            os.replace(self.path, self._old_path)
+            self._synced = 0
+            self._file = open(self.path, 'w', encoding='utf-8')
+        self._write_snapshot()
+        os.remove(self._old_path)
+        self._written = 0
+
+    def _write_snapshot(self):
+        """ writes the states of all rooms to a temporary file and replaces the snapshot with it
+        """
+
+        temporary = self._snapshot_path + ".tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self._dump(), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self._snapshot_path)
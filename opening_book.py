@@ -0,0 +1,175 @@
+import mmap
+import struct
+import sys
+from board import Board, encode_state, winning_lines
+
+"""
+    Imports
+    -------
+    mmap
+    struct
+    sys
+    Board, encode_state, winning_lines
+
+    Data
+    ----------
+    HEADER: struct.Struct
+        header of the book file: magic bytes, rows, cols, win_length
+    MAGIC: bytes
+        first bytes of every book file
+    NO_MOVE: int
+        move stored for a finished position
+    UNREACHABLE, LOSS, DRAW, WIN: int
+        value stored for a position, from the point of view of the player to move
+
+    The book has one byte for every base-3 number of a 3x3 position, encoded by
+    encode_state with the player to move as 1 and the opponent as 2. The low four
+    bits of the byte are the best move, the next two bits are the value.
+"""
+
+HEADER = struct.Struct('<8sBBB5x')
+MAGIC = b'TTTBOOK1'
+NO_MOVE = 0x0F
+UNREACHABLE, LOSS, DRAW, WIN = 0, 1, 2, 3
+
+ROWS, COLS, WIN_LENGTH = 3, 3, 3
+SIZE = ROWS * COLS
+
+
+def _won(cells):
+    """ checks if the opponent of the player to move has a winning line
+
+    :param cells: position with 1 for the player to move and 2 for the opponent
+    :return: True if the opponent has won
+    """
+
+    return any(all(cells[i] == 2 for i in line) for line in winning_lines(ROWS, COLS, WIN_LENGTH))
+
+
+def solve():
+    """ solves every position reachable from the empty board
+
+    :return: dictionary mapping the number of the position to (best move, value)
+    """
+
+    solved = {}
+
+    def search(cells):
+        number = sum(value * 3 ** i for i, value in enumerate(cells))
+        if number in solved:
+            return solved[number]
+        empty = cells.count(0)
+        if _won(cells):
+            result = (NO_MOVE, LOSS, -(10 + empty))
+        elif empty == 0:
+            result = (NO_MOVE, DRAW, 0)
+        else:
+            best_move, best_score = NO_MOVE, None
+            for move in range(SIZE):
+                if cells[move] == 0:
+                    child = [0 if value == 0 else 3 - value for value in cells]
+                    child[move] = 2
+                    score = -search(child)[2]
+                    if best_score is None or score > best_score:
+                        best_move, best_score = move, score
+            value = WIN if best_score > 0 else LOSS if best_score < 0 else DRAW
+            result = (best_move, value, best_score)
+        solved[number] = result
+        return result
+
+    search([0] * SIZE)
+    return {number: (move, value) for number, (move, value, score) in solved.items()}
+
+
+def generate(path):
+    """ writes the book of all positions reachable from Board._init_state() to the file
+
+    :param path: path of the book file
+    :return: number of reachable positions
+    """
+
+    assert Board(ROWS, COLS, WIN_LENGTH)._init_state() == ['#'] * SIZE
+    table = bytearray(3 ** SIZE)
+    solved = solve()
+    for number, (move, value) in solved.items():
+        table[number] = value << 4 | move
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, ROWS, COLS, WIN_LENGTH))
+        book_file.write(table)
+    return len(solved)
+
+
+class OpeningBook:
+    """
+    A class used to read the perfect-play book of the 3x3 game
+
+    The file is memory-mapped read-only, so a lookup is a single byte read, nothing
+    is searched at startup and all processes using the book share its pages.
+
+    Attributes
+    ----------
+    path: str
+        path of the book file
+
+    Methods:
+    ----------
+    lookup(board, marker)
+        returns the best move and the value of the position for the player using the marker
+    close()
+        unmaps the file
+    """
+
+    def __init__(self, path):
+        """ maps the book file and checks its header
+
+        :param path: path of the book file
+        """
+
+        self.path = path
+        with open(path, 'rb') as book_file:
+            self._map = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, rows, cols, win_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC or (rows, cols, win_length) != (ROWS, COLS, WIN_LENGTH) \
+                or len(self._map) != HEADER.size + 3 ** SIZE:
+            self._map.close()
+            raise ValueError("Not an opening book: " + str(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ unmaps the file
+        """
+
+        self._map.close()
+
+    def lookup(self, board, marker):
+        """ returns the best move and the value of the position for the player using the marker
+
+        :param board: 3x3 Board or BitBoard
+        :param marker: marker of the player to move
+        :return: tuple (best move or None if the game is over, value), None if the position is not in the book
+        """
+
+        if board.get_dimensions() != (ROWS, COLS, WIN_LENGTH):
+            return None
+        state = board.get_state()
+        opponent = next((value for value in state if value not in ('#', marker)), None)
+        try:
+            number = encode_state(state, (marker, opponent))
+        except KeyError:
+            return None
+        entry = self._map[HEADER.size + number]
+        value = entry >> 4
+        if value == UNREACHABLE:
+            return None
+        move = entry & NO_MOVE
+        return (None if move == NO_MOVE else move), value
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "opening_book.bin"
+    print("Reachable positions: " + str(generate(path)))
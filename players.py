@@ -0,0 +1,337 @@
+import random
+import re
+from renderer import TerminalRenderer
+
+"""
+    Imports
+    -------
+    random
+    re
+    TerminalRenderer
+
+    Data
+    ----------
+    TILE_FORMAT: re.Pattern
+        format of a tile number typed by the user
+
+    A player makes the decisions of GameManager: the id, the marker, the tiles and
+    the replay. An output shows GameManager's messages and boards. ConsolePlayer
+    and ConsoleOutput talk to the terminal like the original GameManager did. The
+    other classes need no terminal, so one process can run many GameManagers in
+    threads, e.g. bots playing against each other or against people.
+"""
+
+TILE_FORMAT = re.compile(r'^[1-9][0-9]*$')
+
+
+class ConsolePlayer:
+    """
+    A class used to let the user make the decisions in the terminal
+
+    Methods:
+    ----------
+    choose_id()
+        asks for the id of the player
+    choose_marker()
+        asks for the marker
+    choose_tile(board, marker)
+        asks for the tile
+    choose_replay()
+        asks for a replay of the game
+    """
+
+    def choose_id(self):
+        """ asks for the id until the user enters an integer
+
+        :return: id of the player
+        """
+
+        print("Please enter your id (must be an integer): ")
+        while True:
+            try:
+                return int(input())
+            except ValueError:
+                print("Id must be an integer, please enter a correct number: ")
+
+    def choose_marker(self):
+        """ asks for the marker until the user enters x or o
+
+        :return: selected marker 'x' or 'o'
+        """
+
+        while True:
+            marker = input("Please choose your marker (x or o): ")
+            if str(marker).isalpha() and len(marker) == 1:
+                if marker.lower() == 'x' or marker.lower() == 'o':
+                    return marker.lower()
+            print("It's not a valid symbol.")
+
+    def choose_tile(self, board, marker):
+        """ asks for the tile until the user enters the number of an empty tile
+
+        :param board: the current board
+        :param marker: marker of the player
+        :return: id of the selected tile
+        """
+
+        while True:
+            print("Current player: " + str(marker))
+            rows, cols, win_length = board.get_dimensions()
+            tile_id = input("Please choose an unoccupied tile - from 1 to " + str(rows * cols) + ". ")
+            if re.match(TILE_FORMAT, tile_id) and int(tile_id) <= rows * cols:
+                tile_id = int(tile_id) - 1
+                if board.check_can_place(tile_id):
+                    return tile_id
+                else:
+                    print("This tile is occupied.")
+            else:
+                print("It's not a valid symbol.")
+
+    def choose_replay(self):
+        """ asks for a replay until the user enters y or n
+
+        :return: True if the user wants to play again
+        """
+
+        while True:
+            answer_play = input("Do you want to play again? (y or n): ")
+            if str(answer_play).isalpha() and len(answer_play) == 1:
+                if answer_play.lower() == 'y':
+                    return True
+                elif answer_play.lower() == 'n':
+                    return False
+            print("It's not a valid symbol.")
+
+
+class ScriptedPlayer:
+    """
+    A class used to play the given tiles, and random empty tiles when the script runs out
+
+    Attributes
+    ----------
+    player_id: int
+        id of the player, None for a random one
+    marker: str
+        marker chosen by the player when it joins first
+    tiles: list
+        ids of the tiles to play, a tile that is already taken is skipped
+    replay: bool
+        answer to the replay question
+
+    Methods:
+    ----------
+    choose_id()
+        returns the id of the player
+    choose_marker()
+        returns the marker
+    choose_tile(board, marker)
+        returns the next scripted tile or a random empty one
+    choose_replay()
+        returns the answer to the replay question
+    """
+
+    def __init__(self, tiles=(), marker='x', player_id=None, replay=False, seed=None):
+        """ sets the script
+
+        :param tiles: ids of the tiles to play, default none
+        :param marker: marker chosen by the player when it joins first, default 'x'
+        :param player_id: id of the player, default None (random)
+        :param replay: answer to the replay question, default False
+        :param seed: seed of the random tiles
+        """
+
+        self.player_id = player_id
+        self.marker = marker
+        self.tiles = list(tiles)
+        self.replay = replay
+        self._rng = random.Random(seed)
+
+    def choose_id(self):
+        """ returns the id of the player, a random one if it is not set
+
+        :return: id of the player
+        """
+
+        if self.player_id is None:
+            self.player_id = self._rng.randrange(1, 2 ** 31)
+        return self.player_id
+
+    def choose_marker(self):
+        """ returns the marker
+
+        :return: 'x' or 'o'
+        """
+
+        return self.marker
+
+    def choose_tile(self, board, marker):
+        """ returns the next scripted tile that is still empty, or a random empty tile
+
+        :param board: the current board
+        :param marker: marker of the player
+        :return: id of the tile
+        """
+
+        while self.tiles:
+            tile_id = self.tiles.pop(0)
+            if board.check_can_place(tile_id):
+                return tile_id
+        return self._rng.choice([tile_id for tile_id, value in enumerate(board.get_state()) if value == '#'])
+
+    def choose_replay(self):
+        """ returns the answer to the replay question
+
+        :return: bool
+        """
+
+        return self.replay
+
+
+class AIPlayer(ScriptedPlayer):
+    """
+    A class used to let AIEngine choose the tiles
+
+    Attributes
+    ----------
+    engine: AIEngine
+        engine choosing the tiles
+    """
+
+    def __init__(self, engine, player_id=None, marker='x', replay=False):
+        """ sets the player
+
+        :param engine: AIEngine choosing the tiles
+        :param player_id: id of the player, default None (random)
+        :param marker: marker chosen by the player when it joins first, default 'x'
+        :param replay: answer to the replay question, default False
+        """
+
+        super().__init__((), marker, player_id, replay)
+        self.engine = engine
+
+    def choose_tile(self, board, marker):
+        """ returns the tile chosen by the engine
+
+        :param board: the current board
+        :param marker: marker of the player
+        :return: id of the tile
+        """
+
+        return self.engine.best_move(board, marker)
+
+
+class ConsoleOutput:
+    """
+    A class used to show the messages and the boards in the terminal
+
+    Attributes
+    ----------
+    incremental: bool
+        whether a board drawn right after the previous one only rewrites the changed tiles
+
+    Methods:
+    ----------
+    message(text)
+        prints the message
+    show_board(board)
+        draws the board
+    """
+
+    def __init__(self, incremental=False):
+        """ sets the output
+
+        :param incremental: rewrite only the changed tiles of the last board, needs an ANSI terminal
+            and nothing else printing between the boards, e.g. the prompts of ConsolePlayer, default False
+        """
+
+        self.incremental = incremental
+        self._terminal = TerminalRenderer() if incremental else None
+
+    def message(self, text):
+        """ prints the message, the next board is drawn whole below it
+
+        :param text: message for the user
+        """
+
+        print(text)
+        if self._terminal is not None:
+            self._terminal.invalidate()
+
+    def show_board(self, board):
+        """ draws the board
+
+        :param board: board to show
+        """
+
+        if self._terminal is not None:
+            self._terminal.show(board)
+        else:
+            board.draw_from_state()
+
+
+class NullOutput:
+    """
+    A class used to drop the messages and the boards of a player nobody watches
+
+    Methods:
+    ----------
+    message(text)
+        drops the message
+    show_board(board)
+        drops the board
+    """
+
+    def message(self, text):
+        """ drops the message
+
+        :param text: message for the user
+        """
+
+    def show_board(self, board):
+        """ drops the board, so it is not even rendered
+
+        :param board: board to show
+        """
+
+
+class MemoryOutput:
+    """
+    A class used to keep the messages and the boards, e.g. for the logs of a bot
+
+    Attributes
+    ----------
+    messages: list
+        the shown messages
+    boards: list
+        the states of the shown boards
+
+    Methods:
+    ----------
+    message(text)
+        keeps the message
+    show_board(board)
+        keeps the state of the board
+    """
+
+    def __init__(self):
+        """ sets empty lists
+        """
+
+        self.messages = []
+        self.boards = []
+
+    def message(self, text):
+        """ keeps the message
+
+        :param text: message for the user
+        """
+
+        self.messages.append(text)
+
+    def show_board(self, board):
+        """ keeps the state of the board
+
+        :param board: board to show
+        """
+
+        self.boards.append(list(board.get_state()))
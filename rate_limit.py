@@ -0,0 +1,257 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+"""
+    Imports
+    -------
+    math
+    threading
+    time
+    OrderedDict
+
+    Data
+    ----------
+    RATE: float
+        default number of polling requests a second allowed to one player
+    BURST: float
+        default number of polling requests a player may send at once after being idle
+    ADDRESS_SHARE: float
+        number of times the bucket of an address is larger than the bucket of a player
+    MAX_KEYS: int
+        default number of callers whose buckets are kept
+    MAX_IN_FLIGHT: int
+        default number of short requests handled by the threaded server at the same time before polling requests
+        are shed
+    RETRY_AFTER: int
+        number of seconds a shed client is told to wait
+    PLAYER_HEADER: str
+        header naming the player who sends the request
+    LONG_ROUTES: tuple
+        endings of the routes that hold the request open: long-polls and event streams
+
+    Two cheap checks keep one busy client from starving all the other games.
+    RateLimiter gives every caller a token bucket: a polling request takes a
+    token, the tokens come back at a steady rate up to the burst, and a caller
+    without a token is answered 429 with Retry-After. A caller is the address of
+    the client in the room it polls, together with the player named by the
+    X-Player-Id header or the id argument, but only if the server has seated that
+    player in the room, so a client cannot get a new bucket by changing the id.
+    Every address also has one bucket ADDRESS_SHARE times larger shared by all
+    its callers, so the clients behind one NAT do not throttle each other, while
+    a client hopping between rooms and ids is still limited. The buckets are
+    refilled lazily when they are used, so a check is two dict lookups and some
+    arithmetic under one lock, and the least recently used buckets are dropped
+    once there are max_keys of them.
+
+    AdmissionControl counts the requests being handled. Once there are
+    max_in_flight of them, polling requests are answered 503 with Retry-After
+    before any work is done, while moves and connections are still handled. So
+    a crowd of pollers cannot build a queue in front of the moves that end the
+    games. The threaded server counts only the short requests, a long-poll or
+    an event stream holds its thread open on purpose. The asyncio server counts
+    every request for the whole time of its handler, long-polls and streams
+    included, as they are what its event loop is busy with, and has a higher
+    limit.
+"""
+
+RATE = 50.0
+BURST = 100.0
+ADDRESS_SHARE = 20.0
+MAX_KEYS = 100000
+MAX_IN_FLIGHT = 256
+RETRY_AFTER = 1
+PLAYER_HEADER = "X-Player-Id"
+LONG_ROUTES = ("/getdata/wait_turn", "/events", "/watch", "/api/match")
+
+
+def is_long(method, route):
+    """ tells if the route holds the request open, such requests are not limited nor counted by the threaded server
+
+    :param method: http method
+    :param route: rule of the route
+    :return: True for the long-polls and the event streams
+    """
+
+    return method == 'GET' and route.endswith(LONG_ROUTES)
+
+
+def is_polling(method, route):
+    """ tells if the request only reads the state of a room and can be limited and shed
+
+    :param method: http method
+    :param route: rule of the route
+    :return: True for the short GET requests of the /getdata routes
+    """
+
+    return method == 'GET' and "/getdata/" in route and not route.endswith(LONG_ROUTES)
+
+
+def player_of(value):
+    """ reads the id of the player named by a request
+
+    :param value: value of the X-Player-Id header or the id argument, None if the request names no player
+    :return: int or None if the value is not an id
+    """
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def caller(address, room_id, player_id=None):
+    """ returns the key of the bucket of the caller, player ids are given out per room
+
+    :param address: address of the client
+    :param room_id: id of the room named by the request
+    :param player_id: id of a player seated in the room, None for a request that names no seated player
+    :return: hashable key
+    """
+
+    return address, room_id, player_id
+
+
+def retry_after(seconds):
+    """ returns the value of the Retry-After header, which takes whole seconds
+
+    :param seconds: number of seconds to wait
+    :return: str
+    """
+
+    return str(max(1, int(math.ceil(seconds))))
+
+
+class RateLimiter:
+    """
+    A class used to limit the polling requests of every caller with a token bucket
+
+    Attributes
+    ----------
+    rate: float
+        number of tokens a second given back to a bucket
+    burst: float
+        capacity of a bucket
+    address_share: float
+        number of times the bucket shared by all callers of an address is larger than the bucket of a caller
+    max_keys: int
+        number of buckets kept, the least recently used ones are dropped
+
+    Methods:
+    ----------
+    acquire(key)
+        takes a token of the caller and of its address or tells how long to wait for them
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, address_share=ADDRESS_SHARE, max_keys=MAX_KEYS):
+        """ sets the limiter without any bucket
+
+        :param rate: number of requests a second allowed to a caller
+        :param burst: number of requests a caller may send at once after being idle
+        :param address_share: number of times the bucket of an address is larger than the bucket of a caller
+        :param max_keys: number of buckets kept
+        """
+
+        if rate <= 0 or burst < 1 or address_share < 1:
+            raise ValueError("The rate must be positive, the burst and the share of an address at least 1.")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.address_share = float(address_share)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, rate, burst, now):
+        """ returns the bucket refilled for the time passed since it was last used, creating a full one if needed
+            a dropped bucket comes back full, which costs nothing to a caller idle for burst / rate seconds
+
+        :param key: key of the bucket
+        :param rate: number of tokens a second given back to the bucket
+        :param burst: capacity of the bucket
+        :param now: monotonic time
+        :return: list [tokens, time of the last refill]
+        """
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            while len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def acquire(self, key):
+        """ takes a token of the caller and a token of its address, a token is taken only if both are there
+
+        :param key: key of the caller returned by caller, its first item is the address
+        :return: 0.0 if the request is allowed, otherwise the number of seconds until the next token
+        """
+
+        now = time.monotonic()
+        rate = self.rate * self.address_share
+        with self._lock:
+            shared = self._bucket(key[0], rate, self.burst * self.address_share, now)
+            bucket = self._bucket(key, self.rate, self.burst, now)
+            if bucket[0] >= 1.0 and shared[0] >= 1.0:
+                bucket[0] -= 1.0
+                shared[0] -= 1.0
+                return 0.0
+            return max((1.0 - bucket[0]) / self.rate, (1.0 - shared[0]) / rate)
+
+
+class AdmissionControl:
+    """
+    A class used to shed the polling requests while the server is handling too many requests
+
+    Attributes
+    ----------
+    max_in_flight: int
+        number of counted requests handled at the same time before polling requests are shed
+    in_flight: int
+        number of counted requests being handled
+    shed: int
+        number of requests shed so far
+
+    Methods:
+    ----------
+    enter(sheddable)
+        admits the request or sheds it
+    leave()
+        marks an admitted request as handled
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        """ sets the control without any request
+
+        :param max_in_flight: number of counted requests handled at the same time before polling requests are shed
+        """
+
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def enter(self, sheddable):
+        """ admits the request unless it may be shed and the server is already full
+
+        :param sheddable: True for a polling request, the other requests are always admitted
+        :return: True if the request is admitted and leave has to be called when it is handled
+        """
+
+        with self._lock:
+            if sheddable and self.in_flight >= self.max_in_flight:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        """ marks an admitted request as handled
+        """
+
+        with self._lock:
+            self.in_flight -= 1
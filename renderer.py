@@ -0,0 +1,192 @@
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+"""
+    Imports
+    -------
+    sys
+    threading
+    OrderedDict
+    lru_cache
+
+    Data
+    ----------
+    CACHE_SIZE: int
+        default number of frames kept by a renderer
+
+    The frame of a board is built from a template compiled once per size: the
+    lines of the frame with a %s slot for the label of every tile. A label is the
+    number of an empty tile or its marker, centered to the width of the tile, so
+    a marker never has to be found in the drawing and replaced. Every renderer
+    keeps the latest frames in an LRU keyed by the state joined into one string,
+    one character per tile.
+    TerminalRenderer remembers the last state it showed and, as long as nothing
+    else was printed after it, rewrites only the tiles that changed.
+"""
+
+CACHE_SIZE = 1024
+
+
+class Renderer:
+    """
+    A class used to draw the boards of one size
+
+    Attributes
+    ----------
+    rows: int
+        number of rows of the board
+    cols: int
+        number of columns of the board
+    width: int
+        number of characters of a tile
+    template: str
+        lines of the frame with a %s slot for every tile
+    positions: tuple
+        (line, column) of the label of every tile in the frame, both counted from 0
+    height: int
+        number of lines of the frame
+
+    Methods:
+    ----------
+    label(tile_id, value)
+        returns the centered label of the tile
+    frame(state)
+        returns the drawing of the board
+    """
+
+    def __init__(self, rows, cols, cache_size=CACHE_SIZE):
+        """ compiles the template of the frame
+
+        :param rows: number of rows of the board
+        :param cols: number of columns of the board
+        :param cache_size: number of frames kept in the LRU
+        """
+
+        self.rows = rows
+        self.cols = cols
+        self.width = max(5, len(str(rows * cols)) + 2)
+        blank = "    |" + (" " * self.width + "|") * cols
+        separator = "    |" + "-" * (cols * (self.width + 1) - 1) + "|"
+        lines = ["", "    " + "_" * (cols * (self.width + 1) + 1)]
+        positions = []
+        for row in range(rows):
+            positions += [(len(lines) + 1, 5 + col * (self.width + 1)) for col in range(cols)]
+            lines += [blank, "    |" + "%s|" * cols, blank, separator]
+        lines.append("    ")
+        self.template = "\n".join(lines)
+        self.positions = tuple(positions)
+        self.height = len(lines)
+        self._empty = tuple(str(tile_id + 1).center(self.width) for tile_id in range(rows * cols))
+        self._markers = {}
+        self._frames = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def label(self, tile_id, value):
+        """ returns the label of the tile: its number if it is empty, otherwise its marker, centered
+
+        :param tile_id: id of the tile
+        :param value: value of the tile
+        :return: str of width characters
+        """
+
+        if value == '#':
+            return self._empty[tile_id]
+        label = self._markers.get(value)
+        if label is None:
+            label = self._markers[value] = value.center(self.width)
+        return label
+
+    def frame(self, state):
+        """ returns the drawing of the board, from the LRU if the state was drawn recently
+
+        :param state: list of values of board's tiles
+        :return: the appearance of the board
+        """
+
+        key = "".join(state)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                return frame
+        frame = self.template % tuple(self.label(tile_id, value) for tile_id, value in enumerate(state))
+        with self._lock:
+            self._frames[key] = frame
+            if len(self._frames) > self._cache_size:
+                self._frames.popitem(last=False)
+        return frame
+
+
+@lru_cache(maxsize=None)
+def renderer(rows, cols):
+    """ returns the renderer shared by all boards of the size
+
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :return: Renderer
+    """
+
+    return Renderer(rows, cols)
+
+
+class TerminalRenderer:
+    """
+    A class used to keep a board drawn on a terminal up to date
+
+    Attributes
+    ----------
+    stream: file
+        terminal the board is drawn on
+
+    Methods:
+    ----------
+    show(board)
+        draws the board, rewriting only the changed tiles of the last drawing
+    invalidate()
+        forgets the last drawing, the next one is drawn whole
+    """
+
+    def __init__(self, stream=None):
+        """ sets the renderer without any drawing
+
+        :param stream: terminal the board is drawn on, default sys.stdout
+        """
+
+        self.stream = stream if stream is not None else sys.stdout
+        self._renderer = None
+        self._shown = None
+
+    def invalidate(self):
+        """ forgets the last drawing, e.g. after something else has been printed below it
+        """
+
+        self._shown = None
+
+    def show(self, board):
+        """ draws the board
+            the whole frame is printed the first time, then the cursor goes up to every changed tile,
+            rewrites its label and comes back below the frame
+
+        :param board: Board or BitBoard
+        """
+
+        rows, cols, win_length = board.get_dimensions()
+        state = list(board.get_state())
+        if self._renderer is None or (self._renderer.rows, self._renderer.cols) != (rows, cols):
+            self._renderer = renderer(rows, cols)
+            self._shown = None
+        if self._shown is None:
+            self.stream.write(self._renderer.frame(state) + "\n")
+        else:
+            parts = []
+            for tile_id, (old, new) in enumerate(zip(self._shown, state)):
+                if old != new:
+                    line, column = self._renderer.positions[tile_id]
+                    parts.append("\x1b7\x1b[%dA\x1b[%dG%s\x1b8"
+                                 % (self._renderer.height - line, column + 1, self._renderer.label(tile_id, new)))
+            self.stream.write("".join(parts))
+        self.stream.flush()
+        self._shown = state
@@ -1,31 +1,186 @@
-from flask import Flask, json, request
+import os
+import time
+from flask import Flask, Response, abort, g, json, request, stream_with_context
+from werkzeug.exceptions import BadRequest
+from game_room import GameRegistry, DEFAULT_ROOM, SPECTATOR_BACKLOG, CLOSED_EVENT, check_dimensions
+from game_store import SQLiteStore
+from matchmaking import Matchmaker
+from metrics import Metrics, CONTENT_TYPE
+from rate_limit import (RateLimiter, AdmissionControl, RATE, BURST, ADDRESS_SHARE, MAX_IN_FLIGHT, PLAYER_HEADER,
+                        RETRY_AFTER, is_long, is_polling, player_of, caller, retry_after)
+import wire
 
 app = Flask(__name__)
 
 """
     Imports
     ----------
-    Flask, json, request
-    
+    os
+    time
+    Flask, Response, abort, g, json, request, stream_with_context
+    BadRequest
+    GameRegistry, DEFAULT_ROOM, SPECTATOR_BACKLOG, CLOSED_EVENT, check_dimensions
+    SQLiteStore
+    Matchmaker
+    Metrics, CONTENT_TYPE
+    RateLimiter, AdmissionControl, RATE, BURST, ADDRESS_SHARE, MAX_IN_FLIGHT, PLAYER_HEADER, RETRY_AFTER,
+    is_long, is_polling, player_of, caller, retry_after
+    wire
+
     Data
     ----------
-    players: dict
-        a dictionary that stores id players
-    markers: dict
-        a dictionary that stores players markers
-    board: list
-        a list that stores players' moves
-    current_player: int
-        stores the id of the player who currently has a turn
-    current_tile: int
-        stores the id of the tile that was last selected by the player
+    ROOM_IDLE_TIMEOUT: float
+        number of seconds after which an unused room is evicted
+    MAX_ROOMS: int
+        maximum number of rooms hosted at the same time
+    FINISHED_ROOM_TIMEOUT: float
+        number of seconds a room with a finished game is kept
+    LONG_POLL_TIMEOUT: float
+        maximum number of seconds a long-poll request is held by the server
+    STREAM_KEEPALIVE: float
+        number of seconds after which an idle event stream gets a keep-alive comment
+    rooms: GameRegistry
+        stores all games hosted by the server, keyed by room id
+    matchmaker: Matchmaker
+        pairs the players waiting for a game into new rooms, None when the rooms are shared through
+        TICTACTOE_STORE by several workers
+    metrics: Metrics
+        counts the requests, their latencies and the moves, exposed on /metrics
+    limiter: RateLimiter
+        limits the polling requests of every player, None to switch the limit off
+    admission: AdmissionControl
+        sheds the polling requests while too many requests are handled, None to switch it off
+
+    Every /api route is available in two forms: /api/rooms/<room_id>/... scoped to
+    the given room, and the original /api/... which uses the default room. Only
+    setdata creates a room, the read routes answer 404 for a room that does not
+    exist, so reading made up room ids never evicts the games being played.
+
+    A process keeps its rooms in memory, unless the TICTACTOE_STORE environment
+    variable or the --store option names a SQLite database shared by all workers,
+    e.g. TICTACTOE_STORE=games.db gunicorn -w 4 server:app. The matchmaking queues
+    are kept by one process, and the requests of a waiting player could reach
+    different workers, so /api/match answers 501 when the rooms are shared through
+    TICTACTOE_STORE. A single process started with --store keeps the matchmaking.
+
+    The polling routes are limited per player and shed while the server is full,
+    see rate_limit.py. The limits are set by --rate, --burst, --address-share and
+    --max-in-flight.
 """
 
-players = {"player1": None, "player2": None}
-markers = {}
-board = []
-current_player = None
-current_tile = 0
+ROOM_IDLE_TIMEOUT = 600.0
+MAX_ROOMS = 100000
+FINISHED_ROOM_TIMEOUT = 60.0
+LONG_POLL_TIMEOUT = 30.0
+STREAM_KEEPALIVE = 15.0
+
+rooms = GameRegistry(ROOM_IDLE_TIMEOUT, MAX_ROOMS, FINISHED_ROOM_TIMEOUT)
+matchmaker = Matchmaker(rooms)
+if os.environ.get('TICTACTOE_STORE'):
+    rooms.attach_store(SQLiteStore(os.environ['TICTACTOE_STORE']))
+    matchmaker = None
+metrics = Metrics()
+limiter = RateLimiter()
+admission = AdmissionControl()
+
+
+def room_route(rule, **options):
+    """ registers the view under the room-scoped rule and under the default room rule
+
+    :param rule: rule relative to the /api prefix
+    :param options: options passed to app.route
+    :return: decorator registering the view
+    """
+
+    def decorator(view):
+        app.route("/api/rooms/<room_id>" + rule, **options)(view)
+        app.route("/api" + rule, defaults={'room_id': DEFAULT_ROOM}, **options)(view)
+        return view
+    return decorator
+
+
+def find_room(room_id):
+    """ returns the existing room named by the request, the request is answered 404 if there is no such game
+
+    :param room_id: id of the room
+    :return: GameRoom
+    """
+
+    room = rooms.find(room_id)
+    if room is None:
+        abort(Response(json.dumps({"error": "There is no such game."}), status=404, mimetype='application/json'))
+    return room
+
+
+@app.before_request
+def start_timer():
+    """ remembers when the request started
+    """
+
+    g.started = time.perf_counter()
+
+
+@app.before_request
+def throttle():
+    """ answers a polling request over the limit of its player with 429 and sheds it with 503 while
+        the server is full, in both cases before any work is done and with Retry-After
+
+    :return: error response or None to handle the request
+    """
+
+    if request.url_rule is None or is_long(request.method, request.url_rule.rule):
+        return None
+    polling = is_polling(request.method, request.url_rule.rule)
+    if polling and limiter is not None:
+        room_id = request.view_args.get('room_id')
+        player_id = player_of(request.headers.get(PLAYER_HEADER) or request.args.get('id'))
+        if not rooms.seated(room_id, player_id):
+            player_id = None
+        delay = limiter.acquire(caller(request.remote_addr, room_id, player_id))
+        if delay:
+            return {"error": "Too many requests."}, 429, {'Retry-After': retry_after(delay)}
+    if admission is not None:
+        if not admission.enter(polling):
+            return {"error": "The server is busy."}, 503, {'Retry-After': str(RETRY_AFTER)}
+        g.admitted = True
+    return None
+
+
+@app.teardown_request
+def release(error):
+    """ marks the admitted request as handled
+
+    :param error: exception raised by the request or None
+    """
+
+    if g.pop('admitted', False):
+        admission.leave()
+
+
+@app.after_request
+def record_request(response):
+    """ records the route, the status and the latency of the request
+
+    :param response: response of the request
+    :return: the same response
+    """
+
+    started = g.get('started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+@app.route("/metrics")
+def get_metrics():
+    """ sends the request counters, the latency histograms, the moves and the numbers of games and players
+
+    :return: metrics in the text exposition format
+    """
+
+    return Response(metrics.render(rooms), content_type=CONTENT_TYPE)
+
 
 @app.route("/")
 def homepage():
@@ -37,173 +192,307 @@ def homepage():
     return "<html><body>Tic-tac-toe</body></html>"  # tu jest to co sie wyswietla dla uzytkownika
 
 
-@app.route("/api/getdata/tile_id", methods=['GET'])
-def get_tiles():
+@app.route("/api/match", methods=['POST'])
+def join_match():
+    """ pairs the player given by the id key with a waiting player or queues the player
+        the optional 'skill' and 'dimensions' keys choose the queue
+
+    :return: 'matched' status with the room id and the opponent or 'waiting' status, number that indicates
+             that request has succeeded and a new resource has been created as a result
+    """
+
+    if matchmaker is None:
+        return {"error": "Matchmaking needs a single server process, its queues are not shared."}, 501
+    data = request.get_json(silent=True) or {}
+    if data.get('id') is None:
+        return {"error": "The id of the player is missing."}, 400
+    try:
+        return matchmaker.join(data['id'], data.get('skill'), data.get('dimensions')), 201
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+
+@app.route("/api/match", methods=['GET'])
+def wait_match():
+    """ holds the request until the player given by the id argument is matched or the timeout expires
+        the timeout argument is given in seconds and is limited by LONG_POLL_TIMEOUT
+
+    :return: status of the player, number that indicates the request has succeeded
+    """
+
+    if matchmaker is None:
+        return {"error": "Matchmaking needs a single server process, its queues are not shared."}, 501
+    player_id = request.args.get('id', type=int)
+    timeout = min(request.args.get('timeout', LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    return matchmaker.wait(player_id, max(timeout, 0.0)), 200
+
+
+@app.route("/api/match", methods=['DELETE'])
+def leave_match():
+    """ removes the player given by the id argument from the queue
+
+    :return: empty dict, number that indicates the request has succeeded
+    """
+
+    if matchmaker is None:
+        return {"error": "Matchmaking needs a single server process, its queues are not shared."}, 501
+    matchmaker.leave(request.args.get('id', type=int))
+    return {}, 200
+
+
+@room_route("/getdata/tile_id", methods=['GET'])
+def get_tiles(room_id):
     """ gets the id of the tile selected by the client
 
     :return: id of the tile that was last selected by the player, number that indicates the request has succeeded
     """
 
-    return current_tile, 200
+    room = find_room(room_id)
+    return json.dumps(room.current_tile), 200
 
-@app.route("/api/getdata/board", methods=['GET'])
-def get_board():
+
+@room_route("/getdata/board", methods=['GET'])
+def get_board(room_id):
     """ sends the board to the client
 
     :return: board, number that indicates the request has succeeded
     """
 
-    return json.dumps(board), 200
+    room = find_room(room_id)
+    return json.dumps(room.board), 200
+
 
-@app.route("/api/getdata/ndplayer_mark", methods=['GET'])
-def get_second_player_marker():
+@room_route("/getdata/ndplayer_mark", methods=['GET'])
+def get_second_player_marker(room_id):
     """ sends the second player marker to the client
 
     :return: marker of second player 'x' or 'o',  number that indicates the request has succeeded
     """
 
-    if players['player1'] not in markers:
+    room = find_room(room_id)
+    with room.lock:
+        marker = room.second_player_marker()
+    if marker is None:
         return {}, 200
-    markers[players['player2']] = 'o' if markers[players['player1']] == 'x' else 'x'
-    return json.dumps(markers[players['player2']]), 200
+    return json.dumps(marker), 200
 
 
-@app.route("/api/getdata/stplayer_mark", methods=['GET'])
-def get_first_player_marker():
+@room_route("/getdata/stplayer_mark", methods=['GET'])
+def get_first_player_marker(room_id):
     """ sends the first player marker to the client
 
     :return: marker of first player 'x' or 'o', number that indicates the request has succeeded
     """
 
-    markers[players['player1']] = 'o' if markers[players['player2']] == 'x' else 'x'
-    return json.dumps(markers[players['player1']]), 200
+    room = find_room(room_id)
+    with room.lock:
+        marker = room.first_player_marker()
+    return json.dumps(marker), 200
+
 
-@app.route("/api/getdata/current_player", methods=['GET'])
-def get_current_player():
+@room_route("/getdata/current_player", methods=['GET'])
+def get_current_player(room_id):
     """ sends information about the id of the player who has a turn
 
-    :return: current player id, number that indicates the request has succeeded
+    :return: current player id as json, null while nobody has a turn, number that indicates the request has succeeded
     """
 
-    global current_player
-    return str(current_player), 200
+    room = find_room(room_id)
+    return json.dumps(room.current_player), 200
 
 
-@app.route("/api/setdata", methods=['POST'])
-def setdata():
-    """ receives data from the customer
-        recognizes and sets data according to the key
+@room_route("/getdata/wait_turn", methods=['GET'])
+def wait_turn(room_id):
+    """ holds the request until the player given by the id argument has a turn or the timeout expires
+        the timeout argument is given in seconds and is limited by LONG_POLL_TIMEOUT
 
-    :return: response, number that indicates that request has succeeded and a new resource has been created as a result
+    :return: current player id as json, null while nobody has a turn, number that indicates the request has succeeded
     """
 
-    data = request.get_json()
-    response = None
-    status = 201
-    if data is not None:
-        if 'i_am_here' in data:
-            response = set_connect(data)
-
-        elif 'marker' in data:
-            response = set_marker(data)
-
-        elif 'current_board' in data:
-            response = set_board(data)
-
-        elif 'tile_id' in data:
-            response = set_tile(data)
+    player_id = request.args.get('id', type=int)
+    timeout = min(request.args.get('timeout', LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    room = find_room(room_id)
+    current_player = room.wait_for_turn(player_id, max(timeout, 0.0))
+    room.touch()
+    return json.dumps(current_player), 200
 
-    return response, status
 
+@room_route("/getdata/state", methods=['GET'])
+def get_state(room_id):
+    """ sends the turn, the board, the markers and the result of the room at once, tagged with the room version
+        a client sending the tag in If-None-Match gets an empty 304 response while nothing has changed,
+        a client accepting the compact encoding of the wire module gets the state in it
 
-def set_connect(data):
-    """ connects the client to the server by id number
-
-    :param data: client id
-    :return: dictionary with communicate to client and number describing order in which player joined the server
+    :return: state of the room or empty response, number that indicates the request has succeeded or not modified
     """
 
-    global current_player
-    if players['player1'] is None:
-        players['player1'] = data['id']
-        current_player = players['player1']
-        return {"prompt": "You're player 1!", "number": 1}
-    elif players['player2'] is None:
-        players['player2'] = data['id']
-        return {"prompt": "You're player 2!", "number": 2}
-    elif players['player1'] == data['id']:
-        return {"prompt": "Player 1, welcome back!", "number": 3}
-    elif players['player2'] == data['id']:
-        return {"prompt": "Player 2, welcome back!", "number": 4}
+    room = find_room(room_id)
+    etag, body = room.state()
+    data = room.wire_state()[1] if wire.accepts(request.headers.get('Accept')) else None
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif data is not None:
+        response = Response(data, status=200, mimetype=wire.CONTENT_TYPE)
     else:
-        return {"prompt": "There already is a maximum number of players.", "number": -1}
+        response = Response(body, status=200, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
 
 
-def set_marker(data):
-    """ gets information from the client which marker the first player chose
-        sets chosen marker
+@room_route("/events", methods=['GET'])
+def events(room_id):
+    """ keeps the connection open and pushes every change of the room as a Server-Sent Event
+        the stream starts with a 'state' event, a client resuming with Last-Event-ID gets only the missed events,
+        it ends with a 'closed' event once the room is cleared or evicted
 
-    :param data: player marker 'x' or 'o'
-    :return: empty dict
+    :return: event stream response
     """
 
-    if players['player1'] == data['id']:
-        markers[players['player1']] = data['marker']
-        return {}
-
+    room = find_room(room_id)
+    version = request.headers.get('Last-Event-ID', -1, type=int)
+
+    def stream():
+        nonlocal version
+        while True:
+            version, frames = room.frames(version, STREAM_KEEPALIVE)
+            if not frames and not rooms.holds(room):
+                frames = [CLOSED_EVENT]
+            room.touch()
+            yield b"".join(frames) if frames else b": keep-alive\n\n"
+            if frames[-1:] == [CLOSED_EVENT]:
+                return
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@room_route("/watch", methods=['GET'])
+def watch(room_id):
+    """ streams the changes of the game to a read-only spectator as Server-Sent Events until the game is over
+        or the room is cleared or evicted, then the stream ends with a 'closed' event
+        the events are serialized once for all streams, a spectator lagging more than SPECTATOR_BACKLOG changes
+        gets only the latest snapshot, so a slow spectator never holds up the players
+        every spectator takes a thread here, crowds of spectators are served by async_server.py
+
+    :return: event stream response or error, number that indicates the request has succeeded or the room is not found
+    """
 
-def set_tile(data):
-    """ gets information from the client about chosen tile
-        sets current tile id
+    room = find_room(room_id)
+    version = request.headers.get('Last-Event-ID', -1, type=int)
 
-    :param data: chosen tile id
-    :return: empty dict
-    """
+    def stream():
+        nonlocal version
+        while True:
+            version, frames = room.frames(version, STREAM_KEEPALIVE, SPECTATOR_BACKLOG)
+            if not frames and not rooms.holds(room):
+                frames = [CLOSED_EVENT]
+            yield b"".join(frames) if frames else b": keep-alive\n\n"
+            if frames[-1:] == [CLOSED_EVENT] or room.result is not None and room.version == version:
+                return
 
-    global current_tile
-    current_tile = data['tile_id']
-    switch_player()
-    return {}
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
-def set_board(data):
-    """ gets boards from the client
-        set current board
+@room_route("/setdata", methods=['POST'])
+def setdata(room_id):
+    """ receives data from the customer
+        recognizes and sets data according to the key
+        a move may be sent and answered in the compact encoding of the wire module, announced in Accept-Post
 
-    :param data: the board to be set
-    :return: empty dict
+    :return: response, number that indicates that request has succeeded and a new resource has been created as a result
     """
 
-    global board
-    board = data['current_board']
-    return {}
+    headers = {'Accept-Post': "application/json, " + wire.CONTENT_TYPE}
+    if request.mimetype == wire.CONTENT_TYPE:
+        try:
+            data = wire.decode_move(request.get_data())
+        except ValueError:
+            return {"error": "The move cannot be decoded."}, 400
+    else:
+        try:
+            data = request.get_json()
+        except BadRequest:
+            return {"error": "The body is not valid JSON."}, 400
+    if data is not None and not isinstance(data, dict):
+        return {"error": "The body must be a JSON object."}, 400
+    if data is not None and 'reserve' in data:
+        return {"error": "Only the matchmaking reserves rooms."}, 400
+    if data is not None and 'i_am_here' in data and data.get('dimensions') is not None:
+        try:
+            check_dimensions(data['dimensions'])
+        except ValueError as error:
+            return {"error": str(error)}, 400
+    response = None
+    status = 201
+    if data is not None:
+        room, response = rooms.apply(room_id, data)
+        if 'tile_id' in data or 'move' in data and response['ok']:
+            metrics.count_move()
+        if room.result is not None:
+            rooms.finish(room_id)
+        if 'move' in data and wire.accepts(request.headers.get('Accept')):
+            try:
+                return Response(wire.encode_move_response(response, room.snapshot()), status=status,
+                                mimetype=wire.CONTENT_TYPE, headers=headers)
+            except ValueError:
+                pass
 
+    return response, status, headers
 
-def switch_player():
-    """ changes the player who has a turn
-    """
 
-    global current_player
-    current_player = players['player2'] if current_player == players['player1'] else players['player1']
-
-@app.route("/api/clear", methods=['POST'])
-def reset_server():
-    """ resets server to default values
+@room_route("/clear", methods=['POST'])
+def reset_server(room_id):
+    """ resets the room to default values by removing it from the registry
 
     :return: empty dict, number that indicates that request has succeeded and a new resource has been created as a result
     """
-    global players, markers, board, current_player, current_tile
-    request.get_json()
-    players = {"player1": None, "player2": None}
-    markers = {}
-    board = []
-    current_player = None
-    current_tile = 0
 
-    return {}, 201
+    request.get_json(silent=True)
+    rooms.remove(room_id)
 
+    return {}, 201
 
 
 if __name__ == "__main__":
-    app.run()
-
+    import argparse
+    from move_log import MoveLog
+    from game_archive import GameArchive
+
+    parser = argparse.ArgumentParser(description="Tic-tac-toe server")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="port to listen on")
+    parser.add_argument("--log", default=None, help="move log restoring the games after a restart")
+    parser.add_argument("--archive", default=None, help="archive the finished games are recorded in")
+    parser.add_argument("--store", default=None, help="SQLite database sharing the rooms with other workers")
+    parser.add_argument("--rate", type=float, default=RATE,
+                        help="polling requests a second allowed to a player, 0 switches the limit off")
+    parser.add_argument("--burst", type=float, default=BURST,
+                        help="polling requests a player may send at once after being idle")
+    parser.add_argument("--address-share", type=float, default=ADDRESS_SHARE,
+                        help="times the limit of all players of one address is larger than the limit of a player")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="requests handled at the same time before polling is shed, 0 switches it off")
+    args = parser.parse_args()
+    limiter = RateLimiter(args.rate, args.burst, args.address_share) if args.rate > 0 else None
+    admission = AdmissionControl(args.max_in_flight) if args.max_in_flight > 0 else None
+    if args.store and args.log:
+        parser.error("--log restores the rooms of one process, a shared --store keeps them already")
+    if args.store and rooms.store is None:
+        rooms.attach_store(SQLiteStore(args.store))
+    if args.archive:
+        rooms.archive = GameArchive(args.archive)
+    journal = None
+    if args.log:
+        journal = MoveLog(args.log)
+        rooms.attach(journal)
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        if journal is not None:
+            journal.close()
+        rooms.detach_store()
+        if rooms.archive is not None:
+            rooms.archive.close()
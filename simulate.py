@@ -0,0 +1,431 @@
+import argparse
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ai import AIEngine, rays
+from bitboard import make_board
+
+"""
+    Imports
+    -------
+    argparse
+    os
+    random
+    Counter
+    ProcessPoolExecutor, FIRST_COMPLETED, wait
+    AIEngine, rays
+    make_board
+
+    Data
+    ----------
+    MARKERS: tuple
+        markers of the player moving first and of the player moving second
+    POLICIES: dict
+        policy classes available by name
+
+    Games are played on Board objects directly, without the server and without
+    input(). The games are split into chunks played by a process pool, and the
+    results of every finished chunk are merged into the running totals.
+"""
+
+MARKERS = ('x', 'o')
+
+
+class RandomPolicy:
+    """
+    A class used to play uniformly random moves
+
+    Methods:
+    ----------
+    choose(board, marker, rng)
+        chooses the tile for the player using the marker
+    """
+
+    name = 'random'
+
+    def choose(self, board, marker, rng):
+        """ chooses a random empty tile
+
+        :param board: the current board
+        :param marker: marker of the player to move
+        :param rng: random.Random of the simulation
+        :return: id of the chosen tile
+        """
+
+        return rng.choice([tile_id for tile_id, value in enumerate(board.get_state()) if value == '#'])
+
+
+class GreedyPolicy(RandomPolicy):
+    """
+    A class used to play a winning move if there is one, otherwise to block the opponent, otherwise a random move
+
+    Methods:
+    ----------
+    choose(board, marker, rng)
+        chooses the tile for the player using the marker
+    """
+
+    name = 'greedy'
+
+    def choose(self, board, marker, rng):
+        """ chooses a winning tile, a blocking tile or a random empty tile
+
+        :param board: the current board
+        :param marker: marker of the player to move
+        :param rng: random.Random of the simulation
+        :return: id of the chosen tile
+        """
+
+        state = board.get_state()
+        rows, cols, win_length = board.get_dimensions()
+        lines = rays(rows, cols, win_length)
+        opponent = MARKERS[1] if marker == MARKERS[0] else MARKERS[0]
+        empty = [tile_id for tile_id, value in enumerate(state) if value == '#']
+        for player in (marker, opponent):
+            for tile_id in empty:
+                if self._completes_line(state, tile_id, player, lines[tile_id], win_length):
+                    return tile_id
+        return rng.choice(empty)
+
+    @staticmethod
+    def _completes_line(state, tile_id, marker, tile_rays, win_length):
+        """ checks if placing the marker on the tile completes a line
+
+        :param state: list of values of board's tiles
+        :param tile_id: empty tile
+        :param marker: marker to place
+        :param tile_rays: (forward tiles, backward tiles) pairs of the tile
+        :param win_length: number of markers in a row needed to win
+        :return: True if the move wins
+        """
+
+        for forward, backward in tile_rays:
+            count = 1
+            for side in (forward, backward):
+                for i in side:
+                    if state[i] != marker:
+                        break
+                    count += 1
+            if count >= win_length:
+                return True
+        return False
+
+
+class EnginePolicy:
+    """
+    A class used to play the moves chosen by AIEngine
+
+    Attributes
+    ----------
+    max_depth: int
+        maximum number of plies searched
+    time_budget: float
+        number of seconds the engine may spend on one move
+    book_path: str
+        path of the opening book, None to always search
+
+    Methods:
+    ----------
+    choose(board, marker, rng)
+        chooses the tile for the player using the marker
+    """
+
+    name = 'engine'
+
+    def __init__(self, max_depth=None, time_budget=1.0, book_path=None):
+        """ sets the policy, the engine is created in the process that plays the games
+
+        :param max_depth: maximum number of plies searched
+        :param time_budget: number of seconds the engine may spend on one move
+        :param book_path: path of the opening book, default None
+        """
+
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.book_path = book_path
+        self._engine = None
+
+    def __getstate__(self):
+        return {'max_depth': self.max_depth, 'time_budget': self.time_budget, 'book_path': self.book_path,
+                '_engine': None}
+
+    def choose(self, board, marker, rng):
+        """ chooses the tile with the engine
+
+        :param board: the current board
+        :param marker: marker of the player to move
+        :param rng: random.Random of the simulation, not used
+        :return: id of the chosen tile
+        """
+
+        if self._engine is None:
+            book = None
+            if self.book_path is not None:
+                from opening_book import OpeningBook
+                book = OpeningBook(self.book_path)
+            self._engine = AIEngine(self.max_depth, self.time_budget, book=book)
+        return self._engine.best_move(board, marker)
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, GreedyPolicy, EnginePolicy)}
+
+
+class SimulationStats:
+    """
+    A class used to aggregate the results of simulated games
+
+    Attributes
+    ----------
+    games: int
+        number of played games
+    wins: Counter
+        number of won games by policy name, None counts the draws
+    seat_wins: Counter
+        number of won games by seat: 'first', 'second' or None for a draw
+    lengths: Counter
+        number of games by the number of moves played
+    openings: dict
+        (games, first player wins) by the first tile played
+
+    Methods:
+    ----------
+    add(winner, seat, length, opening)
+        records one game
+    merge(other)
+        adds the results of other stats
+    win_rate(name)
+        returns the fraction of games won by the policy
+    first_move_advantage()
+        returns the win rate of the first player minus the win rate of the second player
+    summary()
+        returns the results as a dictionary
+    """
+
+    def __init__(self):
+        """ sets empty stats
+        """
+
+        self.games = 0
+        self.wins = Counter()
+        self.seat_wins = Counter()
+        self.lengths = Counter()
+        self.openings = {}
+
+    def add(self, winner, seat, length, opening):
+        """ records one game
+
+        :param winner: name of the winning policy, None for a draw
+        :param seat: 'first' or 'second' for the seat of the winner, None for a draw
+        :param length: number of moves played
+        :param opening: first tile played
+        """
+
+        self.games += 1
+        self.wins[winner] += 1
+        self.seat_wins[seat] += 1
+        self.lengths[length] += 1
+        games, first_wins = self.openings.get(opening, (0, 0))
+        self.openings[opening] = (games + 1, first_wins + (seat == 'first'))
+
+    def merge(self, other):
+        """ adds the results of other stats
+
+        :param other: SimulationStats
+        :return: self
+        """
+
+        self.games += other.games
+        self.wins.update(other.wins)
+        self.seat_wins.update(other.seat_wins)
+        self.lengths.update(other.lengths)
+        for opening, (games, first_wins) in other.openings.items():
+            total_games, total_first_wins = self.openings.get(opening, (0, 0))
+            self.openings[opening] = (total_games + games, total_first_wins + first_wins)
+        return self
+
+    def win_rate(self, name):
+        """ returns the fraction of games won by the policy, None counts the draws
+
+        :param name: name of the policy
+        :return: fraction of the games
+        """
+
+        return self.wins[name] / self.games if self.games else 0.0
+
+    def first_move_advantage(self):
+        """ returns the win rate of the first player minus the win rate of the second player
+
+        :return: difference of the fractions of the games
+        """
+
+        if not self.games:
+            return 0.0
+        return (self.seat_wins['first'] - self.seat_wins['second']) / self.games
+
+    def summary(self):
+        """ returns the results as a json serializable dictionary
+
+        :return: dictionary
+        """
+
+        return {
+            'games': self.games,
+            'win_rates': {name or 'draw': self.win_rate(name) for name in self.wins},
+            'first_move_advantage': self.first_move_advantage(),
+            'lengths': dict(sorted(self.lengths.items())),
+            'openings': {tile_id: {'games': games, 'first_win_rate': first_wins / games}
+                         for tile_id, (games, first_wins) in sorted(self.openings.items())},
+        }
+
+
+def play(first, second, rng, board_kind='list', rows=3, cols=3, win_length=3):
+    """ plays one game between two policies
+
+    :param first: policy moving first
+    :param second: policy moving second
+    :param rng: random.Random used by the policies
+    :param board_kind: 'list' or 'bitboard'
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: tuple (seat of the winner or None for a draw, number of moves, first tile)
+    """
+
+    board = make_board(board_kind, rows, cols, win_length)
+    policies = (first, second)
+    opening = None
+    for move in range(rows * cols):
+        seat = move % 2
+        tile_id = policies[seat].choose(board, MARKERS[seat], rng)
+        if opening is None:
+            opening = tile_id
+        board.place(MARKERS[seat], tile_id)
+        if board.check_win():
+            return ('first', 'second')[seat], move + 1, opening
+    return None, rows * cols, opening
+
+
+def play_chunk(policy_a, policy_b, games, seed, swap_sides=True, board_kind='list', rows=3, cols=3, win_length=3):
+    """ plays a chunk of games, the work of one task of the process pool
+
+    :param policy_a: first policy
+    :param policy_b: second policy
+    :param games: number of games
+    :param seed: seed of the random generator of the chunk
+    :param swap_sides: alternate which policy moves first
+    :param board_kind: 'list' or 'bitboard'
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: SimulationStats
+    """
+
+    rng = random.Random(seed)
+    stats = SimulationStats()
+    for game in range(games):
+        a_first = not swap_sides or game % 2 == 0
+        first, second = (policy_a, policy_b) if a_first else (policy_b, policy_a)
+        seat, length, opening = play(first, second, rng, board_kind, rows, cols, win_length)
+        winner = None if seat is None else (first if seat == 'first' else second)
+        stats.add(None if winner is None else _label(winner, policy_a, policy_b), seat, length, opening)
+    return stats
+
+
+def _label(policy, policy_a, policy_b):
+    """ names the policy, telling the two policies apart when they are of the same kind
+
+    :param policy: policy to name
+    :param policy_a: first policy of the simulation
+    :param policy_b: second policy of the simulation
+    :return: name of the policy
+    """
+
+    if policy_a.name != policy_b.name:
+        return policy.name
+    return policy.name + (' (a)' if policy is policy_a else ' (b)')
+
+
+def simulate(games, policy_a, policy_b, workers=None, chunk_size=1000, seed=0, swap_sides=True,
+             board_kind='list', rows=3, cols=3, win_length=3):
+    """ plays the games on a process pool and yields the running totals after every finished chunk
+        at most two chunks per worker are queued at a time, so memory does not grow with the number of games
+
+    :param games: number of games
+    :param policy_a: first policy
+    :param policy_b: second policy
+    :param workers: number of processes, default the number of CPUs
+    :param chunk_size: number of games played by one task
+    :param seed: seed of the simulation, chunk n uses seed + n
+    :param swap_sides: alternate which policy moves first
+    :param board_kind: 'list' or 'bitboard'
+    :param rows: number of rows of the board
+    :param cols: number of columns of the board
+    :param win_length: number of markers in a row needed to win
+    :return: generator of SimulationStats with the results of all games finished so far
+    """
+
+    workers = workers or os.cpu_count() or 1
+    chunks = [(index, min(chunk_size, games - start)) for index, start in enumerate(range(0, games, chunk_size))]
+    totals = SimulationStats()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < workers * 2:
+                index, size = chunks[next_chunk]
+                pending.add(executor.submit(play_chunk, policy_a, policy_b, size, seed + index, swap_sides,
+                                            board_kind, rows, cols, win_length))
+                next_chunk += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                totals.merge(future.result())
+            yield totals
+
+
+def make_policy(name, max_depth=None, time_budget=1.0, book_path=None):
+    """ creates the policy by name
+
+    :param name: 'random', 'greedy' or 'engine'
+    :param max_depth: maximum number of plies searched by the engine
+    :param time_budget: number of seconds the engine may spend on one move
+    :param book_path: path of the opening book used by the engine
+    :return: the policy
+    """
+
+    if name == 'engine':
+        return EnginePolicy(max_depth, time_budget, book_path)
+    return POLICIES[name]()
+
+
+if __name__ == "__main__":
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Headless tic-tac-toe self-play simulator")
+    parser.add_argument("--games", type=int, default=100000, help="number of games to play")
+    parser.add_argument("--a", choices=sorted(POLICIES), default='random', help="first policy")
+    parser.add_argument("--b", choices=sorted(POLICIES), default='random', help="second policy")
+    parser.add_argument("--no-swap", action="store_true", help="let the first policy always move first")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--chunk", type=int, default=1000, help="number of games played by one task")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulation")
+    parser.add_argument("--board", choices=('list', 'bitboard'), default='bitboard', help="representation of the board")
+    parser.add_argument("--rows", type=int, default=3, help="number of rows of the board")
+    parser.add_argument("--cols", type=int, default=3, help="number of columns of the board")
+    parser.add_argument("--win-length", type=int, default=3, help="number of markers in a row needed to win")
+    parser.add_argument("--ai-depth", type=int, default=None, help="maximum number of plies searched by the engine")
+    parser.add_argument("--ai-time", type=float, default=1.0, help="seconds the engine may think about a move")
+    parser.add_argument("--book", default=None, help="opening book file used by the engine")
+    args = parser.parse_args()
+
+    policy_a = make_policy(args.a, args.ai_depth, args.ai_time, args.book)
+    policy_b = make_policy(args.b, args.ai_depth, args.ai_time, args.book)
+    start = time.perf_counter()
+    stats = SimulationStats()
+    for stats in simulate(args.games, policy_a, policy_b, args.workers, args.chunk, args.seed, not args.no_swap,
+                          args.board, args.rows, args.cols, args.win_length):
+        elapsed = time.perf_counter() - start
+        print("%d/%d games, %.0f games/s, first move advantage %.4f"
+              % (stats.games, args.games, stats.games / elapsed, stats.first_move_advantage()))
+    print(json.dumps(stats.summary(), indent=2))
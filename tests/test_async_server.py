@@ -0,0 +1,273 @@
+import asyncio
+import json
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+import async_server
+import wire
+from game_room import GameRegistry
+from game_store import SQLiteStore
+from rate_limit import RateLimiter, AdmissionControl, PLAYER_HEADER
+
+"""
+    Imports
+    -------
+    asyncio
+    json
+    pytest
+    TestClient, TestServer
+    async_server
+    wire
+    GameRegistry
+    SQLiteStore
+    RateLimiter, AdmissionControl, PLAYER_HEADER
+
+    Data
+    ----------
+    READ_ROUTES: list
+        routes of a room that only read it
+
+    Tests of the routes of the asyncio server through the test client of aiohttp,
+    every test runs on its own event loop with a new application: the same games
+    and refusals as the tests of server.py, the long-poll and the event stream
+    woken up by a move or a /clear on the same loop, and two applications sharing
+    the rooms through one store like two workers.
+"""
+
+READ_ROUTES = ["/getdata/tile_id", "/getdata/board", "/getdata/ndplayer_mark", "/getdata/stplayer_mark",
+               "/getdata/current_player", "/getdata/wait_turn?timeout=0", "/getdata/state", "/events", "/watch"]
+
+
+def run(scenario, app=None):
+    """ runs the scenario with a test client of the application on a new event loop
+
+    :param scenario: coroutine function taking the client
+    :param app: web.Application, default a new one with a new registry
+    :return: value returned by the scenario
+    """
+
+    if app is None:
+        app = async_server.create_app(GameRegistry())
+
+    async def main():
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+async def read(client, url):
+    """ returns the decoded body of a read route
+
+    :param client: test client
+    :param url: url of the route
+    :return: decoded json
+    """
+
+    response = await client.get(url)
+    assert response.status == 200
+    return json.loads(await response.text())
+
+
+async def play(client, prefix, tiles, player1=1, player2=2):
+    """ seats two players in the room, the first one takes 'x', and plays the tiles in turns
+
+    :param client: test client
+    :param prefix: /api/rooms/<room_id> or /api for the default room
+    :param tiles: ids of the tiles in the order of the moves
+    :param player1: id of the first player
+    :param player2: id of the second player
+    :return: list of the decoded responses to the moves
+    """
+
+    for number, player_id in enumerate((player1, player2), 1):
+        response = await client.post(prefix + "/setdata", json={'i_am_here': 1, 'id': player_id})
+        assert (await response.json())['number'] == number
+    await client.post(prefix + "/setdata", json={'marker': 'x', 'id': player1})
+    responses = []
+    for i, tile_id in enumerate(tiles):
+        response = await client.post(prefix + "/setdata", json={'move': tile_id, 'id': (player1, player2)[i % 2]})
+        assert response.status == 201
+        responses.append(await response.json())
+    return responses
+
+
+@pytest.mark.parametrize('prefix', ["/api/rooms/r", "/api"])
+def test_game(prefix):
+    async def scenario(client):
+        responses = await play(client, prefix, [0, 3, 1, 4, 2])
+        assert all(response['ok'] for response in responses)
+        assert responses[-1]['result'] == {'winner': 1}
+        state = await read(client, prefix + "/getdata/state")
+        assert state['board'] == ['x', 'x', 'x', 'o', 'o', '#', '#', '#', '#']
+        assert await read(client, prefix + "/getdata/board") == state['board']
+        assert await read(client, prefix + "/getdata/stplayer_mark") == 'x'
+        assert await read(client, prefix + "/getdata/ndplayer_mark") == 'o'
+        assert await read(client, prefix + "/getdata/tile_id") == 2
+
+    run(scenario)
+
+
+def test_current_player():
+    async def scenario(client):
+        await client.post("/api/rooms/r/setdata", json={})
+        assert await read(client, "/api/rooms/r/getdata/current_player") is None
+        assert await read(client, "/api/rooms/r/getdata/wait_turn?id=1&timeout=0") is None
+        await play(client, "/api/rooms/r", [])
+        waiting = asyncio.ensure_future(read(client, "/api/rooms/r/getdata/wait_turn?id=2&timeout=5"))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        await client.post("/api/rooms/r/setdata", json={'move': 4, 'id': 1})
+        assert await asyncio.wait_for(waiting, 5) == 2
+
+    run(scenario)
+
+
+def test_state_is_not_sent_again_while_it_does_not_change():
+    async def scenario(client):
+        await play(client, "/api/rooms/r", [4])
+        first = await client.get("/api/rooms/r/getdata/state")
+        etag = first.headers['ETag']
+        again = await client.get("/api/rooms/r/getdata/state", headers={'If-None-Match': etag})
+        assert (again.status, await again.read()) == (304, b"")
+        await client.post("/api/rooms/r/setdata", json={'move': 0, 'id': 2})
+        changed = await client.get("/api/rooms/r/getdata/state", headers={'If-None-Match': etag})
+        assert changed.status == 200
+        assert (await changed.json())['board'][0] == 'o'
+
+    run(scenario)
+
+
+def test_compact_encoding():
+    async def scenario(client):
+        await play(client, "/api/rooms/r", [4])
+        response = await client.get("/api/rooms/r/getdata/state", headers={'Accept': wire.CONTENT_TYPE})
+        assert response.content_type == wire.CONTENT_TYPE
+        snapshot, _ = wire.decode_state_record(await response.read())
+        assert snapshot == await read(client, "/api/rooms/r/getdata/state")
+        response = await client.post("/api/rooms/r/setdata", data=wire.encode_move(0, 2),
+                                     headers={'Content-Type': wire.CONTENT_TYPE, 'Accept': wire.CONTENT_TYPE})
+        assert response.status == 201
+        assert wire.decode_move_response(await response.read())['board'][:5] == ['o', '#', '#', '#', 'x']
+
+    run(scenario)
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (b"{", 'application/json'),
+    (b"[1, 2]", 'application/json'),
+    (b"7", 'application/json'),
+    (json.dumps({'reserve': [1, 2]}).encode(), 'application/json'),
+    (json.dumps({'i_am_here': 1, 'id': 1, 'dimensions': [2, 2, 3]}).encode(), 'application/json'),
+    (json.dumps({'i_am_here': 1, 'id': 1, 'dimensions': [200, 200, 5]}).encode(), 'application/json'),
+    (b"\x01", wire.CONTENT_TYPE),
+])
+def test_bad_body_is_refused(body, content_type):
+    rooms = GameRegistry()
+
+    async def scenario(client):
+        response = await client.post("/api/rooms/r/setdata", data=body, headers={'Content-Type': content_type})
+        assert response.status == 400
+        assert 'error' in await response.json()
+
+    run(scenario, async_server.create_app(rooms))
+    assert rooms.find('r') is None
+
+
+@pytest.mark.parametrize('route', READ_ROUTES)
+def test_unknown_room_is_not_found(route):
+    rooms = GameRegistry()
+
+    async def scenario(client):
+        response = await client.get("/api/rooms/unknown" + route)
+        assert response.status == 404
+        assert await response.json() == {"error": "There is no such game."}
+
+    run(scenario, async_server.create_app(rooms))
+    assert rooms.find('unknown') is None
+
+
+def test_clear_ends_the_streams():
+    async def scenario(client):
+        await play(client, "/api/rooms/r", [4])
+        events = await client.get("/api/rooms/r/events")
+        spectator = await client.get("/api/rooms/r/watch")
+        for stream in (events, spectator):
+            assert b"event: state" in await stream.content.readuntil(b"\n\n")
+        assert (await client.post("/api/rooms/r/clear")).status == 201
+        for stream in (events, spectator):
+            assert (await asyncio.wait_for(stream.content.read(), 5)).endswith(b"event: closed\ndata: null\n\n")
+        assert (await client.get("/api/rooms/r/getdata/state")).status == 404
+
+    run(scenario)
+
+
+def test_spectator_gets_the_moves_to_the_end():
+    async def scenario(client):
+        await play(client, "/api/rooms/r", [0, 3])
+        spectator = await client.get("/api/rooms/r/watch")
+        assert b"event: state" in await spectator.content.readuntil(b"\n\n")
+        for i, tile_id in enumerate([1, 4, 2]):
+            await client.post("/api/rooms/r/setdata", json={'move': tile_id, 'id': 1 + i % 2})
+        body = (await asyncio.wait_for(spectator.content.read(), 5)).decode()
+        assert body.count("event: board") == 3
+        assert "event: game_over" in body
+
+    run(scenario)
+
+
+def test_matchmaking():
+    async def scenario(client):
+        assert (await client.post("/api/match", json={})).status == 400
+        assert (await client.post("/api/match", json={'id': 1, 'skill': 'high'})).status == 400
+        waiting = asyncio.ensure_future(client.get("/api/match?id=1&timeout=5"))
+        assert await (await client.post("/api/match", json={'id': 1})).json() == {'status': 'waiting'}
+        match = await (await client.post("/api/match", json={'id': 2})).json()
+        assert await (await asyncio.wait_for(waiting, 5)).json() == {'status': 'matched',
+                                                                     'room_id': match['room_id'], 'opponent': 2}
+        response = await client.post("/api/rooms/%s/setdata" % match['room_id'], json={'i_am_here': 1, 'id': 3})
+        assert (await response.json())['number'] == -1
+
+    run(scenario)
+
+
+def test_polling_is_limited_and_shed():
+    async def limited(client):
+        await play(client, "/api/rooms/r", [])
+        statuses = [(await client.get("/api/rooms/r/getdata/state", headers={PLAYER_HEADER: '1'})).status
+                    for _ in range(3)]
+        assert statuses == [200, 200, 429]
+        assert (await client.get("/api/rooms/r/getdata/state", headers={PLAYER_HEADER: '2'})).status == 200
+        assert (await client.post("/api/rooms/r/setdata", json={'move': 4, 'id': 1})).status == 201
+
+    async def shed(client):
+        await play(client, "/api/rooms/r", [4])
+        response = await client.get("/api/rooms/r/getdata/state")
+        assert (response.status, response.headers['Retry-After']) == (503, '1')
+
+    run(limited, async_server.create_app(GameRegistry(), limiter=RateLimiter(rate=0.001, burst=2)))
+    run(shed, async_server.create_app(GameRegistry(), admission=AdmissionControl(max_in_flight=0)))
+
+
+def test_workers_share_the_rooms_through_the_store(tmp_path):
+    path = str(tmp_path / "rooms.db")
+    registries = [GameRegistry(), GameRegistry()]
+    for rooms in registries:
+        rooms.attach_store(SQLiteStore(path))
+
+    async def scenario(first):
+        async with TestClient(TestServer(async_server.create_app(registries[1]))) as second:
+            await first.post("/api/rooms/r/setdata", json={'i_am_here': 1, 'id': 1})
+            await second.post("/api/rooms/r/setdata", json={'i_am_here': 1, 'id': 2})
+            await first.post("/api/rooms/r/setdata", json={'marker': 'x', 'id': 1})
+            await second.post("/api/rooms/r/setdata", json={'move': 4, 'id': 1})
+            state = await read(first, "/api/rooms/r/getdata/state")
+            assert state['players'] == {'player1': 1, 'player2': 2}
+            assert state['board'][4] == 'x'
+            assert state == await read(second, "/api/rooms/r/getdata/state")
+            assert (await second.get("/api/rooms/unknown/getdata/state")).status == 404
+
+    try:
+        run(scenario, async_server.create_app(registries[0]))
+    finally:
+        for rooms in registries:
+            rooms.detach_store()
@@ -0,0 +1,145 @@
+import io
+import json
+import logging
+import pytest
+import game_archive
+from game_archive import GameArchive, encode_game, decode_game, FIRST_WINS, SECOND_WINS, DRAW, MAX_PLAYER
+from game_room import GameRoom, MAX_TILES
+
+"""
+    Imports
+    -------
+    io
+    json
+    logging
+    pytest
+    game_archive
+    GameArchive, encode_game, decode_game, FIRST_WINS, SECOND_WINS, DRAW, MAX_PLAYER
+    GameRoom, MAX_TILES
+
+    Tests of the archive: the records decode to the games that were encoded up to
+    the largest boards the servers accept, the index finds them, a record cut by a
+    crash is dropped on reopening, and a game that cannot be archived is skipped
+    without an error.
+"""
+
+
+def finished_room(room_id, player1, player2, dimensions=(3, 3, 3)):
+    """ returns a room in which the first player has won on the first row, the second player plays the second row
+
+    :param room_id: id of the room
+    :param player1: id of the first player
+    :param player2: id of the second player
+    :param dimensions: (rows, cols, win_length) of the board, at least 2 rows and win_length columns
+    :return: GameRoom
+    """
+
+    room = GameRoom(room_id)
+    room.apply({'i_am_here': 1, 'id': player1, 'dimensions': list(dimensions)})
+    room.apply({'i_am_here': 1, 'id': player2})
+    room.apply({'marker': 'x', 'id': player1})
+    _, cols, win_length = dimensions
+    for tile_id in range(win_length):
+        room.apply({'move': tile_id, 'id': player1})
+        if tile_id < win_length - 1:
+            room.apply({'move': cols + tile_id, 'id': player2})
+    return room
+
+
+@pytest.fixture
+def archive(tmp_path):
+    with GameArchive(str(tmp_path / "games.bin")) as archive:
+        yield archive
+
+
+@pytest.mark.parametrize('dimensions', [(3, 3, 3), (100, 100, 5), (1, MAX_TILES, 3), (MAX_TILES, 1, 1)])
+def test_record_round_trip_at_the_limits(dimensions):
+    rows, cols, _ = dimensions
+    moves = list(range(rows * cols - 1, -1, -1))
+    game = decode_game(encode_game((1, MAX_PLAYER), 'o', dimensions, moves, MAX_PLAYER, 1000, 2000))
+    assert game == {'players': [1, MAX_PLAYER], 'markers': ['o', 'x'], 'dimensions': list(dimensions),
+                    'moves': moves, 'result': SECOND_WINS, 'winner': MAX_PLAYER, 'started': 1000, 'finished': 2000}
+
+
+@pytest.mark.parametrize('winner, result', [(7, FIRST_WINS), (8, SECOND_WINS), (None, DRAW)])
+def test_record_results(winner, result):
+    game = decode_game(encode_game((7, 8), 'x', (3, 3, 3), [4, 0, 8], winner, 0, 0))
+    assert (game['result'], game['winner']) == (result, winner)
+
+
+def test_record_without_second_player():
+    assert decode_game(encode_game((7, None), 'x', (3, 3, 3), [], None, 0, 0))['players'] == [7, None]
+
+
+@pytest.mark.parametrize('players', [('alice', 'bob'), (True, 2), (1, MAX_PLAYER + 1), (1, -2 ** 63), (1.5, 2)])
+def test_record_with_unsupported_ids_is_refused(players):
+    with pytest.raises(ValueError):
+        encode_game(players, 'x', (3, 3, 3), [0], None, 0, 0)
+
+
+def test_add_read_and_query(archive):
+    first = archive.add((1, 2), 'x', (3, 3, 3), [0, 3, 1, 4, 2], 1, 100, 110)
+    second = archive.add((2, 3), 'o', (3, 3, 3), [4, 0, 8, 2, 6, 3, 5, 7, 1], None, 200, 210)
+    third = archive.add((3, 1), 'x', (4, 4, 3), [5, 0, 6, 1, 7], 3, 300, 310)
+    assert archive.read(second)['result'] == DRAW
+    assert [game['offset'] for game in archive.query(player=1)] == [first, third]
+    assert [game['offset'] for game in archive.query(result=DRAW)] == [second]
+    assert [game['offset'] for game in archive.query(since=200, until=310)] == [second]
+    assert [game['offset'] for game in archive.query(player=3, limit=1)] == [second]
+    assert [game['offset'] for game in archive.iter_games()] == [first, second, third]
+
+
+def test_query_reads_the_index_page_by_page(archive, monkeypatch):
+    monkeypatch.setattr(game_archive, 'QUERY_PAGE', 3)
+    offsets = [archive.add((1, 2), 'x', (3, 3, 3), [i], None, i, i) for i in range(8)]
+    assert [game['offset'] for game in archive.query(player=2)] == offsets
+    assert [game['offset'] for game in archive.query(player=2, limit=5)] == offsets[:5]
+
+
+def test_export(archive):
+    archive.add((1, 2), 'x', (3, 3, 3), [0, 3, 1, 4, 2], 1, 100, 110)
+    archive.add((2, 3), 'x', (3, 3, 3), [0, 3, 1, 4, 2], 2, 100, 110)
+    file = io.StringIO()
+    assert archive.export(file, player=3) == 1
+    assert json.loads(file.getvalue())['players'] == [2, 3]
+
+
+def test_add_room_is_written_by_the_writer(archive):
+    room = finished_room('r', 5, 6, (100, 100, 5))
+    assert archive.add_room(room)
+    archive.flush()
+    game, = archive.query(player=6)
+    assert game['moves'] == room.moves
+    assert game['dimensions'] == [100, 100, 5]
+    assert game['winner'] == 5
+
+
+def test_add_room_skips_string_ids(archive, caplog):
+    with caplog.at_level(logging.WARNING, logger='game_archive'):
+        assert not archive.add_room(finished_room('r', 'alice', 'bob'))
+    archive.flush()
+    assert list(archive.iter_games()) == []
+    assert "alice" in caplog.text
+
+
+def test_close_writes_the_waiting_games(tmp_path):
+    path = str(tmp_path / "games.bin")
+    archive = GameArchive(path)
+    for i in range(20):
+        archive.add_room(finished_room(str(i), i, i + 100))
+    archive.close()
+    assert not archive.add_room(finished_room('late', 1, 2))
+    with GameArchive(path) as reopened:
+        assert len(list(reopened.query(result=FIRST_WINS))) == 20
+
+
+def test_reopening_indexes_records_and_drops_a_cut_record(tmp_path):
+    path = str(tmp_path / "games.bin")
+    with GameArchive(path) as archive:
+        archive.add((1, 2), 'x', (3, 3, 3), [0, 3, 1, 4, 2], 1, 100, 110)
+    record = encode_game((3, 4), 'x', (3, 3, 3), [0, 3, 1, 4, 2], 3, 200, 210)
+    with open(path, 'ab') as file:
+        file.write(record + record[:5])
+    with GameArchive(path) as archive:
+        assert [game['players'] for game in archive.query(player=4)] == [[3, 4]]
+        assert len(list(archive.iter_games())) == 2
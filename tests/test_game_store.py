@@ -0,0 +1,152 @@
+import threading
+import pytest
+import game_store
+from game_room import GameRoom, GameRegistry
+from game_store import SQLiteStore
+
+"""
+    Imports
+    -------
+    threading
+    pytest
+    game_store
+    GameRoom, GameRegistry
+    SQLiteStore
+
+    Tests of the store shared by the server processes: two registries with their
+    own connections to one database stand for two workers, the changes of both
+    are applied to one room in turn, and a room removed by one of them is gone
+    for the other as well.
+"""
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "rooms.db")
+
+
+@pytest.fixture
+def workers(path):
+    registries = []
+    for _ in range(2):
+        rooms = GameRegistry()
+        rooms.attach_store(SQLiteStore(path))
+        registries.append(rooms)
+    yield registries
+    for rooms in registries:
+        rooms.detach_store()
+
+
+def test_workers_share_the_room(workers):
+    first, second = workers
+    first.apply('r', {'i_am_here': 1, 'id': 1})
+    second.apply('r', {'i_am_here': 1, 'id': 2})
+    first.apply('r', {'marker': 'x', 'id': 1})
+    for i, tile_id in enumerate([0, 3, 1, 4, 2]):
+        workers[i % 2].apply('r', {'move': tile_id, 'id': 1 + i % 2})
+    for rooms in workers:
+        room = rooms.find('r')
+        assert room.players == {'player1': 1, 'player2': 2}
+        assert room.moves == [0, 3, 1, 4, 2]
+        assert room.result == {'winner': 1}
+
+
+def test_concurrent_changes_are_applied_one_after_another(workers):
+    def join(player_id):
+        workers[player_id % 2].apply('r', {'i_am_here': 1, 'id': player_id})
+
+    threads = [threading.Thread(target=join, args=(player_id,)) for player_id in range(1, 11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    states = [rooms.find('r').to_dict() for rooms in workers]
+    assert states[0] == states[1]
+    seated = GameRoom('r')
+    for player_id in states[0]['players'].values():
+        seated.apply({'i_am_here': 1, 'id': player_id})
+    assert None not in seated.players.values()
+    assert states[0]['version'] == seated.version
+
+
+def test_failed_change_is_rolled_back(path):
+    store = SQLiteStore(path)
+    store.update('r', lambda room: room.apply({'i_am_here': 1, 'id': 1}))
+
+    def failing(room):
+        room.apply({'i_am_here': 1, 'id': 2})
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        store.update('r', failing)
+    room = GameRoom('r')
+    assert store.refresh(room)
+    assert room.players == {'player1': 1, 'player2': None}
+    store.close()
+
+
+def test_refresh(path):
+    store = SQLiteStore(path)
+    assert not store.refresh(GameRoom('r'))
+    store.update('r', lambda room: room.apply({'i_am_here': 1, 'id': 1}))
+    room = GameRoom('r')
+    assert store.refresh(room)
+    assert room.players['player1'] == 1
+    store.update('r', lambda room: room.apply({'i_am_here': 1, 'id': 2}))
+    assert store.refresh(room)
+    assert room.players['player2'] == 2
+    store.close()
+
+
+def test_unknown_room_is_not_created(workers):
+    first, second = workers
+    assert first.find('r') is None
+    assert second.find('r') is None
+    first.apply('r', {'i_am_here': 1, 'id': 1})
+    assert second.find('r').players['player1'] == 1
+    assert first.store.stats()['rooms'] == 1
+
+
+def test_removed_room_is_closed_in_the_other_worker(workers):
+    first, second = workers
+    first.apply('r', {'i_am_here': 1, 'id': 1})
+    room = second.find('r')
+    first.remove('r')
+    assert not second.holds(room)
+    assert room.closed
+    assert second.find('r') is None
+
+
+def test_evict_idle_and_finished_rooms(path, monkeypatch):
+    store = SQLiteStore(path)
+    for player_id in (1, 2):
+        store.update('finished', lambda room: room.apply({'i_am_here': 1, 'id': player_id}))
+    store.update('finished', lambda room: room.apply({'marker': 'x', 'id': 1}))
+    for i, tile_id in enumerate([0, 3, 1, 4, 2]):
+        store.update('finished', lambda room: room.apply({'move': tile_id, 'id': 1 + i % 2}))
+    assert store.evict(idle_timeout=1e12, finished_timeout=1e12) == 0
+    assert store.evict(idle_timeout=1e12, finished_timeout=-1) == 1
+    assert not store.refresh(GameRoom('finished'))
+    clock = type('Clock', (), {'now': 1000.0, 'time': lambda self: self.now})()
+    monkeypatch.setattr(game_store, 'time', clock)
+    for room_id in ('idle', 'read'):
+        store.update(room_id, lambda room: room.apply({'i_am_here': 1, 'id': 1}))
+    clock.now = 1100.0
+    store.touch(['read'])
+    assert store.evict(idle_timeout=50, finished_timeout=1e12) == 1
+    assert not store.refresh(GameRoom('idle'))
+    assert store.refresh(GameRoom('read'))
+    store.close()
+
+
+def test_stats(workers):
+    first, second = workers
+    for player_id in (1, 2):
+        first.apply('playing', {'i_am_here': 1, 'id': player_id})
+    second.apply('waiting', {'i_am_here': 1, 'id': 3})
+    for player_id in (4, 5):
+        second.apply('finished', {'i_am_here': 1, 'id': player_id})
+    second.apply('finished', {'marker': 'x', 'id': 4})
+    for i, tile_id in enumerate([0, 3, 1, 4, 2]):
+        first.apply('finished', {'move': tile_id, 'id': 4 + i % 2})
+    assert first.stats() == second.stats() == {'rooms': 3, 'active_games': 1, 'players': 3}
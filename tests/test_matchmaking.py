@@ -0,0 +1,160 @@
+import threading
+import pytest
+import matchmaking
+from game_room import GameRegistry
+from matchmaking import Matchmaker
+from move_log import MoveLog
+
+"""
+    Imports
+    -------
+    threading
+    pytest
+    matchmaking
+    GameRegistry
+    Matchmaker
+    MoveLog
+
+    Tests of the matchmaker: the players of one bucket are paired in the order
+    they joined into a room reserved for the pair, the players of different
+    buckets, those who left and those who stopped asking are never paired, and
+    the reservation outlives a restart of the server.
+"""
+
+
+class Clock:
+    """
+    A class used in place of the time module, its monotonic time moves only when the test moves it
+
+    Attributes
+    ----------
+    now: float
+        monotonic time returned to the matchmaker
+
+    Methods:
+    ----------
+    monotonic()
+        returns the time set by the test
+    """
+
+    def __init__(self):
+        """ sets the clock at 1000 seconds
+        """
+
+        self.now = 1000.0
+
+    def monotonic(self):
+        """ returns the time set by the test
+
+        :return: float
+        """
+
+        return self.now
+
+
+@pytest.fixture
+def matcher():
+    return Matchmaker(GameRegistry())
+
+
+def test_pair_gets_a_reserved_room(matcher):
+    assert matcher.join(1) == {'status': 'waiting'}
+    match = matcher.join(2)
+    assert (match['status'], match['opponent']) == ('matched', 1)
+    assert matcher.status(1) == {'status': 'matched', 'room_id': match['room_id'], 'opponent': 2}
+    assert matcher.join(1) == matcher.status(1)
+    room = matcher.rooms.find(match['room_id'])
+    assert room.reserved == (1, 2)
+    assert room.apply({'i_am_here': 1, 'id': 3})['number'] == -1
+    assert room.apply({'i_am_here': 1, 'id': 2})['number'] == 1
+    assert matcher.stats() == {'waiting': 0, 'buckets': 0, 'matches': 2}
+
+
+def test_players_are_paired_in_the_order_they_joined(matcher):
+    for player_id in (1, 2, 3):
+        matcher.join(player_id, skill=1500)
+    assert matcher.join(2, skill=1500) == {'status': 'matched', 'room_id': matcher.status(1)['room_id'],
+                                           'opponent': 1}
+    assert matcher.join(4, skill=1500)['opponent'] == 3
+
+
+def test_buckets_are_not_mixed(matcher):
+    matcher.join(1, skill=1450)
+    matcher.join(2, skill=1550)
+    matcher.join(3, dimensions=[4, 4, 3])
+    matcher.join(4)
+    assert matcher.stats() == {'waiting': 4, 'buckets': 4, 'matches': 0}
+    assert matcher.join(5, skill=1499)['opponent'] == 1
+    assert matcher.join(6, dimensions=(4, 4, 3))['opponent'] == 3
+
+
+@pytest.mark.parametrize('skill, dimensions', [('high', None), ([1500], None), (float('inf'), None),
+                                               (None, [2, 2, 3]), (None, 'board')])
+def test_bad_bucket_is_refused(matcher, skill, dimensions):
+    with pytest.raises(ValueError):
+        matcher.join(1, skill, dimensions)
+
+
+def test_player_who_left_is_skipped(matcher):
+    matcher.join(1)
+    assert matcher.leave(1)
+    assert not matcher.leave(1)
+    assert matcher.join(2) == {'status': 'waiting'}
+    assert matcher.join(3)['opponent'] == 2
+    assert matcher.status(1) == {'status': 'unknown'}
+
+
+def test_joining_again_keeps_one_place(matcher):
+    matcher.join(1)
+    matcher.join(1)
+    assert matcher.join(2)['opponent'] == 1
+    assert matcher.join(3) == {'status': 'waiting'}
+
+
+def test_waiters_and_matches_expire(matcher, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(matchmaking, 'time', clock)
+    matcher.join(1)
+    clock.now += matcher.wait_timeout + 1
+    assert matcher.join(2) == {'status': 'waiting'}
+    assert matcher.join(3)['opponent'] == 2
+    clock.now += matcher.wait_timeout + 1
+    assert matcher.stats() == {'waiting': 0, 'buckets': 0, 'matches': 0}
+
+
+def test_finished_game_frees_the_player(matcher):
+    matcher.join(1)
+    room_id = matcher.join(2)['room_id']
+    for player_id in (1, 2):
+        matcher.rooms.apply(room_id, {'i_am_here': 1, 'id': player_id})
+    matcher.rooms.apply(room_id, {'marker': 'x', 'id': 1})
+    for i, tile_id in enumerate([0, 3, 1, 4, 2]):
+        matcher.rooms.apply(room_id, {'move': tile_id, 'id': 1 + i % 2})
+    assert matcher.join(1) == {'status': 'waiting'}
+
+
+def test_wait_returns_the_match(matcher):
+    matcher.join(1)
+    assert matcher.wait(1, 0.01) == {'status': 'waiting'}
+    statuses = []
+    waiter = threading.Thread(target=lambda: statuses.append(matcher.wait(1, 5)))
+    waiter.start()
+    match = matcher.join(2)
+    waiter.join()
+    assert statuses == [{'status': 'matched', 'room_id': match['room_id'], 'opponent': 2}]
+
+
+def test_reservation_is_journaled(tmp_path):
+    path = str(tmp_path / "moves.log")
+    rooms = GameRegistry()
+    log = MoveLog(path, flush_interval=0)
+    rooms.attach(log)
+    matcher = Matchmaker(rooms)
+    matcher.join(1)
+    room_id = matcher.join(2)['room_id']
+    log.close()
+    restored = GameRegistry()
+    log = MoveLog(path, flush_interval=0)
+    restored.attach(log)
+    assert restored.find(room_id).reserved == (1, 2)
+    log.close()
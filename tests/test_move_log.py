@@ -0,0 +1,199 @@
+import os
+import json
+import time
+from game_room import GameRoom, GameRegistry
+from move_log import MoveLog
+
+"""
+    Imports
+    -------
+    os
+    json
+    time
+    GameRoom, GameRegistry
+    MoveLog
+
+    Tests of the move log: the rooms restored from the snapshot and the log are
+    the rooms that were journaled, whatever json type the player ids have, after
+    a compaction, a crash in the middle of a write or of a compaction, and the
+    removed rooms stay removed.
+"""
+
+
+def seat(room, player1, player2, marker='x'):
+    """ seats two players in the room and lets the first one choose the marker
+
+    :param room: GameRoom
+    :param player1: id of the first player
+    :param player2: id of the second player
+    :param marker: marker of the first player
+    """
+
+    room.apply({'i_am_here': 1, 'id': player1})
+    room.apply({'i_am_here': 1, 'id': player2})
+    room.apply({'marker': marker, 'id': player1})
+    room.second_player_marker()
+
+
+def journaled(path, **options):
+    """ returns a registry logging its rooms to a new move log, with the rooms restored from the log
+
+    :param path: path of the log
+    :param options: arguments of MoveLog
+    :return: GameRegistry, MoveLog
+    """
+
+    rooms = GameRegistry()
+    log = MoveLog(path, flush_interval=0, **options)
+    rooms.attach(log)
+    return rooms, log
+
+
+def play(room, tiles, player1=1, player2=2):
+    """ seats two players in the room and plays the tiles in turns
+
+    :param room: GameRoom
+    :param tiles: ids of the tiles in the order of the moves
+    :param player1: id of the first player
+    :param player2: id of the second player
+    """
+
+    seat(room, player1, player2)
+    for i, tile_id in enumerate(tiles):
+        room.apply({'move': tile_id, 'id': (player1, player2)[i % 2]})
+
+
+def states(rooms):
+    """ returns the states of the rooms by room id, without the times the replay sets again
+
+    :param rooms: GameRegistry
+    :return: dictionary of states returned by GameRoom.to_dict
+    """
+
+    return {state['room_id']: {key: value for key, value in state.items() if key not in ('started', 'finished')}
+            for state in rooms.dump()}
+
+
+def round_trip(room):
+    """ returns the room restored from its state sent through json
+
+    :param room: GameRoom
+    :return: GameRoom
+    """
+
+    return GameRoom.from_dict(json.loads(json.dumps(room.to_dict())))
+
+
+def test_round_trip_keeps_int_ids():
+    room = GameRoom('r')
+    seat(room, 1, 2, 'o')
+    restored = round_trip(room)
+    assert restored.markers == {1: 'o', 2: 'x'}
+    assert restored.to_dict() == room.to_dict()
+
+
+def test_round_trip_keeps_string_ids():
+    room = GameRoom('r')
+    seat(room, 'alice', 'bob')
+    room.apply({'move': 4, 'id': 'alice'})
+    restored = round_trip(room)
+    assert restored.markers == {'alice': 'x', 'bob': 'o'}
+    assert restored.marker_of('bob') == 'o'
+    assert restored.to_dict() == room.to_dict()
+
+
+def test_recover_room_with_string_ids(tmp_path):
+    path = str(tmp_path / "moves.log")
+    log = MoveLog(path, flush_interval=0)
+    log.recover()
+    room = GameRoom('r')
+    room.journal = log
+    log.start(lambda: [])
+    seat(room, 'alice', 7)
+    room.apply({'move': 0, 'id': 'alice'})
+    log.close()
+    restored, = MoveLog(path).recover()
+    assert restored.markers['alice'] == 'x'
+    assert restored.board == room.board
+    assert restored.version == room.version
+
+
+def test_recover_rooms_of_the_registry(tmp_path):
+    path = str(tmp_path / "moves.log")
+    rooms, log = journaled(path)
+    play(rooms.get('a'), [0, 3, 1])
+    play(rooms.get('b'), [4, 0, 8, 2, 6, 3, 5, 7, 1])
+    expected = states(rooms)
+    log.close()
+    restored, log = journaled(path)
+    assert states(restored) == expected
+    restored.get('a').apply({'move': 4, 'id': 2})
+    log.close()
+    again, log = journaled(path)
+    assert again.find('a').moves == [0, 3, 1, 4]
+    log.close()
+
+
+def test_removed_room_is_not_recovered(tmp_path):
+    path = str(tmp_path / "moves.log")
+    rooms, log = journaled(path)
+    play(rooms.get('a'), [0, 3, 1])
+    rooms.remove('a')
+    play(rooms.get('a'), [8])
+    play(rooms.get('b'), [4])
+    rooms.remove('b')
+    epoch = rooms.find('a').epoch
+    log.close()
+    restored, log = journaled(path)
+    assert restored.find('b') is None
+    assert (restored.find('a').epoch, restored.find('a').moves) == (epoch, [8])
+    log.close()
+
+
+def test_compaction_moves_the_log_into_the_snapshot(tmp_path):
+    path = str(tmp_path / "moves.log")
+    rooms, log = journaled(path, snapshot_every=1)
+    play(rooms.get('a'), [0, 3, 1])
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with open(path + ".snapshot", encoding='utf-8') as file:
+            if any(room['moves'] == [0, 3, 1] for room in json.load(file)):
+                break
+        time.sleep(0.01)
+    else:
+        raise AssertionError("The log is not compacted.")
+    rooms.get('a').apply({'move': 4, 'id': 2})
+    log.close()
+    with open(path, encoding='utf-8') as file:
+        assert len(file.readlines()) < 8
+    assert not os.path.exists(path + ".old")
+    restored, log = journaled(path)
+    assert restored.find('a').moves == [0, 3, 1, 4]
+    log.close()
+
+
+def test_damaged_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "moves.log")
+    rooms, log = journaled(path)
+    play(rooms.get('a'), [0, 3, 1])
+    log.close()
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write('{"room":"a","epoch":"')
+    restored, log = journaled(path)
+    assert restored.find('a').moves == [0, 3, 1]
+    log.close()
+
+
+def test_log_left_by_an_unfinished_compaction_is_recovered(tmp_path):
+    path = str(tmp_path / "moves.log")
+    rooms, log = journaled(path)
+    play(rooms.get('a'), [0, 3, 1])
+    log.close()
+    os.replace(path, path + ".old")
+    rooms, log = journaled(path)
+    rooms.get('a').apply({'move': 4, 'id': 2})
+    log.close()
+    assert not os.path.exists(path + ".old")
+    restored, log = journaled(path)
+    assert restored.find('a').moves == [0, 3, 1, 4]
+    log.close()
@@ -0,0 +1,145 @@
+import pytest
+import rate_limit
+from rate_limit import RateLimiter, AdmissionControl, caller, is_long, is_polling, player_of, retry_after
+
+"""
+    Imports
+    -------
+    pytest
+    rate_limit
+    RateLimiter, AdmissionControl, caller, is_long, is_polling, player_of, retry_after
+
+    Tests of the limits on the polling requests: the token buckets of the callers
+    and of their addresses, with a clock moved by hand, and the shedding of the
+    polling requests while the server is full.
+"""
+
+
+class Clock:
+    """
+    A class used in place of the time module, its monotonic time moves only when the test moves it
+
+    Attributes
+    ----------
+    now: float
+        monotonic time returned to the limiter
+
+    Methods:
+    ----------
+    monotonic()
+        returns the time set by the test
+    """
+
+    def __init__(self):
+        """ sets the clock at 1000 seconds
+        """
+
+        self.now = 1000.0
+
+    def monotonic(self):
+        """ returns the time set by the test
+
+        :return: float
+        """
+
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    return clock
+
+
+def allowed(limiter, key, requests):
+    """ returns how many of the requests sent at once are allowed
+
+    :param limiter: RateLimiter
+    :param key: key of the caller
+    :param requests: number of requests
+    :return: int
+    """
+
+    return sum(limiter.acquire(key) == 0.0 for _ in range(requests))
+
+
+def test_burst_then_rate(clock):
+    limiter = RateLimiter(rate=10, burst=5)
+    key = caller('10.0.0.1', 'r', 1)
+    assert allowed(limiter, key, 8) == 5
+    assert limiter.acquire(key) == pytest.approx(0.1)
+    clock.now += 0.25
+    assert allowed(limiter, key, 8) == 2
+    clock.now += 60
+    assert allowed(limiter, key, 8) == 5
+
+
+def test_callers_have_their_own_buckets(clock):
+    limiter = RateLimiter(rate=10, burst=5)
+    assert allowed(limiter, caller('10.0.0.1', 'r', 1), 8) == 5
+    assert allowed(limiter, caller('10.0.0.1', 'r', 2), 8) == 5
+    assert allowed(limiter, caller('10.0.0.1', 's', 1), 8) == 5
+    assert allowed(limiter, caller('10.0.0.2', 'r', 1), 8) == 5
+
+
+def test_address_shares_a_larger_bucket(clock):
+    limiter = RateLimiter(rate=10, burst=5, address_share=3)
+    keys = [caller('10.0.0.1', str(room_id)) for room_id in range(6)]
+    assert sum(allowed(limiter, key, 5) for key in keys) == 15
+    assert limiter.acquire(caller('10.0.0.2', 'r')) == 0.0
+    assert limiter.acquire(keys[5]) == pytest.approx(1 / 30)
+
+
+def test_least_recently_used_buckets_are_dropped(clock):
+    limiter = RateLimiter(rate=10, burst=2, address_share=1, max_keys=4)
+    first, second = caller('10.0.0.1', 'r'), caller('10.0.0.2', 'r')
+    assert allowed(limiter, first, 3) == 2
+    assert allowed(limiter, second, 3) == 2
+    assert len(limiter._buckets) == 4
+    assert allowed(limiter, caller('10.0.0.3', 'r'), 1) == 1
+    assert len(limiter._buckets) == 4
+    assert allowed(limiter, first, 3) == 2
+
+
+@pytest.mark.parametrize('rate, burst, address_share', [(0, 5, 1), (-1, 5, 1), (10, 0.5, 1), (10, 5, 0.5)])
+def test_bad_limits_are_refused(rate, burst, address_share):
+    with pytest.raises(ValueError):
+        RateLimiter(rate, burst, address_share)
+
+
+def test_admission_sheds_only_polling_requests():
+    control = AdmissionControl(max_in_flight=2)
+    assert control.enter(True) and control.enter(False)
+    assert not control.enter(True)
+    assert control.enter(False)
+    assert (control.in_flight, control.shed) == (3, 1)
+    control.leave()
+    control.leave()
+    assert control.enter(True)
+    assert control.shed == 1
+
+
+@pytest.mark.parametrize('method, route, long, polling', [
+    ('GET', '/api/rooms/<room_id>/getdata/wait_turn', True, False),
+    ('GET', '/api/events', True, False),
+    ('GET', '/api/rooms/<room_id>/watch', True, False),
+    ('GET', '/api/match', True, False),
+    ('GET', '/api/rooms/<room_id>/getdata/state', False, True),
+    ('GET', '/api/getdata/current_player', False, True),
+    ('POST', '/api/rooms/<room_id>/setdata', False, False),
+    ('POST', '/api/match', False, False),
+])
+def test_routes(method, route, long, polling):
+    assert is_long(method, route) == long
+    assert is_polling(method, route) == polling
+
+
+@pytest.mark.parametrize('value, player_id', [('7', 7), ('-3', -3), (None, None), ('alice', None), ('', None)])
+def test_player_of(value, player_id):
+    assert player_of(value) == player_id
+
+
+@pytest.mark.parametrize('seconds, value', [(0.0, '1'), (0.02, '1'), (1.0, '1'), (1.2, '2')])
+def test_retry_after(seconds, value):
+    assert retry_after(seconds) == value
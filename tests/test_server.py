@@ -0,0 +1,228 @@
+import json
+import pytest
+import server
+import wire
+from game_room import GameRegistry
+from matchmaking import Matchmaker
+from metrics import Metrics
+from rate_limit import RateLimiter, AdmissionControl, PLAYER_HEADER
+
+"""
+    Imports
+    -------
+    json
+    pytest
+    server
+    wire
+    GameRegistry
+    Matchmaker
+    Metrics
+    RateLimiter, AdmissionControl, PLAYER_HEADER
+
+    Data
+    ----------
+    READ_ROUTES: list
+        routes of a room that only read it
+
+    Tests of the routes of the Flask server through its test client, every test
+    gets a new registry, matchmaker, limiter and admission control: a whole game
+    in a room and in the default room, the conditional GETs, the bodies refused
+    with 400, the reads of unknown rooms answered 404 without creating them, the
+    clearing of a room, the matchmaking and the limits on the polling routes.
+"""
+
+READ_ROUTES = ["/getdata/tile_id", "/getdata/board", "/getdata/ndplayer_mark", "/getdata/stplayer_mark",
+               "/getdata/current_player", "/getdata/wait_turn?timeout=0", "/getdata/state", "/events", "/watch"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    rooms = GameRegistry()
+    monkeypatch.setattr(server, 'rooms', rooms)
+    monkeypatch.setattr(server, 'matchmaker', Matchmaker(rooms))
+    monkeypatch.setattr(server, 'metrics', Metrics())
+    monkeypatch.setattr(server, 'limiter', RateLimiter())
+    monkeypatch.setattr(server, 'admission', AdmissionControl())
+    return server.app.test_client()
+
+
+def read(client, url):
+    """ returns the decoded body of a read route, the routes of the original protocol send json as text
+
+    :param client: test client
+    :param url: url of the route
+    :return: decoded json
+    """
+
+    response = client.get(url)
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+def play(client, prefix, tiles, player1=1, player2=2):
+    """ seats two players in the room, the first one takes 'x', and plays the tiles in turns
+
+    :param client: test client
+    :param prefix: /api/rooms/<room_id> or /api for the default room
+    :param tiles: ids of the tiles in the order of the moves
+    :param player1: id of the first player
+    :param player2: id of the second player
+    :return: list of the responses to the moves
+    """
+
+    assert client.post(prefix + "/setdata", json={'i_am_here': 1, 'id': player1}).json['number'] == 1
+    assert client.post(prefix + "/setdata", json={'i_am_here': 1, 'id': player2}).json['number'] == 2
+    client.post(prefix + "/setdata", json={'marker': 'x', 'id': player1})
+    return [client.post(prefix + "/setdata", json={'move': tile_id, 'id': (player1, player2)[i % 2]})
+            for i, tile_id in enumerate(tiles)]
+
+
+@pytest.mark.parametrize('prefix', ["/api/rooms/r", "/api"])
+def test_game(client, prefix):
+    responses = play(client, prefix, [0, 3, 1, 4, 2])
+    assert all(response.status_code == 201 and response.json['ok'] for response in responses)
+    assert responses[-1].json['result'] == {'winner': 1}
+    state = client.get(prefix + "/getdata/state").json
+    assert state['board'] == ['x', 'x', 'x', 'o', 'o', '#', '#', '#', '#']
+    assert state['result'] == {'winner': 1}
+    assert read(client, prefix + "/getdata/board") == state['board']
+    assert read(client, prefix + "/getdata/stplayer_mark") == 'x'
+    assert read(client, prefix + "/getdata/ndplayer_mark") == 'o'
+    assert read(client, prefix + "/getdata/tile_id") == 2
+
+
+def test_move_out_of_turn_is_refused(client):
+    play(client, "/api/rooms/r", [])
+    response = client.post("/api/rooms/r/setdata", json={'move': 0, 'id': 2})
+    assert response.status_code == 201
+    assert not response.json['ok']
+    assert read(client, "/api/rooms/r/getdata/board") == ['#'] * 9
+
+
+def test_current_player(client):
+    client.post("/api/rooms/r/setdata", json={})
+    assert read(client, "/api/rooms/r/getdata/current_player") is None
+    assert read(client, "/api/rooms/r/getdata/wait_turn?id=1&timeout=0") is None
+    play(client, "/api/rooms/r", [4])
+    assert read(client, "/api/rooms/r/getdata/current_player") == 2
+    assert read(client, "/api/rooms/r/getdata/wait_turn?id=2&timeout=1") == 2
+
+
+def test_state_is_not_sent_again_while_it_does_not_change(client):
+    play(client, "/api/rooms/r", [4])
+    first = client.get("/api/rooms/r/getdata/state")
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+    again = client.get("/api/rooms/r/getdata/state", headers={'If-None-Match': etag})
+    assert (again.status_code, again.data) == (304, b"")
+    client.post("/api/rooms/r/setdata", json={'move': 0, 'id': 2})
+    changed = client.get("/api/rooms/r/getdata/state", headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.json['board'][0] == 'o'
+
+
+def test_compact_encoding(client):
+    play(client, "/api/rooms/r", [4])
+    response = client.get("/api/rooms/r/getdata/state", headers={'Accept': wire.CONTENT_TYPE})
+    assert response.mimetype == wire.CONTENT_TYPE
+    snapshot, _ = wire.decode_state_record(response.data)
+    assert snapshot == client.get("/api/rooms/r/getdata/state").json
+    response = client.post("/api/rooms/r/setdata", data=wire.encode_move(0, 2),
+                           headers={'Content-Type': wire.CONTENT_TYPE, 'Accept': wire.CONTENT_TYPE})
+    assert response.status_code == 201
+    assert wire.decode_move_response(response.data)['board'][:5] == ['o', '#', '#', '#', 'x']
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (b"{", 'application/json'),
+    (b"[1, 2]", 'application/json'),
+    (b"7", 'application/json'),
+    (json.dumps({'reserve': [1, 2]}).encode(), 'application/json'),
+    (json.dumps({'i_am_here': 1, 'id': 1, 'dimensions': [2, 2, 3]}).encode(), 'application/json'),
+    (json.dumps({'i_am_here': 1, 'id': 1, 'dimensions': [200, 200, 5]}).encode(), 'application/json'),
+    (b"\x01", wire.CONTENT_TYPE),
+])
+def test_bad_body_is_refused(client, body, content_type):
+    response = client.post("/api/rooms/r/setdata", data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert 'error' in response.json
+    assert server.rooms.find('r') is None
+
+
+@pytest.mark.parametrize('route', READ_ROUTES)
+def test_unknown_room_is_not_found(client, route):
+    response = client.get("/api/rooms/unknown" + route)
+    assert response.status_code == 404
+    assert response.json == {"error": "There is no such game."}
+    assert server.rooms.find('unknown') is None
+
+
+def test_clear(client):
+    play(client, "/api/rooms/r", [4])
+    assert client.post("/api/rooms/r/clear").status_code == 201
+    assert client.get("/api/rooms/r/getdata/state").status_code == 404
+    play(client, "/api/rooms/r", [])
+    assert read(client, "/api/rooms/r/getdata/board") == ['#'] * 9
+
+
+def test_finished_game_is_watched_to_the_end(client):
+    play(client, "/api/rooms/r", [0, 3, 1, 4, 2])
+    response = client.get("/api/rooms/r/watch")
+    assert response.mimetype == 'text/event-stream'
+    event, data = response.get_data(as_text=True).split("\n")[1:3]
+    assert event == "event: state"
+    assert json.loads(data[len("data: "):])['result'] == {'winner': 1}
+
+
+def test_cleared_room_ends_its_stream(client):
+    play(client, "/api/rooms/r", [4])
+    response = client.get("/api/rooms/r/events", buffered=False)
+    chunks = iter(response.response)
+    assert b"event: state" in next(chunks)
+    client.post("/api/rooms/r/clear")
+    assert b"event: closed" in b"".join(chunks)
+    response.close()
+
+
+def test_matchmaking(client):
+    assert client.post("/api/match", json={}).status_code == 400
+    assert client.post("/api/match", json={'id': 1, 'skill': 'high'}).status_code == 400
+    assert client.post("/api/match", json={'id': 1}).json == {'status': 'waiting'}
+    match = client.post("/api/match", json={'id': 2})
+    assert match.status_code == 201
+    room_id = match.json['room_id']
+    assert client.get("/api/match?id=1&timeout=0").json == {'status': 'matched', 'room_id': room_id,
+                                                            'opponent': 2}
+    response = client.post("/api/rooms/%s/setdata" % room_id, json={'i_am_here': 1, 'id': 3})
+    assert response.json['number'] == -1
+    client.post("/api/match", json={'id': 3})
+    assert client.delete("/api/match?id=3").status_code == 200
+    assert client.get("/api/match?id=3&timeout=0").json == {'status': 'unknown'}
+
+
+def test_polling_is_limited_per_player(client, monkeypatch):
+    monkeypatch.setattr(server, 'limiter', RateLimiter(rate=0.001, burst=2))
+    play(client, "/api/rooms/r", [])
+    statuses = [client.get("/api/rooms/r/getdata/state", headers={PLAYER_HEADER: '1'}).status_code
+                for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.get("/api/rooms/r/getdata/state", headers={PLAYER_HEADER: '1'})
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.get("/api/rooms/r/getdata/state", headers={PLAYER_HEADER: '2'}).status_code == 200
+    assert client.post("/api/rooms/r/setdata", json={'move': 4, 'id': 1}).status_code == 201
+
+
+def test_polling_is_shed_while_the_server_is_full(client, monkeypatch):
+    monkeypatch.setattr(server, 'admission', AdmissionControl(max_in_flight=0))
+    play(client, "/api/rooms/r", [4])
+    response = client.get("/api/rooms/r/getdata/state")
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert server.admission.shed == 1
+
+
+def test_metrics(client):
+    play(client, "/api/rooms/r", [4])
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "/api/rooms/<room_id>/setdata" in response.get_data(as_text=True)
@@ -0,0 +1,128 @@
+import random
+import pytest
+import wire
+from game_room import GameRoom, MAX_TILES
+
+"""
+    Imports
+    -------
+    random
+    pytest
+    wire
+    GameRoom, MAX_TILES
+
+    Tests of the compact encoding: every state and move that can be encoded is
+    decoded back to what was encoded, up to the largest boards the servers accept,
+    and everything else raises ValueError, so the server can answer with JSON.
+"""
+
+LIMITS = [(3, 3, 3), (1, 2, 1), (4, 4, 3), (100, 100, 5), (1, MAX_TILES, 3), (MAX_TILES, 1, MAX_TILES)]
+
+
+def played_room(dimensions, player1=1, player2=2, moves=4):
+    """ returns a room with two seated players and a few moves played
+
+    :param dimensions: (rows, cols, win_length) of the board
+    :param player1: id of the first player
+    :param player2: id of the second player
+    :param moves: number of moves played, at most the number of tiles
+    :return: GameRoom
+    """
+
+    room = GameRoom('r')
+    room.apply({'i_am_here': 1, 'id': player1, 'dimensions': list(dimensions)})
+    room.apply({'i_am_here': 1, 'id': player2})
+    room.apply({'marker': 'o', 'id': player1})
+    room.second_player_marker()
+    rows, cols, _ = dimensions
+    tiles = iter(range(rows * cols - 1, -1, -1))
+    for i in range(min(moves, rows * cols)):
+        room.apply({'move': next(tiles), 'id': (player1, player2)[i % 2]})
+    return room
+
+
+def test_accepts():
+    assert wire.accepts(wire.CONTENT_TYPE)
+    assert wire.accepts("application/json, " + wire.CONTENT_TYPE + ";q=0.5")
+    assert not wire.accepts(wire.CONTENT_TYPE + ";q=0")
+    assert not wire.accepts("*/*")
+    assert not wire.accepts(None)
+
+
+@pytest.mark.parametrize('tiles', [1, 2, 8, 9, 10, 11, 12, 13, 225, MAX_TILES])
+def test_board_round_trip(tiles):
+    rng = random.Random(tiles)
+    board = [rng.choice(wire.MARKERS) for _ in range(tiles)]
+    data = wire.encode_board(board)
+    assert len(data) == wire.board_size(tiles)
+    assert wire.decode_board(data, tiles) == board
+
+
+def test_board_with_other_marker_is_refused():
+    with pytest.raises(ValueError):
+        wire.encode_board(['x', 'z', '#', '#', '#', '#', '#', '#', '#', '#'])
+
+
+@pytest.mark.parametrize('dimensions', LIMITS)
+def test_state_round_trip_at_the_limits(dimensions):
+    snapshot = played_room(dimensions).snapshot()
+    data = wire.encode_state_record(snapshot)
+    assert wire.decode_state_record(data) == (snapshot, len(data))
+
+
+def test_state_of_empty_room():
+    snapshot = GameRoom('r').snapshot()
+    decoded, _ = wire.decode_state_record(wire.encode_state_record(snapshot))
+    assert decoded == snapshot
+
+
+@pytest.mark.parametrize('moves, result', [(5, {'winner': 1}), (9, {'winner': None})])
+def test_state_of_finished_game(moves, result):
+    room = GameRoom('r')
+    room.apply({'i_am_here': 1, 'id': 1})
+    room.apply({'i_am_here': 1, 'id': 2})
+    room.apply({'marker': 'x', 'id': 1})
+    tiles = [0, 3, 1, 4, 2] if moves == 5 else [0, 1, 2, 4, 3, 5, 7, 6, 8]
+    for i, tile_id in enumerate(tiles):
+        room.apply({'move': tile_id, 'id': 1 + i % 2})
+    snapshot = room.snapshot()
+    assert snapshot['result'] == result
+    assert wire.decode_state_record(wire.encode_state_record(snapshot))[0] == snapshot
+
+
+def test_state_with_string_ids_is_refused():
+    with pytest.raises(ValueError):
+        wire.encode_state_record(played_room((3, 3, 3), 'alice', 'bob').snapshot())
+
+
+def test_cut_off_state_is_refused():
+    data = wire.encode_state_record(played_room((4, 4, 3)).snapshot())
+    with pytest.raises(ValueError):
+        wire.decode_state_record(data[:-1])
+    with pytest.raises(ValueError):
+        wire.decode_state_record(data[:wire.STATE.size - 1])
+
+
+@pytest.mark.parametrize('tile_id, player_id', [(0, 1), (255, -5), (8, 2 ** 63 - 1)])
+def test_move_round_trip(tile_id, player_id):
+    assert wire.decode_move(wire.encode_move(tile_id, player_id)) == {'move': tile_id, 'id': player_id}
+
+
+@pytest.mark.parametrize('tile_id, player_id', [(256, 1), (-1, 1), (0, 'alice'), (0, 2 ** 63)])
+def test_move_that_does_not_fit_is_refused(tile_id, player_id):
+    with pytest.raises(ValueError):
+        wire.encode_move(tile_id, player_id)
+
+
+def test_move_of_wrong_size_is_refused():
+    with pytest.raises(ValueError):
+        wire.decode_move(b'\x01\x02')
+
+
+def test_move_response_round_trip():
+    room = played_room((3, 3, 3), moves=1)
+    response = room.apply({'move': 0, 'id': 2})
+    decoded = wire.decode_move_response(wire.encode_move_response(response, room.snapshot()))
+    assert decoded == {key: response[key] for key in ('ok', 'prompt', 'board', 'current_player', 'result')}
+    with pytest.raises(ValueError):
+        wire.decode_move_response(b'')
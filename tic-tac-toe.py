@@ -1,6 +1,45 @@
-from game_manager import GameManager
+import argparse
+import sys
+from ai import AIEngine
+from bitboard import BOARDS, make_board
+from client import GameClient, SERVER_URL
+from opening_book import OpeningBook
+from game_manager import GameManager, watch_game
+from players import ConsoleOutput
 
 
 if __name__ == "__main__":
-    tictactoe_game = GameManager()
-    tictactoe_game.play_game()
+    parser = argparse.ArgumentParser(description="Tic-tac-toe client")
+    parser.add_argument("--room", default=None, help="id of the server room to join")
+    parser.add_argument("--url", default=SERVER_URL, help="address of the game server")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for the server")
+    parser.add_argument("--retries", type=int, default=3, help="retries of a failed request")
+    parser.add_argument("--board", choices=sorted(BOARDS), default='list', help="representation of the board")
+    parser.add_argument("--rows", type=int, default=3, help="number of rows of the board")
+    parser.add_argument("--cols", type=int, default=3, help="number of columns of the board")
+    parser.add_argument("--win-length", type=int, default=3, help="number of markers in a row needed to win")
+    parser.add_argument("--id", type=int, default=None, help="id of the player, asked for when not given")
+    parser.add_argument("--ai", action="store_true", help="let the computer play instead of the user")
+    parser.add_argument("--ai-depth", type=int, default=None, help="maximum number of plies searched by the computer")
+    parser.add_argument("--ai-time", type=float, default=1.0, help="seconds the computer may think about a move")
+    parser.add_argument("--book", default=None, help="opening book file used by the computer")
+    parser.add_argument("--match", action="store_true", help="let the server pair you with a waiting player")
+    parser.add_argument("--skill", type=float, default=None, help="rating used to pair you with a similar player")
+    parser.add_argument("--watch", action="store_true", help="watch the game in the room without playing")
+    parser.add_argument("--wire", action="store_true", help="exchange the state and the moves in a compact encoding")
+    parser.add_argument("--legacy-protocol", action="store_true",
+                        help="send the whole board after every move instead of the move only")
+    args = parser.parse_args()
+    game_client = GameClient(args.url, room=args.room, timeout=args.timeout, retries=args.retries, wire=args.wire)
+    board = make_board(args.board, args.rows, args.cols, args.win_length)
+    book = OpeningBook(args.book) if args.book else None
+    ai = AIEngine(args.ai_depth, args.ai_time, book=book) if args.ai else None
+    # nobody types while the computer plays or while the game is watched, so the boards can be redrawn in place
+    output = ConsoleOutput(incremental=(args.ai or args.watch) and sys.stdout.isatty())
+    if args.watch:
+        watch_game(game_client, board, output)
+    else:
+        tictactoe_game = GameManager(game_client=game_client, board=board, ai=ai, player_id=args.id,
+                                     move_protocol=not args.legacy_protocol, output=output, match=args.match,
+                                     skill=args.skill)
+        tictactoe_game.play_game()
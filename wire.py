@@ -0,0 +1,254 @@
+import struct
+from itertools import chain, product
+from board import encode_state, decode_state
+
+"""
+    Imports
+    -------
+    struct
+    chain, product
+    encode_state, decode_state
+
+    Data
+    ----------
+    CONTENT_TYPE: str
+        content type of the compact encoding
+    MARKERS: tuple
+        values of a tile, a value is encoded as its index
+    NO_PLAYER: int
+        number written in place of a missing player id
+    BASE3_TILES: int
+        largest board whose tiles are encoded as one base-3 number
+    MOVE: struct.Struct
+        tile id and player id of a move
+    STATE: struct.Struct
+        fixed part of the state of a room, followed by the board
+    PLAYING, WINNER, DRAW: int
+        codes of the result of the game
+    PACK: dict
+        byte of four tiles packed by two bits, by the tuple of their values
+    UNPACK: tuple
+        values of the four tiles packed in every byte
+
+    The compact alternative of the JSON bodies of the busiest requests: the state
+    of the room polled by the players, and the moves and their responses. A board
+    of up to 9 tiles is one base-3 number, so a 3x3 board takes 2 bytes. A larger
+    board takes 2 bits a tile. The sides of the board take 16 bits, so the state of
+    every board the servers accept can be encoded. A move takes 1 byte for the
+    tile and 8 for the id, a move on a tile above 255 is sent as JSON.
+
+    Everything that cannot be encoded raises ValueError, e.g. a marker other than
+    'x' or 'o', and the server answers with JSON instead. A client always decodes
+    a response according to its content type, so it works with servers that
+    answer only JSON.
+"""
+
+CONTENT_TYPE = "application/x-tictactoe"
+MARKERS = ('#', 'x', 'o')
+NO_PLAYER = -2 ** 63
+BASE3_TILES = 9
+MOVE = struct.Struct('<Bq')
+STATE = struct.Struct('<IqqqqHBBHHHB?')
+PLAYING, WINNER, DRAW = 0, 1, 2
+UNPACK = tuple(tuple((MARKERS + ('#',))[(byte >> shift) & 3] for shift in (0, 2, 4, 6)) for byte in range(256))
+PACK = {values: sum(MARKERS.index(value) << shift for value, shift in zip(values, (0, 2, 4, 6)))
+        for values in product(MARKERS, repeat=4)}
+
+
+def accepts(header):
+    """ tells if the Accept header names the compact encoding, a wildcard is not enough
+
+    :param header: value of the Accept header or None
+    :return: True if the response may use the compact encoding
+    """
+
+    for part in (header or "").split(","):
+        media, _, params = part.partition(";")
+        if media.strip().lower() == CONTENT_TYPE:
+            for param in params.split(";"):
+                name, _, value = param.partition("=")
+                if name.strip().lower() == "q":
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+    return False
+
+
+def board_size(tiles):
+    """ returns the number of bytes of an encoded board
+
+    :param tiles: number of tiles of the board
+    :return: number of bytes
+    """
+
+    if tiles <= BASE3_TILES:
+        return ((3 ** tiles - 1).bit_length() + 7) // 8
+    return (tiles + 3) // 4
+
+
+def encode_board(board):
+    """ encodes the board, as a base-3 number up to BASE3_TILES tiles, with 2 bits a tile above
+
+    :param board: list of values of board's tiles
+    :return: bytes
+    """
+
+    try:
+        if len(board) <= BASE3_TILES:
+            return encode_state(board).to_bytes(board_size(len(board)), 'little')
+        padded = list(board) + ['#'] * (-len(board) % 4)
+        return bytes(PACK[tuple(padded[i:i + 4])] for i in range(0, len(padded), 4))
+    except KeyError:
+        raise ValueError("Only the markers 'x' and 'o' can be encoded.")
+
+
+def decode_board(data, tiles):
+    """ decodes the board made by encode_board
+
+    :param data: bytes of the board
+    :param tiles: number of tiles of the board
+    :return: list of values of board's tiles
+    """
+
+    if tiles <= BASE3_TILES:
+        return decode_state(int.from_bytes(data, 'little'), tiles)
+    return list(chain.from_iterable(UNPACK[byte] for byte in data))[:tiles]
+
+
+def encode_move(tile_id, player_id):
+    """ encodes the move of the player
+
+    :param tile_id: id of the tile, at most 255
+    :param player_id: id of the player
+    :return: bytes
+    """
+
+    try:
+        return MOVE.pack(tile_id, player_id)
+    except struct.error as error:
+        raise ValueError(str(error))
+
+
+def decode_move(data):
+    """ decodes the move made by encode_move into the request of the move protocol
+
+    :param data: bytes of the move
+    :return: dictionary with 'move' and 'id'
+    """
+
+    try:
+        tile_id, player_id = MOVE.unpack(data)
+    except struct.error as error:
+        raise ValueError(str(error))
+    return {'move': tile_id, 'id': player_id}
+
+
+def _player(player_id):
+    """ returns the number written for the player id
+
+    :param player_id: id of the player or None
+    :return: int
+    """
+
+    return NO_PLAYER if player_id is None else player_id
+
+
+def encode_state_record(snapshot):
+    """ encodes the snapshot of the room made by GameRoom.snapshot
+
+    :param snapshot: dictionary with the players, the markers, the board, the turn, the dimensions and the result
+    :return: bytes
+    """
+
+    players = snapshot['players']
+    player1, player2 = players['player1'], players['player2']
+    markers = snapshot['markers']
+    rows, cols, win_length = snapshot['dimensions']
+    board = snapshot['board']
+    if board and len(board) != rows * cols:
+        raise ValueError("The board does not match the dimensions.")
+    result = snapshot['result']
+    if result is None:
+        code, winner = PLAYING, None
+    else:
+        code, winner = (DRAW, None) if result['winner'] is None else (WINNER, result['winner'])
+    try:
+        header = STATE.pack(snapshot['version'], _player(player1), _player(player2),
+                            _player(snapshot['current_player']), _player(winner), snapshot['current_tile'],
+                            MARKERS.index(markers.get(str(player1), '#')), MARKERS.index(markers.get(str(player2), '#')),
+                            rows, cols, win_length, code, bool(board))
+    except struct.error as error:
+        raise ValueError(str(error))
+    return header + (encode_board(board) if board else b'')
+
+
+def decode_state_record(data, offset=0):
+    """ decodes the snapshot made by encode_state_record
+
+    :param data: bytes
+    :param offset: position of the snapshot in data
+    :return: tuple (snapshot, position after the snapshot)
+    """
+
+    try:
+        (version, player1, player2, current_player, winner, current_tile, marker1, marker2, rows, cols, win_length,
+         code, has_board) = STATE.unpack_from(data, offset)
+    except struct.error as error:
+        raise ValueError(str(error))
+    offset += STATE.size
+    players = {'player1': None if player1 == NO_PLAYER else player1,
+               'player2': None if player2 == NO_PLAYER else player2}
+    markers = {}
+    for player_id, marker in ((players['player1'], marker1), (players['player2'], marker2)):
+        if player_id is not None and marker:
+            markers[str(player_id)] = MARKERS[marker]
+    board = []
+    if has_board:
+        size = board_size(rows * cols)
+        if len(data) < offset + size:
+            raise ValueError("The board is cut off.")
+        board = decode_board(data[offset:offset + size], rows * cols)
+        offset += size
+    result = None
+    if code == WINNER:
+        result = {'winner': winner}
+    elif code == DRAW:
+        result = {'winner': None}
+    snapshot = {
+        'players': players,
+        'markers': markers,
+        'board': board,
+        'current_player': None if current_player == NO_PLAYER else current_player,
+        'current_tile': current_tile,
+        'dimensions': [rows, cols, win_length],
+        'result': result,
+        'version': version,
+    }
+    return snapshot, offset
+
+
+def encode_move_response(response, snapshot):
+    """ encodes the response to a move: a byte telling if the move was played, the snapshot and the prompt
+
+    :param response: response of GameRoom.move
+    :param snapshot: snapshot of the room after the move
+    :return: bytes
+    """
+
+    return bytes((bool(response['ok']),)) + encode_state_record(snapshot) + response['prompt'].encode()
+
+
+def decode_move_response(data):
+    """ decodes the response made by encode_move_response
+
+    :param data: bytes
+    :return: dictionary with 'ok', 'prompt', 'board', 'current_player' and 'result'
+    """
+
+    if not data:
+        raise ValueError("The response is empty.")
+    snapshot, offset = decode_state_record(data, 1)
+    return {'ok': bool(data[0]), 'prompt': data[offset:].decode(), 'board': snapshot['board'],
+            'current_player': snapshot['current_player'], 'result': snapshot['result']}